@@ -1,7 +1,9 @@
 from tagger import *
-import sys, os, fnmatch, pickle
+import sys, os, fnmatch, pickle, optparse
 
-def get_apic(filename):
+def get_apic(filename, output=None):
+    """ write the first picture of a file to output, named after the
+    file with the extension of the picture type if output is None """
     id3 = ID3v2(filename)
     if not id3.tag_exists():
         return "No ID3 Tag Found"
@@ -16,7 +18,24 @@ def get_apic(filename):
         return "No APIC frame found"
         
     print "APIC: encoding: %s type: %d" % (apicframe.encoding, apicframe.picttype)
-    open('test.png', 'w').write(apicframe.pict)
+    if output is None:
+        extension = ARTSTORE_EXTENSIONS.get(apicframe.mimetype.lower(), 'bin')
+        output = os.path.splitext(filename)[0] + '.' + extension
+    open(output, 'wb').write(apicframe.pict)
+    return output
+
+def extract_apic(directory, paths):
+    """ copy the pictures of every file below paths into an ArtStore,
+    each distinct picture once """
+    store = ArtStore(directory)
+    try:
+        errors = store.add_tree(paths)
+        print "%d pictures found, %d new images written (%d bytes)" % \
+              (store.found, store.written, store.bytes_written)
+    finally:
+        store.close()
+    for filename, message in errors:
+        print filename, ':', message
     
 def set_apic(filename):
     id3 = ID3v2(filename)
@@ -37,6 +56,55 @@ def set_apic(filename):
     id3.frames = [frame for frame in id3.frames if frame.fid != apicfid]
     id3.frames.append(apic)
     id3.commit()
+
+def embed_apic(image, paths, jobs=1, pretend=False, picttype=3):
+    """ put one picture into every file below paths, encoding its frame
+    once, and print whether each tag had room for it """
+    embedder = PictureEmbedder(open(image, 'rb').read(), picttype=picttype)
+    counts = {}
+    for result in embed_picture(walk_files(paths), embedder, jobs, pretend):
+        if result.error:
+            print result.path, ':', result.error
+        else:
+            print result.path, ':', result.plan
+        counts[result.plan] = counts.get(result.plan, 0) + 1
+    print "%d in place, %d rewritten, %d failed" % \
+          (counts.get(EMBED_IN_PLACE, 0), counts.get(EMBED_REWRITE, 0),
+           counts.get(None, 0))
     
 if __name__ == "__main__":
-    print set_apic(sys.argv[1])
\ No newline at end of file
+    parser = optparse.OptionParser(usage="%prog [options] files...")
+    parser.add_option("-x", "--extract", metavar="DIR",
+                      help="copy the pictures of all files below the given "
+                      "paths into the art store DIR, each distinct one once")
+    parser.add_option("-g", "--get", action="store_true", default=False,
+                      help="write the picture of a file to --output")
+    parser.add_option("-o", "--output", metavar="FILE",
+                      help="where --get writes the picture")
+    parser.add_option("-e", "--embed", metavar="IMAGE",
+                      help="put IMAGE into every file below the given paths, "
+                      "replacing pictures of the same type")
+    parser.add_option("-t", "--type", type="int", default=3,
+                      help="picture type for --embed [%default: front cover]")
+    parser.add_option("-n", "--pretend", action="store_true", default=False,
+                      help="with --embed, only print which files have room "
+                      "for the picture and which need their tag rewritten")
+    parser.add_option("-j", "--jobs", type="int", default=1, metavar="N",
+                      help="with --embed, change files in N processes "
+                      "(0 for one per cpu)")
+    options, args = parser.parse_args()
+    if not args:
+        parser.error("expected files")
+
+    if options.extract:
+        extract_apic(options.extract, args)
+    elif options.embed:
+        try:
+            embed_apic(options.embed, args, options.jobs or None,
+                       options.pretend, options.type)
+        except ID3ParameterException, e:
+            parser.error(str(e))
+    elif options.get:
+        print get_apic(args[0], options.output)
+    else:
+        print set_apic(args[0])
@@ -2,18 +2,31 @@
 
 from tagger import *
 
-import sys, os, fnmatch, pickle
+import sys, os, pickle, optparse
 
 def print_debug(filename, msg):
     print os.path.basename(filename), ':',  msg
 
-def do_id3(filename, verbose=1):
+def do_id3(filename, verbose=1, cache=None):
+    if cache:
+        # parse the cached copy of the tags in memory
+        try:
+            snapshot = cache.get(filename)
+        except ID3Exception, e:
+            print_debug(filename, "ID3 exception: %s" % str(e))
+            return
+        id3v2 = lambda filename: snapshot.id3v2()
+        id3v1 = lambda filename: snapshot.id3v1()
+    else:
+        id3v2 = lambda filename: ID3v2(filename, detach=True)
+        id3v1 = lambda filename: ID3v1(filename, detach=True)
+
     try:
-        id3 = ID3v2(filename)
+        id3 = id3v2(filename)
         if not id3.tag_exists():
             print_debug(filename, "Unable to find ID3v2 tag")
         else:
-            print_debug(filename, "Found ID3v2 tag ver: %.1f frames: %d" % \
+            print_debug(filename, "Found ID3v2 tag ver: %s frames: %d" % \
                 (id3.version, len(id3.frames)))
 
             if verbose:
@@ -25,14 +38,15 @@ def do_id3(filename, verbose=1):
                         print_debug(filename, "%s - unprintable" % frame.fid)
     
             # commit changes to mp3 file (pretend mode)
-            id3.commit(pretend=1)
+            if not cache:
+                id3.commit(pretend=1)
         
     except ID3Exception, e:
         print_debug(filename, "ID3v2 exception: %s" % str(e))
         raise
 
     try:
-        id3 = ID3v1(filename)
+        id3 = id3v1(filename)
         if not id3.tag_exists():
             print_debug(filename, "Unable to find ID3v1 tag")
         else:
@@ -43,20 +57,75 @@ def do_id3(filename, verbose=1):
     except ID3Exception, e:
         print_debug(filename, "ID3v1 exception: %s" % str(e))
 
-def do_recurse(filename):
-    if os.path.isdir(filename):
-        #print "traversing dir:", filename
-        for f in fnmatch.filter(os.listdir(filename), '*.mp3'):
-            do_recurse(os.path.join(filename, f))
-        for f in os.listdir(filename):
-            if os.path.isdir(os.path.join(filename, f)):
-                do_recurse(os.path.join(filename, f))
+def do_record(record, verbose=1):
+    """ print a ScanRecord from a parallel scan like do_id3 """
+    filename = record.path
+    if record.error:
+        print_debug(filename, "ID3 exception: %s" % record.error)
+        return
+    if not record.version:
+        print_debug(filename, "Unable to find ID3v2 tag")
     else:
-        #print "checking file:", filename
-        do_id3(filename)
+        print_debug(filename, "Found ID3v2 tag ver: %s frames: %d" % \
+            (record.version, len(record.fids)))
+        if verbose:
+            for fid, strings in record.text:
+                print_debug(filename, "%s %s" % (fid, str(list(strings))))
+    if not record.id3v1:
+        print_debug(filename, "Unable to find ID3v1 tag")
+    else:
+        print_debug(filename, "ID3v1 tag found")
+        if verbose:
+            print_debug(filename, "song: %s" % str(record.id3v1[0]))
+            print_debug(filename, "artist: %s" % str(record.id3v1[1]))
+
+def do_recurse(filename, cache=None, sort_inodes=False, sampler=None):
+    filenames = walk_files([filename], sort_inodes=sort_inodes)
+    if sampler:
+        filenames = sampler.sample(filenames)
+    for f in filenames:
+        #print "checking file:", f
+        do_id3(f, cache=cache)
 
+parser = optparse.OptionParser(usage="%prog [options] file-or-directory")
+parser.add_option("-c", "--cache", metavar="FILE",
+                  help="keep parsed tags in this database between runs")
+parser.add_option("-j", "--jobs", type="int", default=1, metavar="N",
+                  help="parse files in N processes (0 for one per cpu)")
+parser.add_option("-i", "--inode-order", action="store_true", default=False,
+                  help="read files in inode order, faster on spinning disks")
+parser.add_option("-s", "--sample", type="float", metavar="RATE",
+                  help="only check this fraction of the files, picked at random")
+parser.add_option("--sample-size", type="int", metavar="N",
+                  help="only check N files, picked at random")
+parser.add_option("--seed", type="int",
+                  help="seed for picking the sample, to check the same files")
+options, args = parser.parse_args()
+if len(args) != 1:
+    parser.error("expected one file or directory")
+if options.cache and options.jobs != 1:
+    parser.error("--cache can not be used with --jobs")
+
+sampler = None
+if options.sample is not None or options.sample_size is not None:
+    try:
+        sampler = Sampler(options.sample, options.sample_size, options.seed)
+    except ValueError, e:
+        parser.error(str(e))
+
+cache = None
+if options.cache:
+    cache = MetadataCache(options.cache)
 try:
-    do_recurse(sys.argv[1])
+    if options.jobs != 1:
+        for record in scan(args, jobs=options.jobs or None,
+                           sort_inodes=options.inode_order, sampler=sampler):
+            do_record(record)
+    else:
+        do_recurse(args[0], cache, options.inode_order, sampler)
+    if sampler:
+        print "checked %d of %d files" % (sampler.taken, sampler.seen)
 finally:
-    pass
+    if cache:
+        cache.close()
     #pickle.dump(headers_id3v2, open("headers_id3v2.pkl", "w"))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+from tagger import *
+
+import sys, time, optparse
+
+parser = optparse.OptionParser(usage="%prog [options] files-or-directories",
+    description="Print groups of files with the same audio, whatever their "
+    "tags, one path per line and a blank line between groups.")
+parser.add_option("-d", "--database", metavar="FILE",
+                  help="remember sizes and digests in FILE, so later runs "
+                  "only read new and changed files")
+parser.add_option("-p", "--prune", action="store_true", default=False,
+                  help="drop files not found this time from the database")
+parser.add_option("-i", "--inode-order", action="store_true", default=False,
+                  help="read files in inode order, faster on spinning disks")
+parser.add_option("-v", "--verbose", action="store_true", default=False,
+                  help="print how many files and bytes were read")
+options, args = parser.parse_args()
+if not args:
+    parser.error("expected files or directories")
+
+finder = DupeFinder(options.database or ':memory:')
+try:
+    start = time.time()
+    groups = finder.find(args, sort_inodes=options.inode_order)
+    for group in groups:
+        for path in group:
+            print path
+        print
+    if options.prune:
+        finder.prune()
+    if options.verbose:
+        print >> sys.stderr, "%d files, %d sampled, %d hashed, " \
+              "%d bytes read, %d groups in %.1fs" % \
+              (finder.files, finder.sampled, finder.hashed,
+               finder.bytes_read, len(groups), time.time() - start)
+finally:
+    finder.close()
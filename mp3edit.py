@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+from tagger import *
+
+import sys, time, locale, optparse
+
+parser = optparse.OptionParser(
+    usage="%prog [options] -e EDIT [-e EDIT ...] files-or-directories",
+    description="Apply the same tag edits to every file, in the order they "
+    "are given. EDIT is one of set:FRAME=value, delete:FRAME, "
+    "copy-id3v1[:charset], transcode:charset[:encoding] or upgrade:version, "
+    "with frames named as in ID3v2.3 or 2.4 (TIT2, TPE1, ...).")
+parser.add_option("-e", "--edit", action="append", default=[],
+                  help="an edit to make, may be given many times")
+parser.add_option("-n", "--pretend", action="store_true", default=False,
+                  help="only list which files would be written in place "
+                  "and which would need their tag rewritten")
+parser.add_option("-j", "--jobs", type="int", default=1, metavar="N",
+                  help="edit files in N processes (0 for one per cpu)")
+parser.add_option("-V", "--id3-version", default=ID3V2_DEFAULT_VERSION,
+                  metavar="VERSION",
+                  help="version of tags made for untagged files [%default]")
+parser.add_option("-v", "--verbose", action="store_true", default=False,
+                  help="list unchanged files too")
+options, args = parser.parse_args()
+if not args:
+    parser.error("expected files or directories")
+if not options.edit:
+    parser.error("expected at least one --edit")
+
+charset = locale.getpreferredencoding() or 'utf_8'
+try:
+    plan = EditPlan([parse_edit(edit.decode(charset))
+                     for edit in options.edit], options.id3_version)
+except ID3ParameterException, e:
+    parser.error(str(e))
+
+counts = {}
+start = time.time()
+for result in run_edits(walk_files(args), plan, options.jobs or None,
+                        options.pretend):
+    counts[result.action] = counts.get(result.action, 0) + 1
+    if result.error:
+        print "error: %s: %s" % (result.path, result.error)
+    elif result.action != BATCH_UNCHANGED or options.verbose:
+        print "%s: %s" % (result.action, result.path)
+    for warning in result.warnings:
+        print "warning: %s: %s" % (result.path, warning)
+
+print >> sys.stderr, "%d in place, %d rewritten, %d unchanged, %d failed " \
+      "in %.1fs" % (counts.get(BATCH_IN_PLACE, 0),
+                    counts.get(BATCH_REWRITE, 0),
+                    counts.get(BATCH_UNCHANGED, 0), counts.get(None, 0),
+                    time.time() - start)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+from tagger import *
+
+import sys, optparse
+
+parser = optparse.OptionParser(usage="%prog [options] files-or-directories")
+parser.add_option("-o", "--output", metavar="FILE",
+                  help="write the tag columns to FILE in binary column format")
+parser.add_option("--csv", metavar="FILE",
+                  help="write the tag columns to FILE as CSV, - for stdout")
+parser.add_option("-f", "--fields", default=','.join(EXPORT_FIELDS),
+                  metavar="FIDS",
+                  help="comma separated text frames to export [%default]")
+parser.add_option("-j", "--jobs", type="int", default=1, metavar="N",
+                  help="read files in N processes (0 for one per cpu)")
+parser.add_option("-i", "--inode-order", action="store_true", default=False,
+                  help="read files in inode order, faster on spinning disks")
+options, args = parser.parse_args()
+if not args:
+    parser.error("expected files or directories")
+if not options.output and not options.csv:
+    parser.error("expected --output or --csv")
+
+fields = [fid.strip() for fid in options.fields.split(',') if fid.strip()]
+table = export_tags(args, fields, options.jobs or None,
+                    sort_inodes=options.inode_order)
+
+if options.output:
+    f = open(options.output, 'wb')
+    try:
+        table.write(f)
+    finally:
+        f.close()
+if options.csv == '-':
+    table.write_csv(sys.stdout)
+elif options.csv:
+    f = open(options.csv, 'wb')
+    try:
+        table.write_csv(f)
+    finally:
+        f.close()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+from tagger import *
+
+import sys, time, optparse
+
+parser = optparse.OptionParser(usage="%prog [options] words...",
+    description="Find files by artist, album, title, composer or comment. "
+    "Words can be limited to a field with field:word and end in * to match "
+    "the start of words.")
+parser.add_option("-d", "--database", default="tagindex.db", metavar="FILE",
+                  help="index database [%default]")
+parser.add_option("-u", "--update", action="append", default=[],
+                  metavar="DIR", help="index the files below DIR first, "
+                  "reading only files that changed (may be repeated)")
+parser.add_option("-p", "--prune", action="store_true", default=False,
+                  help="with --update, drop files no longer found")
+parser.add_option("-c", "--cache", metavar="FILE",
+                  help="read tags through this metadata cache database")
+parser.add_option("-n", "--limit", type="int", metavar="N",
+                  help="print at most N paths")
+parser.add_option("-v", "--verbose", action="store_true", default=False,
+                  help="print how long updating and searching took")
+options, args = parser.parse_args()
+if not args and not options.update:
+    parser.error("expected words to search for or --update")
+
+cache = None
+if options.cache:
+    cache = MetadataCache(options.cache)
+index = TagIndex(options.database, cache=cache)
+try:
+    if options.update:
+        start = time.time()
+        count = index.update_tree(options.update, prune=options.prune)
+        if options.verbose:
+            print >> sys.stderr, "indexed %d files in %.2fs" % \
+                  (count, time.time() - start)
+    if args:
+        start = time.time()
+        try:
+            paths = index.search(' '.join(args), options.limit)
+        except ID3ParameterException, e:
+            parser.error(str(e))
+        for path in paths:
+            print path.encode(sys.getfilesystemencoding() or 'utf_8')
+        if options.verbose:
+            print >> sys.stderr, "%d matches in %.1fms" % \
+                  (len(paths), (time.time() - start) * 1000)
+finally:
+    index.close()
+    if cache:
+        cache.close()
@@ -1,8 +1,8 @@
 #!C:\Python23\python.exe
 
-from pyid3v2 import *
+from tagger import *
 
-import sys, string, os, pickle, fnmatch
+import sys, string, os, pickle, optparse
 
 def strip_newline(data):
 	# find new line and strip everything before it
@@ -14,53 +14,65 @@ def strip_newline(data):
 	return data
 	
 
-versions = {0x0200:[], 0x0300:[], 0x0400:[], "unknown":[]}
-frames = {}
-errors = []
+stats = TagStats()
 
-def do_id3(filename):
+def do_id3(filename, cache):
 	try:
-		id3 = ID3v2(filename, ID3V2_FILE_READ)
-		if versions.has_key(id3.tag["version"]):
-			versions[id3.tag["version"]].append(filename)
-		else:
-			versions["unknown"].append(filename)
-			
-		for f in id3.frames:
-			if frames.has_key(f.fid):
-				frames[f.fid].append(filename)
-			else:
-				frames[f.fid] = [filename]
-			
-	except ID3Exception:
-		print "Unable to find ID3v2 Tag"
-		errors.append((filename,"unable to find id3v2 tag"))	
+		snapshot = cache.get(filename)
+		stats.add(snapshot.id3v2_data, bool(snapshot.id3v1_data), filename)
+	except (ID3Exception, IOError, OSError), e:
+		stats.add_error(filename, str(e))
 
-def do_recurse(filename):
-	if os.path.isdir(filename):
-		print "traversing dir:", filename
-		for f in fnmatch.filter(os.listdir(filename), '*.mp3'):
-			do_recurse(os.path.join(filename, f))
-	else:
-		print "checking file:", filename
-		do_id3(filename)
+def do_recurse(paths, cache, sort_inodes=False, sampler=None):
+	# one walk over every path, so a sample is drawn once from all of them
+	filenames = walk_files(paths, sort_inodes=sort_inodes)
+	if sampler:
+		filenames = sampler.sample(filenames)
+	for f in filenames:
+		do_id3(f, cache)
 
-for filename in sys.argv[1:]:
-	do_recurse(filename)
-	
+parser = optparse.OptionParser(usage="%prog [options] files-or-directories")
+parser.add_option("-c", "--cache", metavar="FILE",
+				  help="keep parsed tags in this database between runs")
+parser.add_option("-i", "--inode-order", action="store_true", default=False,
+				  help="read files in inode order, faster on spinning disks")
+parser.add_option("-j", "--jobs", type="int", default=1, metavar="N",
+				  help="read files in N processes (0 for one per cpu)")
+parser.add_option("--json", action="store_true", default=False,
+				  help="print the statistics as JSON")
+parser.add_option("-s", "--sample", type="float", metavar="RATE",
+				  help="read this fraction of the files, picked at random, "
+				  "and estimate the statistics of all of them")
+parser.add_option("--sample-size", type="int", metavar="N",
+				  help="read N files picked at random and estimate the "
+				  "statistics of all of them")
+parser.add_option("--seed", type="int",
+				  help="seed for picking the sample, to read the same files")
+options, args = parser.parse_args()
+if options.cache and options.jobs != 1:
+	parser.error("--cache can not be used with --jobs")
+
+sampler = None
+if options.sample is not None or options.sample_size is not None:
+	try:
+		sampler = Sampler(options.sample, options.sample_size, options.seed)
+	except ValueError, e:
+		parser.error(str(e))
 
-# dump stats:
-#pickle.dump(versions,open("stats.versions",'wb'))
-#pickle.dump(frames,open("stats.frames",'wb'))
-#pickle.dump(errors,open("stats.errors",'wb'))
+if options.cache:
+	cache = MetadataCache(options.cache)
+	try:
+		do_recurse(args, cache, options.inode_order, sampler)
+	finally:
+		cache.close()
+else:
+	stats = collect_stats(args, options.jobs or None,
+						  sort_inodes=options.inode_order, sampler=sampler)
 
-print "Version Distributions:"
-for k,v in versions.items():
-	print k, len(v)
-print "Frames Used:"
-for k,v in frames.items():
-	print k, len(v)
-print "Errors:"
-for e in errors:
-	print e[0], ":", e[1]
-		
+population = sampler and sampler.seen
+if options.json:
+	print stats.format_json(population)
+else:
+	print stats.format_text()
+	if sampler:
+		print stats.format_estimates(population)
@@ -3,22 +3,82 @@
 from tagger import *
 from optparse import OptionParser
 
-import sys, os, string
+import sys, time
 
 CONV_FIELDS_2_3 = ['TIT2','TPE1','TALB']
 CONV_FIELDS_2_2 = ['TT2', 'TP1', 'TAL']
 
+# files between progress lines with --verbose
+CONV_PROGRESS_EVERY = 10000
+
 def usage():
-    print "usage: mp3tagconv.py -f <from encoding> -t <to encoding> [-v tagver] <file(s)/directory>"
+    return "usage: %prog -f <from encoding> [-t <to encoding>] " \
+           "<file(s)/directory>"
+
+def throughput(count, seconds):
+    if seconds <= 0:
+        return 0.0
+    return count / seconds
 
 def main(args):
-    global CONV_FIELDS_2_3, CONV_FIELDS_2_2
-    
-    parser = OptionParser()
+    parser = OptionParser(usage=usage(),
+        description="Re-encode title, artist and album frames stored as "
+        "latin-1 but really written in another charset, such as GBK or "
+        "Big5. Only those frames are read, and only files whose tags "
+        "change are written.")
+    parser.add_option("-f", "--from", dest="source",
+                      help="charset the frames are really in (gbk, big5, ...)")
+    parser.add_option("-t", "--to", dest="target", default="utf_16",
+                      help="encoding to store the frames in: utf_16, or "
+                      "utf_8 for ID3v2.4 tags [%default]")
+    parser.add_option("-j", "--jobs", type="int", default=1, metavar="N",
+                      help="convert files in N processes (0 for one per cpu)")
+    parser.add_option("-n", "--pretend", action="store_true", default=False,
+                      help="only list the files that would be converted")
+    parser.add_option("-i", "--inode-order", action="store_true",
+                      default=False,
+                      help="read files in inode order, faster on spinning "
+                      "disks")
+    parser.add_option("-v", "--verbose", action="store_true", default=False,
+                      help="print progress every %d files" %
+                      CONV_PROGRESS_EVERY)
+    options, paths = parser.parse_args(args)
+    if not paths:
+        parser.error("expected files or directories")
+    if not options.source:
+        parser.error("expected --from")
 
-    
-    
-if __name__ == "__main__":
-    main(sys.args)
+    try:
+        plan = EditPlan([Transcode(options.source, options.target,
+                                   CONV_FIELDS_2_3 + CONV_FIELDS_2_2)])
+    except ID3ParameterException, e:
+        parser.error(str(e))
 
+    counts = {}
+    files = 0
+    start = time.time()
+    filenames = walk_files(paths, sort_inodes=options.inode_order)
+    for result in run_edits(filenames, plan, options.jobs or None,
+                            options.pretend):
+        files += 1
+        counts[result.action] = counts.get(result.action, 0) + 1
+        if result.error:
+            print >> sys.stderr, "%s: %s" % (result.path, result.error)
+        elif result.action != BATCH_UNCHANGED:
+            print "%s: %s" % (result.action, result.path)
+        for warning in result.warnings:
+            print >> sys.stderr, "%s: %s" % (result.path, warning)
+        if options.verbose and files % CONV_PROGRESS_EVERY == 0:
+            print >> sys.stderr, "%d files, %.0f files/s" % \
+                  (files, throughput(files, time.time() - start))
 
+    elapsed = time.time() - start
+    converted = counts.get(BATCH_IN_PLACE, 0) + counts.get(BATCH_REWRITE, 0)
+    print >> sys.stderr, "%d files in %.1fs, %.0f files/s: %d converted " \
+          "(%d in place, %d rewritten), %d unchanged, %d failed" % \
+          (files, elapsed, throughput(files, elapsed), converted,
+           counts.get(BATCH_IN_PLACE, 0), counts.get(BATCH_REWRITE, 0),
+           counts.get(BATCH_UNCHANGED, 0), counts.get(None, 0))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -15,6 +15,12 @@ setup(
 	license = "BSD",
 	py_modules = ["tagger", "tagger.id3v1", "tagger.id3v2", "tagger.exceptions",
 				  "tagger.constants", "tagger.utility", "tagger.id3v2frame",
-				  "tagger.encoding", "tagger.debug"],
-    scripts = ["mp3check.py", "apic.py"]
+				  "tagger.encoding", "tagger.debug", "tagger.fileio",
+				  "tagger.playcount", "tagger.tags", "tagger.cache",
+				  "tagger.metacache", "tagger.walk", "tagger.scanner",
+				  "tagger.stream", "tagger.stats", "tagger.export",
+				  "tagger.index", "tagger.dupes", "tagger.artstore",
+				  "tagger.embed", "tagger.batch"],
+    scripts = ["mp3check.py", "mp3export.py", "mp3search.py",
+			   "mp3dupes.py", "mp3edit.py", "apic.py"]
 )
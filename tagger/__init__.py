@@ -43,6 +43,21 @@ from exceptions import *
 from utility import *
 from id3v2 import *
 from id3v1 import *
+from fileio import *
+from playcount import *
+from tags import *
+from cache import *
+from metacache import *
+from walk import *
+from scanner import *
+from stream import *
+from stats import *
+from export import *
+from index import *
+from dupes import *
+from artstore import *
+from embed import *
+from batch import *
 
 
 
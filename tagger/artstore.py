@@ -0,0 +1,337 @@
+""" Content Addressed Cover Art Store """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.encoding import *
+from tagger.utility import *
+from tagger.fileio import *
+from tagger.id3v2 import iter_frames, ID3V2_ENCODED_FRAME_FLAGS
+from tagger.metacache import METACACHE_RACY_SECONDS
+from tagger.walk import walk_files, WALK_PATTERN
+from tagger.debug import *
+
+import os, time, tempfile
+from collections import namedtuple
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# bytes read from the start of a picture frame to find the picture data
+ARTSTORE_HEADER_READ = 4096
+
+# file name extensions of stored images by mime type
+ARTSTORE_EXTENSIONS = {'image/jpeg': 'jpg', 'image/jpg': 'jpg',
+                       'image/png': 'png', 'image/gif': 'gif',
+                       'image/bmp': 'bmp'}
+
+# files recorded per transaction
+ARTSTORE_BATCH_SIZE = 1000
+
+# bump when the tables change
+ARTSTORE_SCHEMA_VERSION = 1
+
+_ARTSTORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dev INTEGER, ino INTEGER, mtime_ns INTEGER, size INTEGER
+);
+CREATE TABLE IF NOT EXISTS pictures (
+    path TEXT, number INTEGER, digest TEXT,
+    mimetype TEXT, picttype INTEGER, description TEXT,
+    PRIMARY KEY (path, number)
+);
+CREATE INDEX IF NOT EXISTS pictures_digest ON pictures (digest);
+CREATE TABLE IF NOT EXISTS images (
+    digest TEXT PRIMARY KEY, mimetype TEXT, size INTEGER
+);
+"""
+
+class Picture(namedtuple('Picture', 'fid offset size mimetype picttype '
+                                    'desc')):
+    """
+    Where the picture of an APIC or PIC frame is, see iter_pictures().
+
+    @ivar fid: frame id
+    @ivar offset: file offset of the picture data
+    @ivar size: bytes of picture data
+    @ivar mimetype: mime type of the picture ('image/jpeg')
+    @ivar picttype: picture type, see ID3V2_3_APIC_PICT_TYPES
+    @ivar desc: description, as unicode
+    """
+    __slots__ = ()
+
+def picture_header(data, version):
+    """
+    Parse the fields in front of the picture in an APIC or PIC payload.
+
+    @param data: the start of the payload, long enough to hold the
+                 mime type and description
+    @type data: string
+    @param version: ID3v2 version of the tag
+    @return: (mimetype, picttype, desc, length of the fields in bytes)
+    @raise ID3FrameException: if the fields do not fit in data
+    """
+    if len(data) < 2:
+        raise ID3FrameException("picture frame too short")
+    encoding = encodings.get(ord(data[0]))
+    if not encoding:
+        raise ID3FrameException("unknown picture encoding")
+    if version == '2.2':
+        imgtype = data[1:4]
+        mimetype = ID3V2_2_FRAME_IMAGE_FORMAT_TO_MIME_TYPE.get(
+            imgtype, 'image/' + imgtype.lower())
+        pos = 4
+    else:
+        pos = data.find('\x00', 1)
+        if pos < 0:
+            raise ID3FrameException("picture mime type not terminated")
+        mimetype = data[1:pos]
+        pos += 1
+    if pos >= len(data):
+        raise ID3FrameException("picture frame too short")
+    picttype = ord(data[pos])
+    start = pos = pos + 1
+
+    if is_double_byte(encoding):
+        while True:
+            pos = data.find('\x00\x00', pos)
+            if pos < 0 or (pos - start) % 2 == 0:
+                break
+            pos += 1
+        term = 2
+    else:
+        pos = data.find('\x00', pos)
+        term = 1
+    if pos < 0:
+        raise ID3FrameException("picture description not terminated")
+    desc = data[start:pos].decode(encoding, 'replace')
+    return mimetype, picttype, desc, pos + term
+
+def iter_pictures(f):
+    """
+    Yield a Picture for every APIC or PIC frame of a file, reading only
+    the frame headers and the fields in front of each picture. Frames
+    that are compressed, encrypted, unsynchronised or grouped, and tags
+    that are unsynchronised, are left out as their bytes are not the
+    picture.
+
+    @param f: file open for reading
+    """
+    header = pread(f.fileno(), ID3V2_FILE_HEADER_LENGTH, 0)
+    if len(header) != ID3V2_FILE_HEADER_LENGTH or header[:3] != 'ID3':
+        return
+    version = '2.%d' % ord(header[3])
+    if ord(header[5]) & 0x80 or \
+           version not in ID3V2_ENCODED_FRAME_FLAGS:
+        return
+    encoded = ID3V2_ENCODED_FRAME_FLAGS[version]
+    for fid, offset, size, flags in iter_frames(f):
+        if fid not in ('APIC', 'PIC') or flags & encoded:
+            continue
+        data = pread(f.fileno(), min(size, ARTSTORE_HEADER_READ), offset)
+        try:
+            mimetype, picttype, desc, length = picture_header(data, version)
+        except ID3FrameException:
+            continue
+        yield Picture(fid, offset + length, size - length, mimetype,
+                      picttype, desc)
+
+def _hash_range(fd, offset, length):
+    digest = sha1()
+    while length > 0:
+        data = pread(fd, min(length, FILEIO_BUFFER_SIZE), offset)
+        if not data:
+            raise IOError("file shrank while hashing")
+        digest.update(data)
+        offset += len(data)
+        length -= len(data)
+    return digest.hexdigest()
+
+class ArtStore:
+    """
+    Directory of cover art pictures stored once each under the SHA-1 of
+    their bytes, with a record of which pictures every file holds.
+
+    Pictures are hashed straight from their place in the mp3 file and
+    only copied into the store, with copy_file_range where possible, if
+    no identical picture is stored yet. The tracks of an album sharing
+    one cover cost a single image. Files are recorded with their stat
+    identity, so adding a library again only reads changed files.
+
+    store = ArtStore('/var/cache/covers')
+    for filename in walk_files(['/music']):
+        store.add_file(filename)
+    print store.pictures('/music/some.mp3')
+    store.close()
+
+    The record is the SQLite database art.db in the directory.
+
+    @ivar found: pictures found by add_file()
+    @ivar written: pictures copied into the store
+    @ivar bytes_written: bytes copied into the store
+    """
+
+    def __init__(self, directory, batch_size=ARTSTORE_BATCH_SIZE):
+        """
+        @param directory: where to keep the images, created if missing
+        @type directory: string
+        @param batch_size: files to record per transaction
+        @type batch_size: int
+        """
+        if sqlite3 is None:
+            raise ID3NotImplementedException("sqlite3 module not available")
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.found = self.written = self.bytes_written = 0
+        self._pending = 0
+        self.db = sqlite3.connect(os.path.join(directory, 'art.db'))
+        self.db.text_factory = str
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != ARTSTORE_SCHEMA_VERSION:
+            for table in ('files', 'pictures', 'images'):
+                self.db.execute("DROP TABLE IF EXISTS %s" % table)
+            self.db.execute("PRAGMA user_version = %d" %
+                            ARTSTORE_SCHEMA_VERSION)
+        self.db.executescript(_ARTSTORE_SCHEMA)
+        self.db.commit()
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """ Commit and close the record """
+        if getattr(self, 'db', None):
+            self.db.commit()
+            self.db.close()
+        self.db = None
+
+    def image_path(self, digest, mimetype):
+        """ Where the image with this digest is stored """
+        extension = ARTSTORE_EXTENSIONS.get(mimetype.lower(), 'bin')
+        return os.path.join(self.directory, digest[:2],
+                            '%s.%s' % (digest, extension))
+
+    def add_file(self, filename):
+        """
+        Store the pictures of a file and record them, unless the file is
+        unchanged since it was last added.
+
+        @param filename: mp3 file
+        @type filename: string
+        @return: digests of the pictures of the file, in tag order
+        @rtype: list of strings
+        @raise ID3Exception: if the tag is not supported
+        """
+        path = os.path.abspath(filename)
+        f = open(path, 'rb')
+        try:
+            key = stat_key(os.fstat(f.fileno()))
+            row = self.db.execute("SELECT dev, ino, mtime_ns, size FROM files "
+                                  "WHERE path = ?", (path,)).fetchone()
+            if row and tuple(row) == key:
+                return [digest for (digest,) in self.db.execute(
+                    "SELECT digest FROM pictures WHERE path = ? "
+                    "ORDER BY number", (path,))]
+
+            pictures = []
+            for picture in iter_pictures(f):
+                digest = _hash_range(f.fileno(), picture.offset, picture.size)
+                self._store(f, picture, digest)
+                pictures.append((path, len(pictures), digest,
+                                 picture.mimetype, picture.picttype,
+                                 picture.desc.encode('utf_8')))
+                self.found += 1
+        finally:
+            f.close()
+
+        if time.time() - key[2] / 1000000000.0 < METACACHE_RACY_SECONDS:
+            # could change again without its stat changing, check next time
+            key = key[:2] + (0,) + key[3:]
+        self.db.execute("DELETE FROM pictures WHERE path = ?", (path,))
+        self.db.executemany("INSERT INTO pictures VALUES (?, ?, ?, ?, ?, ?)",
+                            pictures)
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                        (path,) + key)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.db.commit()
+            self._pending = 0
+        return [picture[2] for picture in pictures]
+
+    def _store(self, f, picture, digest):
+        """ Copy a picture into the store unless it is there already """
+        target = self.image_path(digest, picture.mimetype)
+        if self.db.execute("SELECT 1 FROM images WHERE digest = ?",
+                           (digest,)).fetchone() and os.path.exists(target):
+            return
+        if not os.path.isdir(os.path.dirname(target)):
+            os.makedirs(os.path.dirname(target))
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(target))
+        try:
+            out = os.fdopen(fd, 'wb')
+            try:
+                copied = copy_range(f, out, picture.offset, 0, picture.size)
+            finally:
+                out.close()
+            if copied != picture.size:
+                raise IOError("file shrank while copying picture")
+            os.rename(temp, target)
+        except:
+            os.remove(temp)
+            raise
+        self.db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?)",
+                        (digest, picture.mimetype, picture.size))
+        self.written += 1
+        self.bytes_written += picture.size
+
+    def pictures(self, filename):
+        """
+        Pictures recorded for a file.
+
+        @return: (digest, mimetype, picttype, desc, image path) for each
+                 picture, in tag order
+        """
+        path = os.path.abspath(filename)
+        return [(digest, mimetype, picttype, desc.decode('utf_8'),
+                 self.image_path(digest, mimetype))
+                for digest, mimetype, picttype, desc in self.db.execute(
+                    "SELECT digest, mimetype, picttype, description "
+                    "FROM pictures WHERE path = ? ORDER BY number", (path,))]
+
+    def add_tree(self, paths, pattern=WALK_PATTERN, sort_inodes=False):
+        """
+        Add every file below the given files and directories. Files that
+        can not be read are skipped.
+
+        @return: list of (path, message) of the files skipped
+        """
+        errors = []
+        for filename in walk_files(paths, pattern, sort_inodes):
+            try:
+                self.add_file(filename)
+            except (ID3Exception, EnvironmentError), e:
+                errors.append((filename, str(e)))
+        self.db.commit()
+        return errors
@@ -0,0 +1,625 @@
+""" Declarative Batch Tag Editing """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.encoding import *
+from tagger.id3v2frame import *
+from tagger.fileio import *
+from tagger.id3v2 import iter_frames, ID3V2_ENCODED_FRAME_FLAGS
+from tagger.tags import Tags
+from tagger.embed import EncodedFrame
+from tagger.scanner import _chunks
+from tagger.debug import *
+
+import codecs, struct
+from collections import namedtuple
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# files handed to a worker at a time
+BATCH_CHUNK_SIZE = 64
+
+# what an EditPlan does to a file, see EditPlan.edit()
+BATCH_UNCHANGED = 'unchanged'
+BATCH_IN_PLACE = 'in place'
+BATCH_REWRITE = 'rewrite'
+
+# version 2.2 names of version 2.3 frames
+BATCH_FRAMES_2_2 = {
+    'AENC': 'CRA', 'APIC': 'PIC', 'COMM': 'COM', 'EQUA': 'EQU',
+    'ETCO': 'ETC', 'GEOB': 'GEO', 'IPLS': 'IPL', 'LINK': 'LNK',
+    'MCDI': 'MCI', 'MLLT': 'MLL', 'PCNT': 'CNT', 'POPM': 'POP',
+    'RBUF': 'BUF', 'RVAD': 'RVA', 'RVRB': 'REV', 'SYLT': 'SLT',
+    'SYTC': 'STC', 'TALB': 'TAL', 'TBPM': 'TBP', 'TCOM': 'TCM',
+    'TCON': 'TCO', 'TCOP': 'TCR', 'TDAT': 'TDA', 'TDLY': 'TDY',
+    'TENC': 'TEN', 'TEXT': 'TXT', 'TIME': 'TIM', 'TIT1': 'TT1',
+    'TIT2': 'TT2', 'TIT3': 'TT3', 'TKEY': 'TKE', 'TLAN': 'TLA',
+    'TLEN': 'TLE', 'TMED': 'TMT', 'TOAL': 'TOT', 'TOFN': 'TOF',
+    'TOLY': 'TOL', 'TOPE': 'TOA', 'TORY': 'TOR', 'TPE1': 'TP1',
+    'TPE2': 'TP2', 'TPE3': 'TP3', 'TPE4': 'TP4', 'TPOS': 'TPA',
+    'TPUB': 'TPB', 'TRCK': 'TRK', 'TRDA': 'TRD', 'TSIZ': 'TSI',
+    'TSRC': 'TRC', 'TSSE': 'TSS', 'TXXX': 'TXX', 'TYER': 'TYE',
+    'UFID': 'UFI', 'USLT': 'ULT', 'WCOM': 'WCM', 'WCOP': 'WCP',
+    'WOAF': 'WAF', 'WOAR': 'WAR', 'WOAS': 'WAS', 'WPUB': 'WPM',
+    'WXXX': 'WXX'}
+
+# version 2.4 names of version 2.3 only frames that have one
+BATCH_FRAMES_2_4 = {'TYER': 'TDRC', 'TORY': 'TDOR', 'IPLS': 'TIPL'}
+
+# ID3v1 fields copied by CopyFromID3v1 and the frames they go into
+BATCH_ID3V1_FIELDS = (('TIT2', 'songname'), ('TPE1', 'artist'),
+                      ('TALB', 'album'), ('TRCK', 'track'),
+                      ('TYER', 'year'))
+
+_FRAME_CLASSES = {'2.2': ID3v2_2_Frame, '2.3': ID3v2_3_Frame,
+                  '2.4': ID3v2_4_Frame}
+
+# version 2.3 names of version 2.2 frames and of version 2.4 frames
+_FRAMES_2_3 = dict([(v, k) for k, v in BATCH_FRAMES_2_2.items()])
+_FRAMES_2_3_OF_2_4 = dict([(v, k) for k, v in BATCH_FRAMES_2_4.items()])
+
+def frame_name(fid, version):
+    """
+    Name of a frame in a tag of the given version, None if the version
+    has no such frame.
+
+    @param fid: frame id of any version
+    @type fid: string
+    """
+    fid = _FRAMES_2_3.get(fid, fid)
+    if version == '2.4':
+        fid = BATCH_FRAMES_2_4.get(fid, fid)
+    else:
+        fid = _FRAMES_2_3_OF_2_4.get(fid, fid)
+    if version == '2.2':
+        return BATCH_FRAMES_2_2.get(fid)
+    if fid not in ID3V2_3_ABOVE_SUPPORTED_IDS:
+        return None
+    return fid
+
+def _frame_names(fid):
+    """
+    Name of a frame in each version, checking the frame exists. Version
+    2.2 names are accepted as well.
+    """
+    fid = _FRAMES_2_3.get(fid, fid)
+    if fid not in ID3V2_3_ABOVE_SUPPORTED_IDS:
+        raise ID3ParameterException("unknown frame: %s" % fid)
+    return dict([(version, frame_name(fid, version))
+                 for version in _FRAME_CLASSES.keys()])
+
+def _is_text(frame):
+    return frame.supported.get(frame.fid, ('',))[0] == 'text'
+
+def _text_encoding(encoding, version):
+    """ encoding, or UTF-16 where the version does not support it """
+    if version != '2.4' and encoding not in ('latin_1', 'utf_16'):
+        return 'utf_16'
+    return encoding
+
+def _check_codec(name):
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        raise ID3ParameterException("unknown encoding: %s" % name)
+
+def _check_encoding(encoding):
+    if encoding not in ID3V2_VALID_ENCODINGS:
+        raise ID3ParameterException("frames can not be stored in %s, use "
+                                    "one of %s" % (encoding,
+                                    ', '.join(ID3V2_VALID_ENCODINGS)))
+    return encoding
+
+def _is_ascii(s):
+    try:
+        s.decode('ascii')
+    except UnicodeError:
+        return False
+    return True
+
+class SetFrame:
+    """
+    Set a text frame to a value, replacing every frame of that id. The
+    frame is encoded once for each tag version and the bytes are reused.
+    """
+
+    def __init__(self, fid, text, encoding='utf_16'):
+        """
+        @param fid: version 2.3 or 2.4 frame id
+        @type fid: string
+        @param text: the new value
+        @type text: unicode
+        @param encoding: encoding of the frame, UTF-8 and UTF-16BE are
+                         stored as UTF-16 in version 2.2 and 2.3 tags
+        @type encoding: string
+        """
+        self.names = _frame_names(fid)
+        if ID3V2_3_ABOVE_SUPPORTED_IDS[_FRAMES_2_3.get(fid, fid)][0] != 'text':
+            raise ID3ParameterException("%s is not a text frame" % fid)
+        self.fid = fid
+        self.text = text
+        self.encoding = _check_encoding(encoding)
+        if isinstance(text, str):
+            text = text.decode('latin_1')
+        if _is_ascii(text.encode('utf_8')):
+            self.encoding = 'latin_1'
+        self._frames = {}
+        for version, name in self.names.items():
+            if name:
+                frame = _FRAME_CLASSES[version](fid=name)
+                frame.set_text(text, _text_encoding(self.encoding, version))
+                self._frames[version] = (name, frame.header_length,
+                                         frame.output())
+
+    def apply(self, id3v2, id3v1, warnings):
+        if id3v2.version not in self._frames:
+            warnings.append("%s not in version %s tags" %
+                            (self.fid, id3v2.version))
+            return False
+        name, header_length, data = self._frames[id3v2.version]
+        old = [frame for frame in id3v2.frames if frame.fid == name]
+        if len(old) == 1 and old[0].output() == data:
+            return False
+        position = len(id3v2.frames)
+        if old:
+            position = id3v2.frames.index(old[0])
+        frames = [frame for frame in id3v2.frames if frame.fid != name]
+        frames.insert(position, EncodedFrame(name, header_length, data))
+        id3v2.frames = frames
+        return True
+
+    def wanted(self, f, version, warnings):
+        if version not in self._frames:
+            return True # a tag is made, or apply() warns
+        name, header_length, data = self._frames[version]
+        found = [(offset, size) for fid, offset, size, flags
+                 in iter_frames(f) if fid == name]
+        if len(found) != 1:
+            return True
+        offset, size = found[0]
+        return pread(f.fileno(), header_length + size,
+                     offset - header_length) != data
+
+class DeleteFrame:
+    """ Remove every frame of an id """
+
+    def __init__(self, fid):
+        """
+        @param fid: version 2.3 or 2.4 frame id
+        @type fid: string
+        """
+        self.fid = fid
+        self.names = _frame_names(fid)
+
+    def apply(self, id3v2, id3v1, warnings):
+        name = self.names.get(id3v2.version)
+        frames = [frame for frame in id3v2.frames if frame.fid != name]
+        if len(frames) == len(id3v2.frames):
+            return False
+        id3v2.frames = frames
+        return True
+
+    def wanted(self, f, version, warnings):
+        name = self.names.get(version)
+        for fid, offset, size, flags in iter_frames(f):
+            if fid == name:
+                return True
+        return False
+
+class CopyFromID3v1:
+    """
+    Fill the title, artist, album, track and year frames from the ID3v1
+    tag where they are missing or empty. Fields that do not decode from
+    the source charset are left out with a warning.
+    """
+
+    def __init__(self, source='latin_1', encoding='utf_16', overwrite=False):
+        """
+        @param source: charset the ID3v1 fields are really in
+        @type source: string
+        @param encoding: encoding of the frames made for fields that are
+                         not plain ASCII
+        @type encoding: string
+        @param overwrite: replace frames that have a value as well
+        @type overwrite: boolean
+        """
+        self.source = _check_codec(source)
+        self.encoding = _check_encoding(encoding)
+        self.overwrite = overwrite
+        self.names = [(_frame_names(fid), field)
+                      for fid, field in BATCH_ID3V1_FIELDS]
+
+    def apply(self, id3v2, id3v1, warnings):
+        if not id3v1.tag_exists():
+            return False
+        changed = False
+        for names, field in self.names:
+            name = names[id3v2.version]
+            value = getattr(id3v1, field)
+            if field == 'track':
+                value = value and str(value) or ''
+            if not value:
+                continue
+            old = [frame for frame in id3v2.frames if frame.fid == name]
+            if old and isinstance(old[0], EncodedFrame):
+                continue # set by an earlier edit
+            if old and not self.overwrite and \
+                   [s for s in old[0].strings if s.strip('\x00')]:
+                continue
+            try:
+                text = value.decode(self.source)
+            except UnicodeError:
+                warnings.append("ID3v1 %s is not %s" % (field, self.source))
+                continue
+            encoding = 'latin_1'
+            if not _is_ascii(value):
+                encoding = _text_encoding(self.encoding, id3v2.version)
+            if old:
+                frame = old[0]
+                if frame.encoding == encoding and frame.strings == [text]:
+                    continue
+            else:
+                frame = id3v2.new_frame(fid=name)
+                id3v2.frames.append(frame)
+            frame.set_text(text, encoding)
+            changed = True
+        return changed
+
+class Transcode:
+    """
+    Re-encode latin-1 text frames whose bytes are really in another
+    charset, such as GBK or Big5 text written by a player that knew no
+    better. Frames that are plain ASCII are left alone, frames that do
+    not decode from the charset are left alone with a warning.
+    """
+
+    def __init__(self, source, encoding='utf_16', fids=None):
+        """
+        @param source: charset the latin-1 frames are really in
+        @type source: string
+        @param encoding: encoding to store the frames in
+        @type encoding: string
+        @param fids: version 2.3 or 2.4 ids of the frames to convert,
+                     all text frames if None
+        @type fids: list of strings
+        """
+        self.source = _check_codec(source)
+        self.encoding = _check_encoding(encoding)
+        self.names = None
+        if fids is not None:
+            self.names = {}
+            for fid in fids:
+                for version, name in _frame_names(fid).items():
+                    self.names.setdefault(version, set()).add(name)
+
+    def apply(self, id3v2, id3v1, warnings):
+        names = None
+        if self.names is not None:
+            names = self.names.get(id3v2.version, ())
+        changed = False
+        for frame in id3v2.frames:
+            if names is not None and frame.fid not in names:
+                continue
+            if getattr(frame, 'encoding', None) != 'latin_1' or \
+                   not _is_text(frame):
+                continue
+            if not [s for s in frame.strings if not _is_ascii(s)]:
+                continue
+            try:
+                strings = [s.decode(self.source) for s in frame.strings]
+            except UnicodeError:
+                warnings.append("%s is not %s" % (frame.fid, self.source))
+                continue
+            frame.strings = strings
+            frame.encoding = _text_encoding(self.encoding, id3v2.version)
+            changed = True
+        return changed
+
+    def wanted(self, f, version, warnings):
+        names = None
+        if self.names is not None:
+            names = self.names.get(version, ())
+        for fid, offset, size, flags in iter_frames(f):
+            if names is not None and fid not in names:
+                continue
+            if names is None and (fid[0] != 'T' or fid in ('TXXX', 'TXX')):
+                continue
+            if flags & ID3V2_ENCODED_FRAME_FLAGS[version]:
+                return True # let the parser make sense of it
+            data = pread(f.fileno(), size, offset)
+            if data[:1] != chr(ID3V2_FIELD_ENC_LATIN_1) or _is_ascii(data):
+                continue
+            try:
+                data[1:].decode(self.source)
+                return True
+            except UnicodeError:
+                warnings.append("%s is not %s" % (fid, self.source))
+        return False
+
+class Upgrade:
+    """
+    Move a tag up to a newer ID3v2 version, renaming its frames. Frames
+    the new version has no place for are dropped with a warning. Tags of
+    the version or newer are left alone.
+    """
+
+    def __init__(self, version=ID3V2_DEFAULT_VERSION):
+        """
+        @param version: the version to move to
+        @type version: string
+        """
+        if version not in _FRAME_CLASSES:
+            raise ID3ParameterException("version %s not supported" % version)
+        self.version = version
+
+    def apply(self, id3v2, id3v1, warnings):
+        if id3v2.version >= self.version:
+            return False
+        frames = []
+        for frame in id3v2.frames:
+            new = self._convert(frame, id3v2.version)
+            if new is None:
+                warnings.append("dropped %s, no version %s frame" %
+                                (frame.fid, self.version))
+            else:
+                frames.append(new)
+        id3v2.frames = frames
+        id3v2.version = self.version
+        if 'compression' in id3v2.tag:
+            del id3v2.tag['compression']
+        for flag in ('ext', 'exp', 'footer'):
+            id3v2.tag.setdefault(flag, 0)
+        return True
+
+    def _convert(self, frame, version):
+        """ frame as a frame of the new version, None if there is none """
+        fid = frame.fid
+        if version == '2.2':
+            fid = _FRAMES_2_3.get(fid)
+        if fid is not None:
+            fid = frame_name(fid, self.version)
+        if fid is None:
+            return None
+        cls = _FRAME_CLASSES[self.version]
+        if version == '2.2' and fid == 'APIC':
+            # the picture format became a mime type
+            new = cls(fid=fid)
+            for name in ('encoding', 'mimetype', 'picttype', 'desc', 'pict'):
+                setattr(new, name, getattr(frame, name))
+            return new
+        # the other frames kept their layout, reparse the payload
+        payload = frame.output()[frame.header_length:]
+        try:
+            return cls(frame=fid + struct.pack('!IBB', len(payload), 0, 0) +
+                       payload)
+        except (ID3Exception, UnicodeError, IndexError):
+            return None
+
+# edit names used in specs
+BATCH_EDITS = {'set': SetFrame, 'delete': DeleteFrame,
+               'copy-id3v1': CopyFromID3v1, 'transcode': Transcode,
+               'upgrade': Upgrade}
+
+def parse_edit(text):
+    """
+    Edit spec entry from its command line form:
+
+    set:TIT2=Title, delete:COMM, copy-id3v1[:charset],
+    transcode:charset[:encoding], upgrade:version
+
+    @param text: the edit
+    @type text: unicode
+    @rtype: tuple
+    """
+    name, sep, rest = text.partition(':')
+    name = str(name)
+    if name == 'set':
+        fid, sep, value = rest.partition('=')
+        if not sep:
+            raise ID3ParameterException("expected set:FRAME=value")
+        return (name, str(fid), value)
+    if name not in BATCH_EDITS:
+        raise ID3ParameterException("unknown edit: %s" % name)
+    return (name,) + tuple([str(arg) for arg in rest.split(':') if arg])
+
+class EditResult(namedtuple('EditResult', 'path action error warnings')):
+    """
+    Outcome of editing one file.
+
+    @ivar path: the file
+    @ivar action: BATCH_UNCHANGED, BATCH_IN_PLACE if the tag had room for
+                  the edits, BATCH_REWRITE if it was made or grown, moving
+                  the mp3 data, None if the file could not be edited
+    @ivar error: why the file could not be edited, None if it could
+    @ivar warnings: edits that were left out for this file
+    @type warnings: list of strings
+    """
+    __slots__ = ()
+
+class EditPlan:
+    """
+    A list of tag edits checked and prepared once, then applied to any
+    number of files.
+
+    The spec lists the edits in the order they apply, each a tuple of
+    its name in BATCH_EDITS and the arguments of its class, or an edit
+    object. Building the plan resolves frame names for every tag version
+    and encodes the frames that set() writes, so applying it to a file
+    is only a matter of walking the parsed frames.
+
+    Edits with a wanted(f, version, warnings) method can tell from the
+    frame headers and the few frames they touch whether a file needs
+    them. When every edit of a plan can, files that none of them want
+    are passed over without parsing their tags.
+
+    plan = EditPlan([('upgrade', '2.4'), ('transcode', 'gbk'),
+                     ('copy-id3v1', 'gbk'), ('delete', 'PRIV'),
+                     ('set', 'TALB', u'Album')])
+    for result in run_edits(walk_files(['/music']), plan, pretend=True):
+        print result.action, result.path
+
+    @ivar edits: the edit objects, in order
+    """
+
+    def __init__(self, spec, version=ID3V2_DEFAULT_VERSION):
+        """
+        @param spec: the edits
+        @type spec: list of tuples or edit objects
+        @param version: ID3v2 version of tags made for untagged files
+        @type version: string
+        @raise ID3ParameterException: if an edit is not valid
+        """
+        self.edits = []
+        for edit in spec:
+            if isinstance(edit, tuple):
+                if not edit or edit[0] not in BATCH_EDITS:
+                    raise ID3ParameterException("unknown edit: %s" %
+                                                (edit and edit[0],))
+                try:
+                    edit = BATCH_EDITS[edit[0]](*edit[1:])
+                except TypeError:
+                    raise ID3ParameterException("wrong arguments for %s" %
+                                                edit[0])
+            self.edits.append(edit)
+        self.version = version
+        self._filter = not [edit for edit in self.edits
+                            if not hasattr(edit, 'wanted')]
+
+    def wanted(self, filename, warnings):
+        """
+        Whether the edits would change a file, reading only the frame
+        headers and the frames they look at. Always true unless every
+        edit has a wanted() method.
+        """
+        if not self._filter:
+            return True
+        f = open(filename, 'rb')
+        try:
+            header = pread(f.fileno(), ID3V2_FILE_HEADER_LENGTH, 0)
+            version = None
+            if len(header) == ID3V2_FILE_HEADER_LENGTH and \
+                   header[:3] == 'ID3':
+                version = '2.%d' % ord(header[3])
+                if version not in _FRAME_CLASSES or ord(header[5]) & 0x80:
+                    return True # let the parser make sense of it
+            for edit in self.edits:
+                if edit.wanted(f, version, warnings):
+                    return True
+            return False
+        finally:
+            f.close()
+
+    def apply(self, tags):
+        """
+        Apply the edits to the parsed tags of a file, without writing.
+
+        @type tags: Tags
+        @return: (whether the tags changed, warnings)
+        """
+        warnings = []
+        changed = False
+        for edit in self.edits:
+            if edit.apply(tags.id3v2, tags.id3v1, warnings):
+                changed = True
+        return changed, warnings
+
+    def _action(self, tags, changed):
+        if not changed:
+            return BATCH_UNCHANGED
+        id3v2 = tags.id3v2
+        if id3v2.tag_exists() and id3v2.new_size() == id3v2.tag["size"]:
+            return BATCH_IN_PLACE
+        return BATCH_REWRITE
+
+    def edit(self, filename, pretend=False):
+        """
+        Edit the tags of a file, writing only if they changed.
+
+        @param pretend: only work out what would be written
+        @type pretend: boolean
+        @return: (action, warnings), see EditResult
+        @raise ID3Exception: if the tags can not be read or written, or
+                             would lose frames too corrupt to parse
+        """
+        warnings = []
+        if not self.wanted(filename, warnings):
+            return BATCH_UNCHANGED, warnings
+        tags = Tags(filename, self.version)
+        try:
+            changed, warnings = self.apply(tags)
+            if changed and tags.id3v2.corrupt_frames:
+                # the tag would be written without the frames dropped
+                raise ID3FrameException("; ".join(tags.id3v2.corrupt_frames))
+            action = self._action(tags, changed)
+            if changed and not pretend:
+                if tags.commit() is False:
+                    raise ID3Exception("file is read only")
+            return action, warnings
+        finally:
+            tags.close()
+
+    def result(self, filename, pretend=False):
+        """ edit() a file, returning an EditResult rather than raising """
+        try:
+            action, warnings = self.edit(filename, pretend)
+            return EditResult(filename, action, None, warnings)
+        except (ID3Exception, EnvironmentError), e:
+            return EditResult(filename, None, str(e), [])
+
+_worker_plan = None
+
+def _init_worker(plan):
+    global _worker_plan
+    _worker_plan = plan
+
+def _edit_chunk(args):
+    """ Worker side of run_edits() """
+    filenames, pretend = args
+    return [_worker_plan.result(filename, pretend) for filename in filenames]
+
+def run_edits(filenames, plan, jobs=1, pretend=False,
+              chunksize=BATCH_CHUNK_SIZE):
+    """
+    Apply an EditPlan to many files, yielding an EditResult for each.
+
+    With more than one job the files are shared out among worker
+    processes, each given the plan once when it starts. Results then
+    come in the order the chunks finish.
+
+    @param filenames: files to edit
+    @type filenames: iterable of strings
+    @param plan: the edits
+    @type plan: EditPlan
+    @param jobs: worker processes, one per cpu if None
+    @type jobs: int
+    @param pretend: only work out what each file needs
+    @type pretend: boolean
+    @param chunksize: files per chunk
+    @type chunksize: int
+    """
+    if jobs is None and multiprocessing:
+        jobs = multiprocessing.cpu_count()
+    if not jobs or jobs <= 1 or not multiprocessing:
+        for filename in filenames:
+            yield plan.result(filename, pretend)
+        return
+
+    pool = multiprocessing.Pool(jobs, _init_worker, (plan,))
+    try:
+        chunks = ((chunk, pretend) for chunk in _chunks(filenames, chunksize))
+        for results in pool.imap_unordered(_edit_chunk, chunks):
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,251 @@
+""" Parsed Tag Cache """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.fileio import *
+from tagger.id3v2 import ID3v2
+from tagger.id3v1 import ID3v1
+from tagger.debug import *
+
+import os, threading, weakref
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
+
+TAGCACHE_MAX_ENTRIES = 4096
+TAGCACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# bytes charged for an entry on top of the raw tags it holds
+TAGCACHE_ENTRY_OVERHEAD = 512
+
+class TagSnapshot(object):
+    """
+    Read only copy of the tags of a file as they were when it was parsed.
+
+    The raw bytes of both tags are kept, along with the text frames so
+    that common lookups need no parsing at all. id3v2() and id3v1() parse
+    the kept bytes again for callers that need the full frame objects,
+    without touching the file.
+
+    @ivar filename: file the tags were read from
+    @ivar key: stat identity of the file when it was read, see stat_key()
+    @ivar version: ID3v2 version, None if the file has no ID3v2 tag
+    @ivar fids: frame id of every ID3v2 frame, in tag order
+    @type fids: tuple
+    @ivar text: (fid, strings) for every ID3v2 text frame, in tag order
+    @type text: tuple
+    @ivar id3v2_data: the ID3v2 tag including its header but not its
+                      padding, or ''
+    @ivar id3v1_data: the 128 byte ID3v1 tag, or ''
+    @ivar nbytes: bytes charged for the snapshot in a TagCache
+    """
+
+    __slots__ = ('filename', 'key', 'version', 'fids', 'text',
+                 'id3v2_data', 'id3v1_data', 'nbytes')
+
+    def __init__(self, filename, key, version, fids, text,
+                 id3v2_data, id3v1_data):
+        values = (filename, key, version, fids, text, id3v2_data, id3v1_data,
+                  len(id3v2_data) + len(id3v1_data) + TAGCACHE_ENTRY_OVERHEAD)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TagSnapshot is read only")
+
+    def __delattr__(self, name):
+        raise AttributeError("TagSnapshot is read only")
+
+    def from_tags(cls, filename, key, id3v2, id3v1):
+        """ Snapshot of parsed ID3v2 and ID3v1 tags """
+        version = None
+        text = []
+        id3v2_data = ''
+        if id3v2.tag_exists():
+            version = id3v2.version
+            id3v2_data = id3v2.dump_header()
+            id3v2_data = id3v2_data[:len(id3v2_data) - id3v2.tag["padding"]]
+            for frame in id3v2.frames:
+                if frame.fid[0] == 'T' and frame.strings:
+                    text.append((frame.fid, tuple(frame.strings)))
+        fids = tuple([frame.fid for frame in id3v2.frames])
+        id3v1_data = ''
+        if id3v1.tag_exists():
+            id3v1_data = id3v1.output()
+        return cls(filename, key, version, fids, tuple(text),
+                   id3v2_data, id3v1_data)
+    from_tags = classmethod(from_tags)
+
+    def get(self, fid, default=None):
+        """ First string of the first text frame with this frame id """
+        for name, strings in self.text:
+            if name == fid:
+                return strings[0]
+        return default
+
+    def id3v2(self):
+        """ Freshly parsed ID3v2 tag, changes to it are not written anywhere """
+        return ID3v2.from_bytestring(self.id3v2_data)
+
+    def id3v1(self):
+        """ Freshly parsed ID3v1 tag, changes to it are not written anywhere """
+        return ID3v1.from_bytestring(self.id3v1_data)
+
+class TagCache:
+    """
+    Bounded cache of TagSnapshots, evicting the least recently used.
+
+    Entries are keyed by the stat identity of the file (device, inode,
+    mtime and size), so a file changed behind our back is parsed again.
+    Commits made through this package drop the file from every cache
+    straight away, even when the change leaves mtime and size alone.
+
+    cache = TagCache()
+    snapshot = cache.get('some.mp3')
+    print snapshot.get('TIT2')
+
+    @ivar max_entries: most snapshots kept
+    @ivar max_bytes: most bytes kept, counted by TagSnapshot.nbytes
+    @ivar hits: lookups answered from the cache
+    @ivar misses: lookups that had to parse the file
+    @ivar evictions: snapshots dropped to stay within the bounds
+    """
+
+    def __init__(self, max_entries=TAGCACHE_MAX_ENTRIES,
+                 max_bytes=TAGCACHE_MAX_BYTES):
+        """
+        @param max_entries: most snapshots to keep
+        @type max_entries: int
+        @param max_bytes: most bytes to keep
+        @type max_bytes: int
+        """
+        if OrderedDict is None:
+            raise ID3NotImplementedException("TagCache needs python 2.7")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict() # stat key -> snapshot, oldest first
+        self._paths = {} # absolute path -> stat key
+        self._lock = threading.Lock()
+        register_cache(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, filename):
+        """
+        Snapshot of the tags of a file, parsing it only if it is not
+        cached or has changed.
+
+        @param filename: mp3 file
+        @type filename: string
+        @rtype: TagSnapshot
+        """
+        path = os.path.abspath(filename)
+        key = stat_key(os.stat(path))
+        self._lock.acquire()
+        try:
+            snapshot = self._entries.get(key)
+            if snapshot is not None:
+                del self._entries[key]
+                self._entries[key] = snapshot
+                self._paths[path] = key
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+        finally:
+            self._lock.release()
+
+        snapshot = read_snapshot(path)
+        self._store(path, snapshot)
+        return snapshot
+
+    def _store(self, path, snapshot):
+        self._lock.acquire()
+        try:
+            self._discard(path)
+            if snapshot.nbytes > self.max_bytes:
+                return
+            if snapshot.key in self._entries:
+                self.nbytes -= self._entries.pop(snapshot.key).nbytes
+            self._entries[snapshot.key] = snapshot
+            self._paths[path] = snapshot.key
+            self.nbytes += snapshot.nbytes
+            while len(self._entries) > self.max_entries or \
+                  self.nbytes > self.max_bytes:
+                key, old = self._entries.popitem(last=False)
+                self.nbytes -= old.nbytes
+                if self._paths.get(old.filename) == key:
+                    del self._paths[old.filename]
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def _discard(self, path):
+        """ Drop the snapshot last seen for path, lock must be held """
+        key = self._paths.pop(path, None)
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key).nbytes
+
+    def invalidate(self, filename):
+        """ Forget the snapshot of a file """
+        self._lock.acquire()
+        try:
+            self._discard(os.path.abspath(filename))
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """ Forget every snapshot, the counters are kept """
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._paths.clear()
+            self.nbytes = 0
+        finally:
+            self._lock.release()
+
+def read_snapshot(filename):
+    """
+    Read both tags of a file through one read only handle.
+
+    @rtype: TagSnapshot
+    """
+    f = open(filename, 'rb')
+    try:
+        key = stat_key(os.fstat(f.fileno()))
+        id3v2 = ID3v2(f)
+        id3v1 = ID3v1(f)
+        snapshot = TagSnapshot.from_tags(filename, key, id3v2, id3v1)
+        id3v2.close()
+        id3v1.close()
+        return snapshot
+    finally:
+        f.close()
+
+# every cache to invalidate when a tag is written
+_caches = weakref.WeakSet()
+
+def register_cache(cache):
+    """
+    Have cache.invalidate(filename) called whenever a tag is written to
+    a file, for as long as the cache is alive.
+    """
+    _caches.add(cache)
+
+def _invalidate_caches(filename):
+    for cache in list(_caches):
+        cache.invalidate(filename)
+
+add_change_hook(_invalidate_caches)
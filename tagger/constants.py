@@ -10,6 +10,8 @@ ID3_FILE_READ = 0
 ID3_FILE_MODIFY = 1
 ID3_FILE_NEW = 2
 
+ID3V1_TAG_LENGTH = 128
+
 ID3V2_FILE_HEADER_LENGTH = 10
 ID3V2_FILE_EXTHEADER_LENGTH = 5
 ID3V2_FILE_FOOTER_LENGTH = 10
@@ -44,7 +46,7 @@ ID3V2_2_FRAME_SUPPORTED_IDS = {
 	'MCI':('bin','Music CD Identifier'), # FIXME
 	'MLL':('bin','MPEG Location Lookup Table'), # FIXME
 	'PIC':('apic','Attached Picture'),
-	'POP':('bin','Popularimeter'), # FIXME
+	'POP':('popm','Popularimeter'),
 	'REV':('bin','Reverb'), # FIXME
 	'RVA':('bin','Relative volume adjustment'), # FIXME
 	'STC':('bin','Synced Tempo Codes'), # FIXME
@@ -170,7 +172,7 @@ ID3V2_3_ABOVE_SUPPORTED_IDS = {
 	'OWNE':('bin','Ownership frame'), # FIXME
 	'PCNT':('pcnt','Play Counter'),
 	'PRIV':('bin','Private frame'), # FIXME
-	'POPM':('bin','Popularimeter'), # FIXME
+	'POPM':('popm','Popularimeter'),
 	'POSS':('bin','Position Synchronisation frame'), # FIXME
 	'RBUF':('bin','Recommended buffer size'), # FIXME
 	'RVA2':('bin','Relative volume adjustment'), #FIXME
@@ -0,0 +1,322 @@
+""" Duplicate Audio Finder """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.utility import *
+from tagger.fileio import *
+from tagger.metacache import METACACHE_RACY_SECONDS
+from tagger.walk import walk_files, WALK_PATTERN
+from tagger.debug import *
+
+import os, time, struct
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# bytes hashed from each end of the audio before hashing all of it
+DUPES_SAMPLE_SIZE = 64 * 1024
+
+# rows written per transaction
+DUPES_BATCH_SIZE = 1000
+
+# bump when the table layout or the digests change
+DUPES_SCHEMA_VERSION = 1
+
+_DUPES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dev INTEGER, ino INTEGER, mtime_ns INTEGER, size INTEGER,
+    audio_start INTEGER, audio_size INTEGER,
+    sample TEXT, digest TEXT,
+    seen INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_audio ON files (seen, audio_size);
+"""
+
+def audio_range(fd, size):
+    """
+    Offset and length of the audio in a file, between the end of the
+    ID3v2 tag (what ID3v2.mp3_data_offset() gives) and the start of the
+    ID3v1 tag, found with two small reads.
+
+    @param fd: file descriptor open for reading
+    @param size: size of the file
+    @return: (offset, length)
+    """
+    start = 0
+    header = pread(fd, ID3V2_FILE_HEADER_LENGTH, 0)
+    if len(header) == ID3V2_FILE_HEADER_LENGTH and header[:3] == 'ID3':
+        start = ID3V2_FILE_HEADER_LENGTH + unsyncsafe(header[6:10])
+        if header[3] == '\x04' and ord(header[5]) & 0x10:
+            start += ID3V2_FILE_FOOTER_LENGTH
+    end = size
+    if size - ID3V1_TAG_LENGTH >= start and \
+           pread(fd, 3, size - ID3V1_TAG_LENGTH) == 'TAG':
+        end = size - ID3V1_TAG_LENGTH
+    start = min(start, end)
+    return start, end - start
+
+def _hash_range(fd, digest, offset, length):
+    while length > 0:
+        data = pread(fd, min(length, FILEIO_BUFFER_SIZE), offset)
+        if not data:
+            raise IOError("file shrank while hashing")
+        digest.update(data)
+        offset += len(data)
+        length -= len(data)
+
+def audio_digest(filename):
+    """
+    SHA-1 of the audio of a file, skipping its ID3v2 and ID3v1 tags, so
+    that files with the same audio but different tags give the same
+    digest.
+
+    @rtype: string of hex digits
+    """
+    f = open(filename, 'rb')
+    try:
+        fd = f.fileno()
+        start, length = audio_range(fd, os.fstat(fd).st_size)
+        digest = sha1()
+        _hash_range(fd, digest, start, length)
+        return digest.hexdigest()
+    finally:
+        f.close()
+
+def sample_digest(fd, start, length, sample_size=DUPES_SAMPLE_SIZE):
+    """
+    SHA-1 of the first and last sample_size bytes of the audio. Audio no
+    longer than twice sample_size is hashed whole, which gives the same
+    digest as audio_digest().
+    """
+    digest = sha1()
+    if length <= 2 * sample_size:
+        _hash_range(fd, digest, start, length)
+    else:
+        _hash_range(fd, digest, start, sample_size)
+        _hash_range(fd, digest, start + length - sample_size, sample_size)
+    return digest.hexdigest()
+
+class DupeFinder:
+    """
+    Find files with the same audio, whatever their tags.
+
+    Files are compared in stages so that most are never read past their
+    tags: first by the length of their audio, then files of equal length
+    by a digest of the start and end of the audio, and only files that
+    still match are hashed in full. What is learnt about each file is kept
+    in an SQLite database with its stat identity, so later runs only read
+    new and changed files.
+
+    finder = DupeFinder('dupes.db')
+    for group in finder.find(['/music']):
+        print group
+    finder.close()
+
+    @ivar files: files walked by the last find()
+    @ivar sampled: files whose start and end were hashed
+    @ivar hashed: files hashed in full
+    @ivar bytes_read: bytes of audio read for hashing
+    """
+
+    def __init__(self, database=':memory:', sample_size=DUPES_SAMPLE_SIZE,
+                 batch_size=DUPES_BATCH_SIZE):
+        """
+        @param database: filename of the SQLite database, created if
+                         missing. ':memory:' keeps it in memory.
+        @type database: string
+        @param sample_size: bytes hashed at each end of the audio to weed
+                            out files before hashing them in full
+        @type sample_size: int
+        @param batch_size: rows to write per transaction
+        @type batch_size: int
+        """
+        if sqlite3 is None:
+            raise ID3NotImplementedException("sqlite3 module not available")
+        self.sample_size = sample_size
+        self.batch_size = batch_size
+        self.files = self.sampled = self.hashed = self.bytes_read = 0
+        self.db = sqlite3.connect(database)
+        self.db.text_factory = str
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != DUPES_SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("PRAGMA user_version = %d" % DUPES_SCHEMA_VERSION)
+        self.db.executescript(_DUPES_SCHEMA)
+        self.db.commit()
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """ Commit and close the database """
+        if getattr(self, 'db', None):
+            self.db.commit()
+            self.db.close()
+        self.db = None
+
+    def find(self, paths, pattern=WALK_PATTERN, sort_inodes=False):
+        """
+        Groups of files below the given files and directories that have
+        the same audio. Files without audio are left out.
+
+        @param paths: files and directories to look through
+        @type paths: list of strings
+        @param pattern: shell pattern of file names to look at
+        @type pattern: string
+        @param sort_inodes: walk the files in inode order, see walk_files()
+        @type sort_inodes: boolean
+        @return: lists of two or more paths, sorted
+        @rtype: list of lists of strings
+        """
+        self.files = self.sampled = self.hashed = self.bytes_read = 0
+        seen = (self.db.execute("SELECT MAX(seen) FROM files").fetchone()[0]
+                or 0) + 1
+        self._walk(paths, pattern, sort_inodes, seen)
+
+        # files of equal audio length get a digest of their ends
+        self._digest(seen, 'sample', "SELECT audio_size FROM files "
+                     "WHERE seen = ? AND audio_size > 0 "
+                     "GROUP BY audio_size HAVING COUNT(*) > 1")
+
+        # files whose ends match too are hashed in full
+        self._digest(seen, 'digest', "SELECT audio_size FROM files "
+                     "WHERE seen = ? AND sample IS NOT NULL "
+                     "GROUP BY audio_size, sample HAVING COUNT(*) > 1")
+
+        groups = {}
+        for path, digest in self.db.execute(
+                "SELECT path, digest FROM files WHERE seen = ? AND digest IN "
+                "(SELECT digest FROM files WHERE seen = ? AND digest IS NOT NULL "
+                "GROUP BY audio_size, digest HAVING COUNT(*) > 1)",
+                (seen, seen)):
+            groups.setdefault(digest, []).append(path)
+        result = [sorted(group) for group in groups.values()]
+        result.sort()
+        return result
+
+    def _walk(self, paths, pattern, sort_inodes, seen):
+        """ Bring the row of every walked file up to date """
+        pending = []
+        # a hard link is the same file, not a copy of it
+        for filename in walk_files(paths, pattern, sort_inodes,
+                                   unique_files=True):
+            path = os.path.abspath(filename)
+            try:
+                key = stat_key(os.stat(path))
+            except OSError:
+                continue
+            self.files += 1
+            row = self.db.execute("SELECT dev, ino, mtime_ns, size FROM files "
+                                  "WHERE path = ?", (path,)).fetchone()
+            if row and tuple(row) == key:
+                pending.append((seen, path))
+                if len(pending) >= self.batch_size:
+                    self._mark_seen(pending)
+                    pending = []
+                continue
+
+            try:
+                f = open(path, 'rb')
+                try:
+                    start, length = audio_range(f.fileno(), key[3])
+                finally:
+                    f.close()
+            except EnvironmentError:
+                continue
+            if time.time() - key[2] / 1000000000.0 < METACACHE_RACY_SECONDS:
+                # could change again without its stat changing, check next time
+                key = key[:2] + (0,) + key[3:]
+            self.db.execute("INSERT OR REPLACE INTO files VALUES "
+                            "(?, ?, ?, ?, ?, ?, ?, NULL, NULL, ?)",
+                            (path,) + key + (start, length, seen))
+        self._mark_seen(pending)
+        self.db.commit()
+
+    def _mark_seen(self, pending):
+        self.db.executemany("UPDATE files SET seen = ? WHERE path = ?", pending)
+
+    def _digest(self, seen, column, candidates):
+        """
+        Fill in the sample or digest column of the files whose audio sizes
+        are given by the candidates query and that lack it.
+        """
+        rows = self.db.execute(
+            "SELECT path, size, audio_start, audio_size, sample FROM files "
+            "WHERE seen = ? AND %s IS NULL AND audio_size IN (%s)" %
+            (column, candidates), (seen, seen)).fetchall()
+        if column == 'digest':
+            # only files whose sample is shared by another file of their size
+            shared = set(self.db.execute(
+                "SELECT audio_size, sample FROM files WHERE seen = ? "
+                "AND sample IS NOT NULL GROUP BY audio_size, sample "
+                "HAVING COUNT(*) > 1", (seen,)).fetchall())
+            rows = [row for row in rows if (row[3], row[4]) in shared]
+
+        done = 0
+        for path, size, start, length, sample in rows:
+            try:
+                f = open(path, 'rb')
+                try:
+                    fd = f.fileno()
+                    if stat_key(os.fstat(fd))[3] != size:
+                        continue # changed since the walk
+                    if column == 'sample':
+                        value = sample_digest(fd, start, length,
+                                              self.sample_size)
+                        self.sampled += 1
+                        self.bytes_read += min(length, 2 * self.sample_size)
+                    else:
+                        digest = sha1()
+                        _hash_range(fd, digest, start, length)
+                        value = digest.hexdigest()
+                        self.hashed += 1
+                        self.bytes_read += length
+                finally:
+                    f.close()
+            except EnvironmentError:
+                continue
+            if column == 'sample' and length <= 2 * self.sample_size:
+                # the sample covers all of the audio
+                self.db.execute("UPDATE files SET sample = ?, digest = ? "
+                                "WHERE path = ?", (value, value, path))
+            else:
+                self.db.execute("UPDATE files SET %s = ? WHERE path = ?" %
+                                column, (value, path))
+            done += 1
+            if done % self.batch_size == 0:
+                self.db.commit()
+        self.db.commit()
+
+    def prune(self):
+        """
+        Drop the rows of files not seen by the last find(), such as files
+        deleted since or outside the paths it was given.
+
+        @return: number of rows dropped
+        """
+        seen = self.db.execute("SELECT MAX(seen) FROM files").fetchone()[0]
+        count = self.db.execute("DELETE FROM files WHERE seen < ?",
+                                (seen,)).rowcount
+        self.db.commit()
+        return count
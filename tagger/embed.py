@@ -0,0 +1,262 @@
+""" Bulk Cover Art Embedding """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.id3v2frame import *
+from tagger.id3v2 import ID3v2
+from tagger.scanner import _chunks
+from tagger.debug import *
+
+from collections import namedtuple
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# files handed to a worker at a time
+EMBED_CHUNK_SIZE = 16
+
+# how a file gets its picture, see PictureEmbedder.plan()
+EMBED_IN_PLACE = 'in place'
+EMBED_REWRITE = 'rewrite'
+
+# picture type of a front cover, see ID3V2_3_APIC_PICT_TYPES
+EMBED_FRONT_COVER = 3
+
+_FRAME_CLASSES = {'2.2': ID3v2_2_Frame, '2.3': ID3v2_3_Frame,
+                  '2.4': ID3v2_4_Frame}
+
+_IMAGE_MAGIC = (('\xff\xd8', 'image/jpeg'), ('\x89PNG', 'image/png'),
+                ('GIF8', 'image/gif'), ('BM', 'image/bmp'))
+
+def image_mimetype(image):
+    """ Mime type of an image from its first bytes, None if unknown """
+    for magic, mimetype in _IMAGE_MAGIC:
+        if image.startswith(magic):
+            return mimetype
+    return None
+
+class EncodedFrame:
+    """
+    A frame whose bytes were made once and are handed back by output()
+    as they are, so the same picture can go into many tags without being
+    encoded again. Each tag needs its own EncodedFrame, as committing
+    records the frame's place in that tag, but they can share the bytes.
+
+    @ivar fid: frame id
+    @ivar data: the whole frame, header included
+    """
+
+    offset = None
+    rawheader = None
+    rawdata = None
+
+    def __init__(self, fid, header_length, data):
+        self.fid = fid
+        self.header_length = header_length
+        self.data = data
+
+    def output(self):
+        return self.data
+
+class EmbedResult(namedtuple('EmbedResult', 'path plan error')):
+    """
+    Outcome of embedding a picture in one file.
+
+    @ivar path: the file
+    @ivar plan: EMBED_IN_PLACE if the tag had room for the picture,
+                EMBED_REWRITE if the tag was made or grown, moving the
+                mp3 data, None if it failed
+    @ivar error: why the file could not be changed, None if it could
+    """
+    __slots__ = ()
+
+class PictureEmbedder:
+    """
+    Put one picture into the tags of many files, such as the cover of
+    an album into each of its tracks.
+
+    The APIC or PIC frame is encoded once for each tag version met and
+    reused for every file, and the image is read only once. Pictures of
+    the same picture type already in a tag are replaced. plan() tells
+    whether a file has the padding to take the picture in place or needs
+    its tag rewritten.
+
+    embedder = PictureEmbedder(open('cover.jpg', 'rb').read())
+    for filename in filenames:
+        print filename, embedder.embed(filename)
+    """
+
+    def __init__(self, image, mimetype=None, picttype=EMBED_FRONT_COVER,
+                 desc='', encoding='latin_1',
+                 version=ID3V2_DEFAULT_VERSION):
+        """
+        @param image: the picture bytes
+        @type image: string
+        @param mimetype: mime type of the picture, worked out from the
+                         picture bytes if not given
+        @type mimetype: string
+        @param picttype: picture type, see ID3V2_3_APIC_PICT_TYPES
+        @type picttype: int
+        @param desc: description of the picture
+        @type desc: string
+        @param encoding: encoding of the description
+        @type encoding: string
+        @param version: ID3v2 version of tags made for untagged files
+        @type version: string
+        @raise ID3ParameterException: if the mime type is not given and
+                                      can not be worked out
+        """
+        if mimetype is None:
+            mimetype = image_mimetype(image)
+        if mimetype is None:
+            raise ID3ParameterException("unknown image type, give mimetype")
+        self.image = image
+        self.mimetype = mimetype
+        self.picttype = picttype
+        self.desc = desc
+        self.encoding = encoding
+        self.version = version
+        self._frames = {} # version -> (fid, header length, frame bytes)
+
+    def __getstate__(self):
+        # workers encode their own frames
+        state = self.__dict__.copy()
+        state['_frames'] = {}
+        return state
+
+    def frame(self, version):
+        """ A frame holding the picture for a tag of this version """
+        if version not in self._frames:
+            frame = _FRAME_CLASSES[version](fid=(version == '2.2' and 'PIC'
+                                                 or 'APIC'))
+            frame.encoding = self.encoding
+            frame.mimetype = self.mimetype
+            frame.picttype = self.picttype
+            frame.desc = self.desc
+            frame.pict = self.image
+            self._frames[version] = (frame.fid, frame.header_length,
+                                     frame.output())
+        return EncodedFrame(*self._frames[version])
+
+    def _prepare(self, filename):
+        """ Parsed tag of a file with the picture put in its frames """
+        id3 = ID3v2(filename, version=self.version)
+        if id3.corrupt_frames:
+            # the tag would be written without the frames dropped
+            id3.close()
+            raise ID3FrameException("; ".join(id3.corrupt_frames))
+        frames = []
+        for frame in id3.frames:
+            if frame.fid in ('APIC', 'PIC') and \
+                   frame.picttype == self.picttype:
+                continue
+            frames.append(frame)
+        frames.append(self.frame(id3.version))
+        id3.frames = frames
+        return id3
+
+    def _plan(self, id3):
+        if id3.tag_exists() and id3.new_size() == id3.tag["size"]:
+            return EMBED_IN_PLACE
+        return EMBED_REWRITE
+
+    def plan(self, filename):
+        """
+        How embed() would change a file, without changing it.
+
+        @return: EMBED_IN_PLACE or EMBED_REWRITE
+        """
+        id3 = self._prepare(filename)
+        try:
+            return self._plan(id3)
+        finally:
+            id3.close()
+
+    def embed(self, filename, pretend=False):
+        """
+        Put the picture into the tag of a file.
+
+        @param pretend: only work out the plan
+        @type pretend: boolean
+        @return: EMBED_IN_PLACE or EMBED_REWRITE
+        @raise ID3Exception: if the tag can not be read or written, or
+                             would lose frames too corrupt to parse
+        """
+        id3 = self._prepare(filename)
+        try:
+            plan = self._plan(id3)
+            if not pretend:
+                if id3.commit() is False:
+                    raise ID3Exception("file is read only")
+            return plan
+        finally:
+            id3.close()
+
+    def result(self, filename, pretend=False):
+        """ embed() a file, returning an EmbedResult rather than raising """
+        try:
+            return EmbedResult(filename, self.embed(filename, pretend), None)
+        except (ID3Exception, EnvironmentError), e:
+            return EmbedResult(filename, None, str(e))
+
+_worker_embedder = None
+
+def _init_worker(embedder):
+    global _worker_embedder
+    _worker_embedder = embedder
+
+def _embed_chunk(args):
+    """ Worker side of embed_picture() """
+    filenames, pretend = args
+    return [_worker_embedder.result(filename, pretend)
+            for filename in filenames]
+
+def embed_picture(filenames, embedder, jobs=1, pretend=False,
+                  chunksize=EMBED_CHUNK_SIZE):
+    """
+    Embed a picture into many files, yielding an EmbedResult for each.
+
+    With more than one job the files are shared out among worker
+    processes, each given the picture once when it starts. Results then
+    come in the order the chunks finish.
+
+    embedder = PictureEmbedder(open('cover.jpg', 'rb').read())
+    for result in embed_picture(glob.glob('album/*.mp3'), embedder, jobs=4):
+        print result.path, result.plan or result.error
+
+    @param filenames: files to change
+    @type filenames: iterable of strings
+    @param embedder: the picture to embed
+    @type embedder: PictureEmbedder
+    @param jobs: worker processes, one per cpu if None
+    @type jobs: int
+    @param pretend: only work out the plan for each file
+    @type pretend: boolean
+    @param chunksize: files per chunk
+    @type chunksize: int
+    """
+    if jobs is None and multiprocessing:
+        jobs = multiprocessing.cpu_count()
+    if not jobs or jobs <= 1 or not multiprocessing:
+        for filename in filenames:
+            yield embedder.result(filename, pretend)
+        return
+
+    pool = multiprocessing.Pool(jobs, _init_worker, (embedder,))
+    try:
+        chunks = ((chunk, pretend) for chunk in _chunks(filenames, chunksize))
+        for results in pool.imap_unordered(_embed_chunk, chunks):
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
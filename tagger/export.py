@@ -0,0 +1,377 @@
+""" Columnar Tag Export """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.utility import *
+from tagger.id3v2 import iter_frames
+from tagger.stream import decode_text
+from tagger.walk import walk_files, WALK_PATTERN
+from tagger.scanner import _chunks
+from tagger.debug import *
+
+import os, sys, struct, mmap, csv
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# text frames exported by default, with their names in version 2.2 tags
+EXPORT_FIELDS = ('TIT2', 'TPE1', 'TALB', 'TRCK', 'TYER')
+EXPORT_FIELDS_2_2 = {'TIT2': 'TT2', 'TPE1': 'TP1', 'TALB': 'TAL',
+                     'TRCK': 'TRK', 'TYER': 'TYE', 'TCON': 'TCO',
+                     'TCOM': 'TCM', 'TPOS': 'TPA'}
+
+# files handed to a worker at a time
+EXPORT_CHUNK_SIZE = 256
+
+# first bytes of a column file, the last two are the format version
+EXPORT_MAGIC = 'PTCOL\x00\x00\x01'
+
+# numeric columns and their array typecodes, unsigned 32 and 8 bit
+_NUMERIC_COLUMNS = (('tag_size', 'I'), ('padding', 'I'),
+                    ('apic_bytes', 'I'), ('id3v1', 'B'))
+
+# column kind of dictionary encoded strings in a column file
+_STRING_KIND = 'D'
+
+class StringColumn:
+    """
+    Dictionary encoded strings. Each distinct value is kept once, rows
+    hold its code, counting from 1, or 0 for a missing value.
+
+    @ivar values: distinct values, as unicode strings
+    @ivar codes: code of every row
+    @type codes: array of 'I'
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = array('I')
+        self._index = {}
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(0)
+            return
+        code = self._index.get(value)
+        if code is None:
+            self.values.append(value)
+            code = self._index[value] = len(self.values)
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        code = self.codes[row]
+        if not code:
+            return None
+        return self.values[code - 1]
+
+    def __iter__(self):
+        for row in xrange(len(self.codes)):
+            yield self[row]
+
+def _to_unicode(value, encoding='latin_1'):
+    if isinstance(value, str):
+        return value.decode(encoding, 'replace')
+    return value
+
+def _path(filename):
+    """ A file name as unicode, decoded as the filesystem encodes names """
+    return _to_unicode(filename, sys.getfilesystemencoding() or 'latin_1')
+
+def read_row(filename, fields=EXPORT_FIELDS):
+    """
+    Export row of one file, in the column order of ColumnTable. The file
+    is mapped and only the frame headers and the requested text frames
+    are read. Errors end up in the row.
+
+    @param fields: text frames to fetch, by their version 2.3 names
+    @type fields: sequence of strings
+    @rtype: tuple
+    """
+    version = None
+    tag_size = padding = apic = 0
+    values = {}
+    id3v1 = False
+    try:
+        f = open(filename, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            data = ''
+            if size:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                id3v1 = size >= ID3V1_TAG_LENGTH and \
+                        data[size - ID3V1_TAG_LENGTH:
+                             size - ID3V1_TAG_LENGTH + 3] == 'TAG'
+                if size >= ID3V2_FILE_HEADER_LENGTH and data[:3] == 'ID3':
+                    ver, rawsize = struct.unpack(
+                        "!3xHx4s", data[:ID3V2_FILE_HEADER_LENGTH])
+                    version = u'2.%d' % (ver >> 8)
+                    tag_size = ID3V2_FILE_HEADER_LENGTH + unsyncsafe(rawsize)
+                    wanted = {}
+                    for fid in fields:
+                        if version == u'2.2':
+                            wanted[EXPORT_FIELDS_2_2.get(fid, fid)] = fid
+                        else:
+                            wanted[fid] = fid
+                    end = ID3V2_FILE_HEADER_LENGTH
+                    for fid, start, length, flags in iter_frames(data):
+                        end = start + length
+                        if fid in ('APIC', 'PIC'):
+                            apic += length
+                        elif fid in wanted and wanted[fid] not in values:
+                            values[wanted[fid]] = _to_unicode(
+                                decode_text(data[start:end]))
+                    padding = max(tag_size - end, 0)
+            finally:
+                if size:
+                    data.close()
+        finally:
+            f.close()
+    except (ID3Exception, EnvironmentError, mmap.error), e:
+        return ((_path(filename), None, 0, 0) +
+                (None,) * len(fields) + (0, False, _to_unicode(str(e))))
+    return ((_path(filename), version, tag_size, padding) +
+            tuple([values.get(fid) for fid in fields]) +
+            (apic, id3v1, None))
+
+class ColumnTable:
+    """
+    Tag fields of many files kept column by column.
+
+    Numeric columns are arrays, strings are dictionary encoded in a
+    StringColumn, so a row costs a few bytes per column plus whatever new
+    strings it brings. Tables are saved with write() in a compact binary
+    format that read() loads again, or as CSV with write_csv().
+
+    table = ColumnTable()
+    for filename in walk_files(['/music']):
+        table.add_file(filename)
+    table.write(open('library.col', 'wb'))
+
+    The columns are path, version, tag_size, padding, one per text field,
+    apic_bytes, id3v1 and error.
+    """
+
+    def __init__(self, fields=EXPORT_FIELDS):
+        """
+        @param fields: text frames to keep a column for, by their version
+                       2.3 names. Version 2.2 frames are looked up through
+                       EXPORT_FIELDS_2_2.
+        @type fields: sequence of strings
+        """
+        self.fields = tuple(fields)
+        self.names = ['path', 'version', 'tag_size', 'padding'] + \
+                     list(self.fields) + ['apic_bytes', 'id3v1', 'error']
+        numeric = dict(_NUMERIC_COLUMNS)
+        self.columns = {}
+        for name in self.names:
+            if name in numeric:
+                self.columns[name] = array(numeric[name])
+            else:
+                self.columns[name] = StringColumn()
+        self._order = [self.columns[name] for name in self.names]
+
+    def __len__(self):
+        return len(self.columns['path'])
+
+    def append(self, row):
+        """ Add a row, given as a sequence in column order """
+        if len(row) != len(self._order):
+            raise ID3ParameterException("row has %d values, expected %d" %
+                                        (len(row), len(self._order)))
+        for column, value in zip(self._order, row):
+            column.append(value)
+
+    def add_file(self, filename):
+        """ Read the tags of a file and add them as a row """
+        self.append(read_row(filename, self.fields))
+
+    def column(self, name):
+        """
+        @return: the named column, an array for numeric columns and a
+                 StringColumn for strings
+        """
+        return self.columns[name]
+
+    def numpy_column(self, name):
+        """
+        The named column as a numpy array, sharing the memory of a numeric
+        column. A string column gives its codes, see StringColumn.
+        """
+        if numpy is None:
+            raise ID3NotImplementedException("numpy module not available")
+        column = self.columns[name]
+        if isinstance(column, StringColumn):
+            column = column.codes
+        return numpy.frombuffer(column, dtype=column.typecode)
+
+    def rows(self):
+        """ Yield every row as a tuple in column order """
+        for row in xrange(len(self)):
+            yield tuple([column[row] for column in self._order])
+
+    def write(self, f):
+        """
+        Save the table to a file in the binary column format: the magic
+        and version, then row and column counts, then every column as its
+        name, kind and data. Numbers are little endian.
+
+        @param f: file opened for writing in binary mode
+        """
+        f.write(EXPORT_MAGIC)
+        f.write(struct.pack("<II", len(self), len(self.names)))
+        for name in self.names:
+            column = self.columns[name]
+            f.write(struct.pack("<H", len(name)) + name)
+            if isinstance(column, StringColumn):
+                f.write(_STRING_KIND)
+                f.write(struct.pack("<I", len(column.values)))
+                for value in column.values:
+                    value = value.encode('utf_8')
+                    f.write(struct.pack("<I", len(value)) + value)
+                _write_array(f, column.codes)
+            else:
+                f.write(column.typecode)
+                _write_array(f, column)
+
+    def read(cls, f):
+        """
+        Load a table saved with write().
+
+        @param f: file opened for reading in binary mode
+        @rtype: ColumnTable
+        @raise ID3Exception: if the file is not a column file
+        """
+        if f.read(len(EXPORT_MAGIC)) != EXPORT_MAGIC:
+            raise ID3Exception("not a tag column file")
+        rows, count = struct.unpack("<II", _read_exact(f, 8))
+        names = []
+        columns = {}
+        for i in range(count):
+            length, = struct.unpack("<H", _read_exact(f, 2))
+            name = _read_exact(f, length)
+            kind = _read_exact(f, 1)
+            if kind == _STRING_KIND:
+                column = StringColumn()
+                values, = struct.unpack("<I", _read_exact(f, 4))
+                for j in xrange(values):
+                    length, = struct.unpack("<I", _read_exact(f, 4))
+                    value = _read_exact(f, length).decode('utf_8')
+                    column.values.append(value)
+                    column._index[value] = j + 1
+                column.codes = _read_array(f, 'I', rows)
+            else:
+                column = _read_array(f, kind, rows)
+            names.append(name)
+            columns[name] = column
+
+        fixed = ('path', 'version', 'tag_size', 'padding')
+        if tuple(names[:4]) != fixed or \
+               names[-3:] != ['apic_bytes', 'id3v1', 'error']:
+            raise ID3Exception("unexpected columns in tag column file")
+        table = cls(names[4:-3])
+        table.columns = columns
+        table._order = [columns[name] for name in table.names]
+        return table
+    read = classmethod(read)
+
+    def write_csv(self, f):
+        """
+        Save the table as CSV with a header row, strings in UTF-8.
+
+        @param f: file opened for writing in binary mode
+        """
+        writer = csv.writer(f)
+        writer.writerow(self.names)
+        for row in self.rows():
+            writer.writerow([_csv_value(value) for value in row])
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf_8')
+    return value
+
+def _write_array(f, values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    f.write(values.tostring())
+
+def _read_array(f, typecode, count):
+    values = array(typecode)
+    values.fromstring(_read_exact(f, values.itemsize * count))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def _read_exact(f, length):
+    data = f.read(length)
+    if len(data) != length:
+        raise ID3Exception("tag column file is truncated")
+    return data
+
+def _export_chunk(args):
+    """ Worker side of export_tags() """
+    filenames, fields = args
+    return [read_row(filename, fields) for filename in filenames]
+
+def export_tags(paths, fields=EXPORT_FIELDS, jobs=1, pattern=WALK_PATTERN,
+                sort_inodes=False, chunksize=EXPORT_CHUNK_SIZE):
+    """
+    ColumnTable of every file below the given files and directories.
+
+    table = export_tags(['/music'], jobs=4)
+    table.write_csv(open('library.csv', 'wb'))
+
+    @param paths: files and directories to read
+    @type paths: list of strings
+    @param fields: text frames to keep a column for
+    @type fields: sequence of strings
+    @param jobs: worker processes, one per cpu if None
+    @type jobs: int
+    @param pattern: shell pattern of file names to read in directories
+    @type pattern: string
+    @param sort_inodes: read the files in inode order, see walk_files()
+    @type sort_inodes: boolean
+    @rtype: ColumnTable
+    """
+    table = ColumnTable(fields)
+    filenames = walk_files(paths, pattern, sort_inodes)
+    if jobs is None and multiprocessing:
+        jobs = multiprocessing.cpu_count()
+    if not jobs or jobs <= 1 or not multiprocessing:
+        for filename in filenames:
+            table.add_file(filename)
+        return table
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        chunks = ((chunk, table.fields) for chunk in
+                  _chunks(filenames, chunksize))
+        for rows in pool.imap_unordered(_export_chunk, chunks):
+            for row in rows:
+                table.append(row)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return table
@@ -0,0 +1,503 @@
+""" Low Level File I/O Functions """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+import os, sys, threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # not available on windows
+
+try:
+    import ctypes, ctypes.util
+except ImportError:
+    ctypes = None
+
+FILEIO_BUFFER_SIZE = 1024 * 1024
+
+# block size and number of blocks kept by a RangeReader
+RANGE_BLOCK_SIZE = 4096
+RANGE_CACHE_BLOCKS = 64
+
+# ioctl to share the data blocks of one file with another (linux/fs.h)
+FICLONE = 0x40049409
+
+# fallocate modes to add or remove blocks inside a file (linux/falloc.h)
+FALLOC_FL_COLLAPSE_RANGE = 0x08
+FALLOC_FL_INSERT_RANGE = 0x20
+
+_libc = None
+_change_hooks = []
+
+def libc():
+    """ The C library loaded through ctypes, or None if unavailable """
+    global _libc
+    if _libc is None:
+        _libc = False
+        if ctypes:
+            name = ctypes.util.find_library('c')
+            if name:
+                try:
+                    _libc = ctypes.CDLL(name, use_errno=True)
+                except OSError:
+                    pass
+        if _libc:
+            _prototypes(_libc)
+    return _libc or None
+
+def _prototypes(c):
+    """ Declare the argument types of the C functions used here """
+    size_t, ssize_t, int64 = ctypes.c_size_t, ctypes.c_ssize_t, ctypes.c_int64
+    functions = {
+        'pread64': (ssize_t, [ctypes.c_int, ctypes.c_char_p, size_t, int64]),
+        'pwrite64': (ssize_t, [ctypes.c_int, ctypes.c_char_p, size_t, int64]),
+        'copy_file_range': (ssize_t, [ctypes.c_int, ctypes.POINTER(int64),
+                                      ctypes.c_int, ctypes.POINTER(int64),
+                                      size_t, ctypes.c_uint]),
+        'fallocate64': (ctypes.c_int, [ctypes.c_int, ctypes.c_int,
+                                       int64, int64]),
+        }
+    for name, (restype, argtypes) in functions.items():
+        if hasattr(c, name):
+            function = getattr(c, name)
+            function.restype = restype
+            function.argtypes = argtypes
+
+def _oserror():
+    """ OSError for the errno left behind by a ctypes call """
+    err = ctypes.get_errno()
+    return OSError(err, os.strerror(err))
+
+def open_file(filename):
+    """
+    Open a file for reading and writing, falling back to read only if
+    permission to write is denied.
+
+    @return: (file object, read_only)
+    @rtype: tuple
+    """
+    try:
+        return open(filename, 'rb+'), False
+    except IOError, (errno, strerror):
+        if errno == 13: # permission denied
+            return open(filename, 'rb'), True
+        raise
+
+def is_read_only(f):
+    """ Guess whether an open file or file-like object can be written to """
+    if not hasattr(f, 'write'):
+        return True
+    if hasattr(f, 'writable'):
+        return not f.writable()
+    mode = getattr(f, 'mode', 'rb+')
+    return not ('+' in mode or 'w' in mode or 'a' in mode)
+
+def fileno(f):
+    """
+    File descriptor behind a file object, or None for file-like objects
+    that have none (StringIO, BytesIO)
+    """
+    try:
+        return f.fileno()
+    except (AttributeError, IOError, ValueError):
+        return None
+
+def stat_key(st):
+    """
+    Identity of a version of a file: (device, inode, mtime in
+    nanoseconds, size), from the result of os.stat or os.fstat.
+    """
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(st.st_mtime * 1000000000)
+    return (st.st_dev, st.st_ino, mtime_ns, st.st_size)
+
+def add_change_hook(hook):
+    """
+    Call hook(filename) whenever a tag is written to a file, for
+    anything keeping information about files that has to be dropped.
+    """
+    if hook not in _change_hooks:
+        _change_hooks.append(hook)
+
+def remove_change_hook(hook):
+    if hook in _change_hooks:
+        _change_hooks.remove(hook)
+
+def file_changed(filename):
+    """
+    Tell the change hooks that filename has been written to. Does
+    nothing for file-like objects without a name.
+    """
+    if not isinstance(filename, basestring):
+        return
+    for hook in _change_hooks[:]:
+        hook(filename)
+
+def shift_data(f, start, end, delta, bufsize=FILEIO_BUFFER_SIZE):
+    """
+    Move the bytes between start and end of a file by delta bytes in
+    place. Moving forward copies from the back and moving backward copies
+    from the front, so no byte is overwritten before it has been read.
+
+    @param f: file object open for reading and writing
+    @param start: offset of the first byte to move
+    @param end: offset after the last byte to move
+    @param delta: distance to move, negative to move towards the start
+    """
+    if delta > 0:
+        pos = end
+        while pos > start:
+            length = min(bufsize, pos - start)
+            pos -= length
+            f.seek(pos)
+            buf = f.read(length)
+            f.seek(pos + delta)
+            f.write(buf)
+    elif delta < 0:
+        pos = start
+        while pos < end:
+            length = min(bufsize, end - pos)
+            f.seek(pos)
+            buf = f.read(length)
+            f.seek(pos + delta)
+            f.write(buf)
+            pos += length
+
+class RangeReader:
+    """
+    Reads byte ranges of a file through a read_at(offset, length)
+    callable, keeping a small cache of the blocks fetched so far.
+
+    All the blocks a request is missing are fetched with a single call
+    to read_at, so the tag readers get by with one call for the header,
+    one for the rest of the ID3v2 tag and one for the ID3v1 tag at the
+    end. Useful for files on object storage or slow network filesystems
+    where every request is expensive.
+
+    @ivar requests: number of calls made to read_at
+    @ivar bytes_read: number of bytes returned by read_at
+    """
+
+    def __init__(self, read_at, size, block_size=RANGE_BLOCK_SIZE,
+                 cache_blocks=RANGE_CACHE_BLOCKS):
+        """
+        @param read_at: function(offset, length) returning up to length \
+                        bytes of the file starting at offset
+        @type read_at: callable
+        @param size: size of the file, or a function returning it
+        @type size: int or callable
+        @param block_size: size of the cached blocks
+        @param cache_blocks: number of blocks to keep
+        """
+        self._read_at = read_at
+        self._size = size
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.requests = 0
+        self.bytes_read = 0
+        self._cache = {}
+        self._used = []
+        self._lock = threading.Lock() # guards the cache, not the reads
+
+    def size(self):
+        """ Size of the file in bytes """
+        if callable(self._size):
+            return self._size()
+        return self._size
+
+    def clear(self):
+        """ Forget cached blocks, for when the file has been written to """
+        self._lock.acquire()
+        try:
+            self._cache = {}
+            self._used = []
+        finally:
+            self._lock.release()
+
+    def _store(self, number, block):
+        if number in self._cache:
+            self._used.remove(number)
+        self._cache[number] = block
+        self._used.append(number)
+        while len(self._used) > self.cache_blocks:
+            del self._cache[self._used.pop(0)]
+
+    def read_at(self, offset, length):
+        """
+        Read up to length bytes at offset, fewer at the end of the file.
+        Safe to call from several threads as long as read_at is.
+        """
+        size = self.size()
+        if size is not None:
+            length = min(length, size - offset)
+        if length <= 0:
+            return ''
+
+        bs = self.block_size
+        first = offset // bs
+        last = (offset + length - 1) // bs
+        blocks = {}
+        self._lock.acquire()
+        try:
+            for n in range(first, last + 1):
+                if n in self._cache:
+                    blocks[n] = self._cache[n]
+        finally:
+            self._lock.release()
+        missing = [n for n in range(first, last + 1) if n not in blocks]
+
+        if missing:
+            start = missing[0] * bs
+            end = (missing[-1] + 1) * bs
+            if size is not None:
+                end = min(end, size)
+            data = self._read_at(start, end - start)
+            self.requests += 1
+            self.bytes_read += len(data)
+            for n in range(missing[0], missing[-1] + 1):
+                pos = (n - missing[0]) * bs
+                blocks[n] = data[pos:pos + bs]
+
+        parts = []
+        self._lock.acquire()
+        try:
+            for n in range(first, last + 1):
+                self._store(n, blocks[n])
+                parts.append(blocks[n])
+        finally:
+            self._lock.release()
+
+        data = ''.join(parts)
+        start = offset - first * bs
+        return data[start:start + length]
+
+def file_reader(f):
+    """
+    RangeReader over an open file or seekable file-like object.
+
+    Files with a descriptor are read with pread, which leaves the file
+    position alone, so the reader can be shared between threads and
+    with code writing through f. Other file-like objects are read with
+    seek and read under a lock.
+    """
+    fd = fileno(f)
+    if fd is not None and has_pread():
+        def read_at(offset, length):
+            return pread(fd, length, offset)
+        def size():
+            return os.fstat(fd).st_size
+    else:
+        lock = threading.Lock()
+        def read_at(offset, length):
+            lock.acquire()
+            try:
+                f.seek(offset)
+                return f.read(length)
+            finally:
+                lock.release()
+        def size():
+            lock.acquire()
+            try:
+                f.seek(0, 2)
+                return f.tell()
+            finally:
+                lock.release()
+    return RangeReader(read_at, size)
+
+def lock_file(fd, exclusive=True):
+    """
+    Take an advisory lock on an open file descriptor. Blocks until the
+    lock is granted. Does nothing where advisory locks are unsupported.
+
+    @param fd: file descriptor
+    @type fd: int
+    @param exclusive: take an exclusive (write) lock rather than shared
+    @type exclusive: boolean
+    """
+    if fcntl:
+        if exclusive:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+
+def unlock_file(fd):
+    """ Release an advisory lock taken by lock_file """
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+def has_pread():
+    """ Can pread() read without touching the file position? """
+    c = libc()
+    return hasattr(os, 'pread') or bool(c and hasattr(c, 'pread64'))
+
+def pread(fd, length, offset):
+    """
+    Read up to length bytes at offset from a file descriptor without
+    using or moving the file position, so that one descriptor can be
+    read from several threads at once.
+
+    Uses os.pread, or the C library's pread where Python lacks it, and
+    only seeks the descriptor if neither is available (see has_pread).
+    """
+    if hasattr(os, 'pread'):
+        return os.pread(fd, length, offset)
+    c = libc()
+    if c and hasattr(c, 'pread64'):
+        buf = ctypes.create_string_buffer(length)
+        count = c.pread64(fd, buf, length, offset)
+        if count < 0:
+            raise _oserror()
+        return buf.raw[:count]
+    os.lseek(fd, offset, 0)
+    return os.read(fd, length)
+
+def pwrite(fd, data, offset):
+    """
+    Write data at offset in a file descriptor without using or moving
+    the file position, falling back to seeking like pread.
+    """
+    c = libc()
+    if hasattr(os, 'pwrite'):
+        written = os.pwrite(fd, data, offset)
+    elif c and hasattr(c, 'pwrite64'):
+        written = c.pwrite64(fd, data, len(data), offset)
+        if written < 0:
+            raise _oserror()
+    else:
+        os.lseek(fd, offset, 0)
+        written = os.write(fd, data)
+    if written != len(data):
+        raise IOError("short write at offset %d" % offset)
+    return written
+
+def copy_file_range(fd_in, fd_out, count, offset_in, offset_out):
+    """
+    Copy up to count bytes between file descriptors inside the kernel,
+    without moving either file position. Filesystems that support it
+    share or clone the blocks instead of copying them.
+
+    Uses os.copy_file_range where available and otherwise calls the C
+    library directly.
+
+    @return: number of bytes copied, 0 at end of file
+    @raise OSError: if the copy is not possible between these files
+    """
+    if hasattr(os, 'copy_file_range'):
+        return os.copy_file_range(fd_in, fd_out, count, offset_in, offset_out)
+
+    c = libc()
+    if not c or not hasattr(c, 'copy_file_range'):
+        raise OSError(38, "copy_file_range not available") # ENOSYS
+    offset_in = ctypes.c_int64(offset_in)
+    offset_out = ctypes.c_int64(offset_out)
+    copied = c.copy_file_range(fd_in, ctypes.byref(offset_in),
+                               fd_out, ctypes.byref(offset_out),
+                               count, 0)
+    if copied < 0:
+        raise _oserror()
+    return copied
+
+def copy_range(src, dst, src_offset, dst_offset, length,
+               bufsize=FILEIO_BUFFER_SIZE):
+    """
+    Copy length bytes from src_offset in one file to dst_offset in
+    another, using copy_file_range and falling back to reading and
+    writing through a buffer when the kernel cannot copy between them.
+
+    @param src: file object or RangeReader to copy from
+    @param dst: file object to copy to, open for writing
+    @return: number of bytes copied, less than length if src is shorter
+    """
+    if hasattr(src, 'flush'):
+        src.flush()
+    dst.flush()
+    copied = 0
+    src_fd = fileno(src)
+    dst_fd = fileno(dst)
+    try:
+        while src_fd is not None and dst_fd is not None and copied < length:
+            count = copy_file_range(src_fd, dst_fd, length - copied,
+                                    src_offset + copied, dst_offset + copied)
+            if count <= 0:
+                return copied
+            copied += count
+    except (OSError, IOError):
+        pass # not supported here, copy the rest by hand
+
+    while copied < length:
+        if isinstance(src, RangeReader):
+            buf = src.read_at(src_offset + copied, min(bufsize, length - copied))
+        else:
+            src.seek(src_offset + copied)
+            buf = src.read(min(bufsize, length - copied))
+        if not buf:
+            break
+        dst.seek(dst_offset + copied)
+        dst.write(buf)
+        copied += len(buf)
+    return copied
+
+def reflink_file(src, dst):
+    """
+    Make dst a copy-on-write clone of the whole of src, so no data is
+    copied until either file is changed. Only works on linux filesystems
+    that support reflinks (btrfs, XFS and others) within one filesystem.
+
+    @param src: file object to clone
+    @param dst: file object open for writing
+    @return: True if dst is now a clone of src
+    """
+    if not fcntl or not sys.platform.startswith('linux'):
+        return False
+    if fileno(src) is None or fileno(dst) is None:
+        return False
+    src.flush()
+    dst.flush()
+    try:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except (IOError, OSError):
+        return False
+    return True
+
+def block_size(f):
+    """ Block size of the filesystem an open file lives on """
+    fd = fileno(f)
+    if fd is None:
+        return 0
+    try:
+        return os.fstatvfs(fd).f_bsize
+    except (AttributeError, OSError):
+        return 0
+
+def resize_range(f, offset, delta):
+    """
+    Insert delta bytes of zeros at offset, or remove -delta bytes from
+    offset if delta is negative, without copying the data after it. The
+    filesystem just remaps its blocks, so this only works on linux
+    filesystems that support it (ext4, XFS) and offset and delta must be
+    multiples of block_size().
+
+    @param f: file object open for writing
+    @return: True if the file was changed, False if it isn't supported
+    """
+    c = libc()
+    if not c or not hasattr(c, 'fallocate64') or not delta:
+        return False
+    if fileno(f) is None:
+        return False
+
+    if delta > 0:
+        mode = FALLOC_FL_INSERT_RANGE
+    else:
+        mode = FALLOC_FL_COLLAPSE_RANGE
+    f.flush()
+    if c.fallocate64(f.fileno(), mode, offset, abs(delta)) != 0:
+        return False
+    f.seek(offset) # drop anything buffered from before the change
+    return True
@@ -8,8 +8,9 @@ __revision__ = "$Id: $"
 
 from tagger.exceptions import *
 from tagger.constants import *
+from tagger.fileio import *
 
-import struct, os
+import struct, os, types, StringIO
 
 class ID3v1(object):
     """
@@ -24,7 +25,15 @@ class ID3v1(object):
     id3v1 = ID3v1('some.mp3')
     id3v1.track = 1
     print id3v1.songname
-    del id3v1
+    id3v1.close()
+
+    or as a context manager:
+
+    with ID3v1('some.mp3') as id3v1:
+        print id3v1.songname
+
+    A closed or detached tag keeps its fields and reopens the file by
+    name to commit.
     
     @ivar songname: the songname in iso8859-1
     @type songname: string
@@ -43,107 +52,219 @@ class ID3v1(object):
 
 
     @ivar read_only: file is read only
+    @ivar reader: reads byte ranges of the file for the parser, None
+                  once the tag is closed
+    @type reader: RangeReader
     """
 
     __f = None
+    __owns_file = False
+    reader = None
     __tag = None
     __filename = None
+    __exists = False
 
-    def __init__(self, filename):
+    def __init__(self, filename, fileobj=None, detach=False):
         """
         constructor
 
         tries to load the id3v1 data from the filename given. if it succeeds it
         will set the tag_exists parameter.
 
-        @param filename: filename
-        @type filename: string
-        @param mode: ID3_FILE_{NEW,READ,MODIFY}
-        @type mode: constant
+        @param filename: filename, or a seekable file-like object (StringIO,
+                         BytesIO, an open file) to read and write, or a
+                         RangeReader to read the tag from only
+        @type filename: string, file or RangeReader
+        @param fileobj: already open file for filename to use instead of
+                        opening it. It is left open when the tag goes away.
+        @type fileobj: file
+        @param detach: close the file as soon as the tag is parsed
+        @type detach: boolean
         """
 
-        if not os.path.exists(filename):
+        if isinstance(filename, RangeReader):
+            self.reader = filename
+            self.read_only = True
+            filename = None
+        elif hasattr(filename, 'read'):
+            fileobj = filename
+            filename = getattr(fileobj, 'name', None)
+        elif not os.path.exists(filename):
             raise ID3ParameterException("File not found: %s" % filename)
 
-        try:
-            self.__f = open(filename, 'rb+')
-            self.read_only = False
-        except IOError, (errno, strerr):
-            if errno == 13: # permission denied
-                self.__f = open(filename, 'rb')
-                self.read_only = True
-            else:
-                raise
+        if fileobj:
+            self.__f = fileobj
+            self.read_only = is_read_only(fileobj)
+            self.__owns_file = False
+        elif filename:
+            self.__f, self.read_only = open_file(filename)
+            self.__owns_file = True
+
+        if self.__f:
+            self.reader = file_reader(self.__f)
         
         self.__filename = filename
         self.__tag = self.default_tags()
         
         if self.tag_exists():
             self.parse()
+
+        if detach:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Close the file if the tag opened it and drop the reader. The
+        fields stay readable and writable, committing reopens the file.
+        A file passed in by the caller is left open.
+        """
+        if self.reader:
+            try:
+                self.__exists = self.tag_exists()
+            except (IOError, OSError, ValueError):
+                pass # the caller closed the file already
+        if self.__f and self.__owns_file:
+            self.__f.close()
+        self.__f = None
+        self.reader = None
+        self.__owns_file = False
+
+    def __reopen(self):
+        """ Reopen the file of a closed tag, returns whether it was closed """
+        if self.reader:
+            return False
+        if not self.__filename:
+            raise ID3Exception("tag is closed and has no file to reopen")
+        self.__f, self.read_only = open_file(self.__filename)
+        self.__owns_file = True
+        self.reader = file_reader(self.__f)
+        return True
                     
+    def from_bytestring(cls, data):
+        """
+        Read the tag of an MP3 held in memory. Changes are committed to an
+        in-memory copy.
+
+        @param data: the MP3 file contents, or just its last 128 bytes
+        @type data: string
+        """
+        return cls(StringIO.StringIO(data))
+    from_bytestring = classmethod(from_bytestring)
+
     def default_tags(self):
         return { 'songname':'', 'artist':'', 'album':'', 
                  'year':'', 'comment':'', 'genre':0, 'track':0}
     
     def tag_exists(self):
-        self.__f.seek(-128, 2)
-        if self.__f.read(3) == 'TAG':
+        if self.reader is None:
+            return self.__exists
+        size = self.reader.size()
+        if size < ID3V1_TAG_LENGTH:
+            return False
+        if self.reader.read_at(size - ID3V1_TAG_LENGTH, 3) == 'TAG':
             return True
         return False
         
     def remove_and_commit(self):
         """ Remove ID3v1 Tag """
-        if self.tag_exists() and not self.read_only:
-            self.__f.seek(-128, 2)
-            self.__f.truncate()
-            self.__f.flush()
-            self.__tag = self.default_tags()
-            return True
-        else:
-            return False
+        reopened = self.__reopen()
+        try:
+            if self.tag_exists() and not self.read_only:
+                self.__f.seek(-128, 2)
+                self.__f.truncate()
+                self.__f.flush()
+                self.reader.clear()
+                self.__tag = self.default_tags()
+                file_changed(self.__filename)
+                return True
+            else:
+                return False
+        finally:
+            if reopened:
+                self.close()
 
-    def commit(self):
-        id3v1 = struct.pack("!3s30s30s30s4s30sb",
+    def output(self):
+        """ Bytestring of the 128 byte ID3v1 tag """
+        comment = self.comment
+        if self.track:
+            # ID3v1.1: the track number takes the last byte of the comment
+            comment = struct.pack("!28sxB", comment, self.track)
+        return struct.pack("!3s30s30s30s4s30sb",
             'TAG',
             self.songname,
             self.artist,
             self.album,
             self.year,
-            self.comment,
+            comment,
             self.genre)
-    
-        if self.tag_exists():
-            self.__f.seek(-128, 2)
-            self.__f.truncate()
-        else:
-            self.__f.seek(0, 2)
-        
-        self.__f.write(id3v1)
-        self.__f.flush()
+
+    def commit(self):
+        reopened = self.__reopen()
+        try:
+            if self.read_only:
+                return False
+
+            id3v1 = self.output()
+
+            if self.tag_exists():
+                self.__f.seek(-128, 2)
+                self.__f.truncate()
+            else:
+                self.__f.seek(0, 2)
+
+            self.__f.write(id3v1)
+            self.__f.flush()
+            self.reader.clear()
+            file_changed(self.__filename)
+        finally:
+            if reopened:
+                self.close()
 
     def commit_to_file(self, filename):
-        id3v1 = struct.pack("!3s30s30s30s4s30sb",
-            'TAG',
-            self.songname,
-            self.artist,
-            self.album,
-            self.year,
-            self.comment,
-            self.genre)
-    
-        f = open(filename, 'wb+')
-        self.__f.seek(0)
-        buf = self.__f.read(4096)
-        while buf:
-            f.write(buf)
-            buf = self.__f.read(4096)
-            
+        """
+        Write a copy of this file with the tag to filename. The copy is a
+        reflink clone where the filesystem allows, otherwise the mp3 data
+        is copied with copy_file_range or through a buffer.
+
+        @param filename: file to create or overwrite, or a file-like
+                         object to write the tagged stream to
+        @type filename: string or file
+        """
+        reopened = self.__reopen()
+        try:
+            self.__commit_to_file(filename)
+        finally:
+            if reopened:
+                self.close()
+        file_changed(filename)
+
+    def __commit_to_file(self, filename):
+        id3v1 = self.output()
+
+        end = self.reader.size()
         if self.tag_exists():
-            f.seek(-128, 0)
+            end -= ID3V1_TAG_LENGTH
+    
+        if hasattr(filename, 'write'):
+            f = filename
+        else:
+            f = open(filename, 'wb+')
+        try:
+            if not self.__f or not reflink_file(self.__f, f):
+                copy_range(self.__f or self.reader, f, 0, 0, end)
+            f.seek(end)
+            f.write(id3v1)
             f.truncate()
-        
-        f.write(id3v1)
-        f.close()
+        finally:
+            if f is not filename:
+                f.close()
         
 
     def __getattr__(self, name):
@@ -154,27 +275,25 @@ class ID3v1(object):
 
     def __setattr__(self, name, value):
         if self.__tag and self.__tag.has_key(name):
-            if name == 'genre' and type(value) != types.IntValue:
+            if name == 'genre' and type(value) != types.IntType:
                 raise TypeError, "genre should be an integer"
-            if name == 'track' and type(value) != types.IntValue:
+            if name == 'track' and type(value) != types.IntType:
                 raise TypeError, "track should be an integer"
             if name == 'year':
-                self.__tag[name] = str(value)[:4]
+                value = str(value)[:4]
             self.__tag[name] = value
         else:
             object.__setattr__(self, name, value)
 
     def __del__(self):
-        if self.__f:
-            self.__f.close()
+        self.close()
 
     def parse(self):
-        try:
-            self.__f.seek(-128, 2)
-        except IOError:
+        size = self.reader.size()
+        if size < ID3V1_TAG_LENGTH:
             raise ID3HeaderInvalidException("not enough bytes")
             
-        id3v1 = self.__f.read(128)
+        id3v1 = self.reader.read_at(size - ID3V1_TAG_LENGTH, ID3V1_TAG_LENGTH)
         
         tag, songname, artist, album, year, comment, genre = \
              struct.unpack("!3s30s30s30s4s30sb", id3v1)
@@ -184,7 +303,7 @@ class ID3v1(object):
         else:
             if comment[28] == '\x00':
                 track = ord(comment[29])
-                comment = comment[0:27]
+                comment = comment[0:28]
             else:
                 track = 0
 
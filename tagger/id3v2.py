@@ -10,9 +10,10 @@ from tagger.exceptions import *
 from tagger.constants import *
 from tagger.id3v2frame import *
 from tagger.utility import *
+from tagger.fileio import *
 from tagger.debug import *
 
-import os, struct, sys, types, tempfile, math
+import os, struct, sys, types, tempfile, math, mmap, StringIO
 
 class ID3v2:
     """
@@ -34,27 +35,64 @@ class ID3v2:
     @ivar frames: list of frames that is in the tag
     @type frames: dictionary of ID3v2*Frame(s)
 
+    @ivar corrupt_frames: why each frame left out of frames because its \
+                          data could not be parsed was dropped
+    @type corrupt_frames: list of strings
+
     @ivar version: version this tag supports
     @type version: float (2.2, 2.3, 2.4)
 
+    @ivar reader: reads byte ranges of the file for the parser, None \
+                  once the tag is closed
+    @type reader: RangeReader
+
+    @note: the file stays open until close() is called or the tag is \
+           used as a context manager:
+
+    with ID3v2('some.mp3') as tag:
+        print tag.frames
+
+    Closed or detached tags keep their parsed frames and reopen the file \
+    by name for commit() and commit_to_file().
+
     @todo: parse/write footers
     @todo: parse/write appended tags
     @todo: parse/write ext header
 
     """
     f = None
+    reader = None
+    _owns_file = False
+    _frames_offset = ID3V2_FILE_HEADER_LENGTH
     supported = ('2.2', '2.3', '2.4')
+    _rawheader = None
+    _parsed_frames = ()
+    _exists = False
+    corrupt_frames = ()
     
     # ---------------------------------------------------------
-    def __init__(self, filename, version=ID3V2_DEFAULT_VERSION):
+    def __init__(self, filename, version=ID3V2_DEFAULT_VERSION, fileobj=None,
+                 detach=False):
         """
-        @param filename: the file to open or write to.
-        @type filename: string
+        @param filename: the file to open or write to, or a seekable \
+                         file-like object (StringIO, BytesIO, an open \
+                         file) to read the tag from and write it to, or \
+                         a RangeReader to read the tag from only.
+        @type filename: string, file or RangeReader
 
         @param version: if header doesn't exists, we need this to tell us what version \
                         header to use
         @type version: float
 
+        @param fileobj: already open file for filename to use instead of \
+                        opening it. It is left open when the tag goes away.
+        @type fileobj: file
+
+        @param detach: close the file as soon as the tag is parsed, so \
+                       that the tag can be kept around without holding \
+                       a file descriptor.
+        @type detach: boolean
+
         @raise ID3Exception: if file does not have an ID3v2 but is specified
         to be in read or modify mode.
         """
@@ -62,17 +100,26 @@ class ID3v2:
         if str(version) not in self.supported:
             raise ID3ParameterException("version %s not valid" % str(version))
 
-        if not os.path.exists(filename):
+        if isinstance(filename, RangeReader):
+            self.reader = filename
+            self.read_only = True
+            filename = None
+        elif hasattr(filename, 'read'):
+            fileobj = filename
+            filename = getattr(fileobj, 'name', None)
+        elif not os.path.exists(filename):
             raise ID3ParameterException("filename %s not valid" % filename)
-        
-        try:
-          self.f = open(filename, 'rb+')
-          self.read_only = False
-        except IOError, (errno, strerror):
-            if errno == 13: # permission denied
-                self.f = open(filename, 'rb')
-                self.read_only = True
 
+        if fileobj:
+            self.f = fileobj
+            self.read_only = is_read_only(fileobj)
+            self._owns_file = False
+        elif filename:
+            self.f, self.read_only = open_file(filename)
+            self._owns_file = True
+
+        if self.f:
+            self.reader = file_reader(self.f)
         self.filename = filename
 
         if self.tag_exists():
@@ -80,10 +127,60 @@ class ID3v2:
             self.parse_frames()
         else:
             self.new_header(str(version))
+
+        if detach:
+            self.close()
             
     def __del__(self):
-        if self.f:
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    # ---------------------------------------------------------
+    def close(self):
+        """
+        Close the file if the tag opened it and drop the reader. The parsed
+        tag stays usable, commit() and commit_to_file() reopen the file by
+        name. A file passed in by the caller is left open.
+        """
+        if self.reader:
+            try:
+                self._exists = self.tag_exists()
+            except (IOError, OSError, ValueError):
+                pass # the caller closed the file already
+        if self.f and self._owns_file:
             self.f.close()
+        self.f = None
+        self.reader = None
+        self._owns_file = False
+
+    def _reopen(self):
+        """ Reopen the file of a closed tag, returns whether it was closed """
+        if self.reader:
+            return False
+        if not self.filename:
+            raise ID3Exception("tag is closed and has no file to reopen")
+        self.f, self.read_only = open_file(self.filename)
+        self._owns_file = True
+        self.reader = file_reader(self.f)
+        return True
+
+    # ---------------------------------------------------------
+    def from_bytestring(cls, data, version=ID3V2_DEFAULT_VERSION):
+        """
+        Read the tag of an MP3 held in memory. Changes are committed to an
+        in-memory copy, which the f attribute gives access to.
+
+        @param data: the MP3 file contents, or just its tag
+        @type data: string
+        """
+        return cls(StringIO.StringIO(data), version)
+    from_bytestring = classmethod(from_bytestring)
 
     # ---------------------------------------------------------
     # query functions
@@ -95,7 +192,7 @@ class ID3v2:
             return 0
         else:
             if str(self.version) in ('2.2', '2.3', '2.4'):
-                if self.tag["footer"]:
+                if self.tag.get("footer"):
                     return ID3V2_FILE_HEADER_LENGTH + \
                            ID3V2_FILE_FOOTER_LENGTH + \
                            self.tag["size"]
@@ -103,8 +200,9 @@ class ID3v2:
     
     # ---------------------------------------------------------
     def tag_exists(self):
-        self.f.seek(0)
-        if self.f.read(3) == 'ID3':
+        if self.reader is None:
+            return self._exists
+        if self.reader.read_at(0, 3) == 'ID3':
             return True
         return False
 
@@ -115,13 +213,10 @@ class ID3v2:
 
         @todo: dump footer and extension header as well
         """
-        old_pos = self.f.tell()
         output = ''
         if self.tag["size"]:
-            self.f.seek(0)
-            output = self.f.read(ID3V2_FILE_HEADER_LENGTH + self.tag["size"])
-            self.f.seek(old_pos)
-            
+            output = self.reader.read_at(0, ID3V2_FILE_HEADER_LENGTH + \
+                                         self.tag["size"])
         return output
 
 
@@ -147,17 +242,12 @@ class ID3v2:
         self.version = str(version)
 
     # ---------------------------------------------------------
-    def _read_null_bytes(self):
+    def _read_null_bytes(self, data, pos):
         """
-        Count the number of null bytes at the specified file pointer
+        Count the number of null bytes at the specified position
         """
-        nullbuffer = 0
-        while 1:
-            if self.f.read(1) == '\x00':
-                nullbuffer += 1
-            else:
-                break
-        return nullbuffer
+        rest = data[pos:]
+        return len(rest) - len(rest.lstrip('\x00'))
 
 
     # ---------------------------------------------------------
@@ -196,13 +286,15 @@ class ID3v2:
         Parse Header of the file
 
         """
-        self.f.seek(0)
-        data = self.f.read(ID3V2_FILE_HEADER_LENGTH)
+        data = self.reader.read_at(0, ID3V2_FILE_HEADER_LENGTH)
         if len(data) != ID3V2_FILE_HEADER_LENGTH:
             raise ID3HeaderInvalidException("ID3 tag header is incomplete")
         
         self.tag = {}
         self.frames = []
+        self.corrupt_frames = []
+        self._rawheader = data
+        self._frames_offset = ID3V2_FILE_HEADER_LENGTH
         id3, ver, flags, rawsize = struct.unpack("!3sHB4s", data)
         
         if id3 != "ID3":
@@ -233,29 +325,35 @@ class ID3v2:
     def parse_ext_header(self):
         """ Parse Extension Header """
 
-        # seek to the extension header position
-        self.f.seek(ID3V2_FILE_HEADER_LENGTH)
-        data = self.f.read(ID3V2_FILE_EXTHEADER_LENGTH)
+        # read from the extension header position
+        pos = ID3V2_FILE_HEADER_LENGTH
+        data = self.reader.read_at(pos, ID3V2_FILE_EXTHEADER_LENGTH)
         extsize, flagbytes = struct.unpack("!4sB", data)
         extsize = unsyncsafe(extsize)
+        pos += ID3V2_FILE_EXTHEADER_LENGTH
         readdata = 0
         if flagbytes == 1:
-            flags = struct.unpack("!B",self.f.read(flagbytes))[0]
+            flags = struct.unpack("!B",self.reader.read_at(pos, flagbytes))[0]
+            pos += flagbytes
             self.tag["update"] = ( flags & 0x40 ) >> 6
             if ((flags & 0x20) >> 5):
-                self.tag["crc"] = unsyncsafe(self.f.read(5))
+                self.tag["crc"] = unsyncsafe(self.reader.read_at(pos, 5))
+                pos += 5
                 readdata += 5
             if ((flags & 0x10) >> 4):
-                self.tag["restrictions"] = struct.unpack("!B", self.f.read(1))[0]
+                self.tag["restrictions"] = \
+                    struct.unpack("!B", self.reader.read_at(pos, 1))[0]
                 # FIXME: store these restrictions properly
+                pos += 1
                 readdata += 1
                 
             # work around dodgy ext headers created by libid3tag
             if readdata < extsize - ID3V2_FILE_EXTHEADER_LENGTH - flagbytes:
-                self.f.read(extsize - ID3V2_FILE_EXTHEADER_LENGTH - flagbytes - readdata)
+                pos += extsize - ID3V2_FILE_EXTHEADER_LENGTH - flagbytes - readdata
         else:
             # ignoring unrecognised extension header
-            self.f.read(extsize - ID3V2_FILE_EXTHEADER_LENGTH)
+            pos += extsize - ID3V2_FILE_EXTHEADER_LENGTH
+        self._frames_offset = pos
         return 1
     
     # ---------------------------------------------------------
@@ -271,11 +369,17 @@ class ID3v2:
         """ Recursively Parse Frames """
         read = 0
         readframes = 0
+
+        # fetch the rest of the tag in one go and parse it from memory
+        start = self._frames_offset
+        data = self.reader.read_at(start, ID3V2_FILE_HEADER_LENGTH + \
+                                   self.tag["size"] - start)
         
         while read < self.tag["size"]:
-            framedata = self.get_next_frame(self.tag["size"] - read)
+            framedata = self.get_next_frame(data, read)
             if framedata:
                 try:
+                    offset = start + read
                     read += len(framedata)
                     if self.version == '2.2':
                         frame = ID3v2_2_Frame(frame=framedata)
@@ -284,11 +388,23 @@ class ID3v2:
                     elif self.version == '2.4':
                         frame = ID3v2_4_Frame(frame=framedata)
                     readframes += 1
+                    frame.offset = offset
                     self.frames.append(frame)
                 except ID3Exception:
                     pass # ignore unrecognised frames
+                except Exception, e:
+                    # a frame with corrupt data must not take the rest of
+                    # the tag down with it: drop it and say so
+                    if self.version == '2.2':
+                        fid = framedata[:3]
+                    else:
+                        fid = framedata[:4]
+                    error = "corrupt %s frame: %s: %s" % \
+                            (fid, e.__class__.__name__, e)
+                    debug(error)
+                    self.corrupt_frames.append(error)
             else:
-                self.tag["padding"] = self._read_null_bytes()
+                self.tag["padding"] = self._read_null_bytes(data, read)
                 debug("NULL Padding: %d" % self.tag["padding"])
                 break
 
@@ -298,24 +414,30 @@ class ID3v2:
             
         if self.tag["size"] != read + self.tag["padding"]:
             self.tag["size"] = read + self.tag["padding"]
-            
+
+        self._parsed_frames = self.frames[:]
         return len(self.frames)
 
     # ---------------------------------------------------------
-    def get_next_frame(self, search_length):
+    def get_next_frame(self, data, pos):
+        """
+        Return the bytes of the frame starting at pos in data, or an empty
+        string at padding or the end of the tag
+        """
 
         # skip null frames
-        c = self.f.read(1)
-        self.f.seek(-1, 1)
-        if c == '\x00':
+        c = data[pos:pos + 1]
+        if c == '\x00' or not c:
             return '' # check for NULL frames
         
-        hdr = self.f.read(ID3V2_HEADER_LEN[self.version])
+        hdrlen = ID3V2_HEADER_LEN[self.version]
+        hdr = data[pos:pos + hdrlen]
+        if len(hdr) != hdrlen:
+            return ''
         size = ID3V2_DATA_LEN[self.version](hdr)
         if size > self.tag["size"]:
             return '' # # we should actually just abort here...
-        data = self.f.read(size)
-        return hdr + data
+        return data[pos:pos + hdrlen + size]
 
     # ---------------------------------------------------------     
     def construct_header(self, size):
@@ -358,112 +480,360 @@ class ID3v2:
         
     # ---------------------------------------------------------     
     def commit_to_file(self, filename):
-        newf = open(filename, 'wb+')
+        """
+        Write the tag followed by the mp3 data of this file to a new file,
+        leaving this file untouched.
+
+        If the frames fit in the space of the existing tag, the new file
+        starts out as a reflink clone of this one where the filesystem
+        allows it and only the tag is written. Otherwise the mp3 data is
+        copied with copy_file_range, or through a buffer if that fails.
+
+        @param filename: file to create or overwrite, or a file-like \
+                         object to write the tagged stream to
+        @type filename: string or file
+        """
+        reopened = self._reopen()
+        try:
+            self._commit_to_file(filename)
+        finally:
+            if reopened:
+                self.close()
+        file_changed(filename)
+
+    def _commit_to_file(self, filename):
         framesstring = ''.join(map(lambda x: x.output(), self.frames))
         footerstring = ''
         extstring = ''
-        
-        # backup existing mp3 data 
-        self.f.seek(self.mp3_data_offset())
-        t = tempfile.TemporaryFile()
-        buf = self.f.read(1024)
-        while buf:
-            t.write(buf)
-            buf = self.f.read(1024)
-
         tag_content_size = len(extstring) + len(framesstring)
-        headerstring = self.construct_header(tag_content_size + \
-                                              ID3V2_FILE_DEFAULT_PADDING)
-        
-        newf.write(headerstring)
-        newf.write(extstring)
-        newf.write(framesstring)
-        newf.write('\x00' * ID3V2_FILE_DEFAULT_PADDING)
-        newf.write(footerstring)
-        t.seek(0)
-        buf = t.read(1024)
-        while buf:
-            newf.write(buf)
-            buf = t.read(1024)
-        t.close()
-        newf.close()
+
+        offset = self.mp3_data_offset()
+        end = self.reader.size()
+
+        if hasattr(filename, 'write'):
+            newf = filename
+        else:
+            newf = open(filename, 'wb+')
+        try:
+            size = self.new_size(tag_content_size)
+            if size != self.tag["size"] or not self.tag_exists() or \
+                   not self.f or not reflink_file(self.f, newf):
+                size = tag_content_size + ID3V2_FILE_DEFAULT_PADDING
+                copy_range(self.f or self.reader, newf, offset,
+                           ID3V2_FILE_HEADER_LENGTH + size, end - offset)
+
+            newf.seek(0)
+            newf.write(self.construct_header(size))
+            newf.write(extstring)
+            newf.write(framesstring)
+            newf.write('\x00' * (size - tag_content_size))
+            newf.write(footerstring)
+        finally:
+            if newf is not filename:
+                newf.close()
+
+    # ---------------------------------------------------------
+    def output(self):
+        """
+        Bytestring of the whole tag as commit() would write it: header,
+        frames and padding. Nothing is written to the file.
+        """
+        framesstring = ''.join(map(lambda x: x.output(), self.frames))
+        size = self.new_size(len(framesstring))
+        return self.construct_header(size) + framesstring + \
+               '\x00' * (size - len(framesstring))
+
+    # ---------------------------------------------------------
+    def _frame_patches(self, framestrings):
+        """
+        Work out which frames can be written back over their old bytes.
+
+        Only possible when the frames are the ones that were parsed, in
+        the same order, each with its original length, and the tag header
+        is unchanged.
+
+        @param framestrings: output() of each frame in self.frames
+        @type framestrings: list of strings
+        @return: list of (offset, bytestring) to write, or None if the
+                 tag has to be written out as a whole.
+        """
+        if not self._rawheader or \
+               len(self.frames) != len(self._parsed_frames):
+            return None
+        if self.construct_header(self.tag["size"]) != self._rawheader:
+            return None
+
+        patches = []
+        for frame, parsed, output in zip(self.frames, self._parsed_frames,
+                                         framestrings):
+            if frame is not parsed or frame.offset is None:
+                return None
+            original = frame.rawheader + frame.rawdata
+            if len(output) != len(original):
+                return None
+            if output != original:
+                patches.append((frame.offset, output))
+        return patches
+
+    # ---------------------------------------------------------
+    def _update_layout(self, headerstring, extstring, framestrings):
+        """
+        Record where each frame now lives in the file after a commit.
+        """
+        offset = len(headerstring) + len(extstring)
+        for frame, output in zip(self.frames, framestrings):
+            frame.offset = offset
+            frame.rawheader = output[:frame.header_length]
+            frame.rawdata = output[frame.header_length:]
+            offset += len(output)
+        self._rawheader = headerstring
+        self._parsed_frames = self.frames[:]
 
     # ---------------------------------------------------------
-    def commit(self, pretend=False):
+    def new_size(self, tag_content_size=None):
+        """
+        Size the tag will have once committed, excluding header and
+        footer. This is the current size if the frames fit in it,
+        otherwise enough for the frames plus the default padding.
+
+        @param tag_content_size: bytes of extension header and frames, \
+                                 worked out from self.frames if not given
+        @type tag_content_size: int
+        """
+        if tag_content_size is None:
+            tag_content_size = 0
+            for frame in self.frames:
+                tag_content_size += len(frame.output())
+
+        if self.tag_exists() and self.tag["size"] >= tag_content_size:
+            return self.tag["size"]
+        return tag_content_size + ID3V2_FILE_DEFAULT_PADDING
+
+    # ---------------------------------------------------------
+    def make_room(self, size, end=None):
+        """
+        Resize the space the tag takes up at the start of the file to at
+        least size bytes, then write a tag header for the new size.
+
+        Where the filesystem can insert or remove whole blocks at the
+        start of a file (fallocate on ext4 and XFS), the change is rounded
+        to the block size, the padding absorbs the difference and the mp3
+        data is not moved at all. Otherwise the mp3 data is moved in
+        place, copied once. A tag is never shrunk by less than a block,
+        which would move the mp3 data without freeing any disk space.
+
+        @param size: new tag size, excluding header and footer
+        @type size: int
+        @param end: file offset where the data to move ends. Defaults to \
+                    the end of the file, which is truncated if it shrinks.
+        @type end: int
+        """
+        if self.tag_exists():
+            start = ID3V2_FILE_HEADER_LENGTH + self.tag["size"]
+            delta = size - self.tag["size"]
+        else:
+            start = 0
+            delta = ID3V2_FILE_HEADER_LENGTH + size
+
+        # move by whole blocks: adding -delta % blocksize rounds a growth
+        # up to the next block and a shrink toward zero, so growing always
+        # makes enough room and shrinking never takes more than is free
+        blocks = 0
+        blocksize = block_size(self.f)
+        if blocksize and delta:
+            blocks = delta + (-delta % blocksize)
+
+        if delta < 0 and blocksize and not blocks:
+            # giving back less than a block frees no disk space, keep it
+            # as padding rather than move all of the mp3 data for it
+            debug("make_room: keeping %d bytes as padding" % -delta)
+            size -= delta
+        elif blocks and resize_range(self.f, 0, blocks):
+            debug("make_room: %d bytes by fallocate" % blocks)
+            size += blocks - delta
+        else:
+            truncate = end is None
+            if end is None:
+                self.f.seek(0, 2)
+                end = self.f.tell()
+            shift_data(self.f, start, end, delta)
+            if truncate and delta < 0:
+                self.f.truncate(end + delta)
+
+        self.tag["size"] = size
+        self.f.seek(0)
+        self.f.write(self.construct_header(size))
+        self.f.flush()
+        self.reader.clear()
+        self._rawheader = None
+
+    # ---------------------------------------------------------
+    def commit(self, pretend=False, shrink=False):
         """ Commit Changes to MP3. This means writing to file.
         Will fail if file is not writable
         
         @param pretend: boolean
         @type pretend: Do not actually write to file, but pretend to.
+        @param shrink: boolean
+        @type shrink: Give back padding beyond the default amount.
         """
-        
+        reopened = self._reopen()
+        try:
+            result = self._commit(pretend, shrink)
+        finally:
+            if reopened:
+                self.close()
+        if not pretend and result is not False:
+            file_changed(self.filename)
+        return result
+
+    def _commit(self, pretend, shrink):
         if self.read_only:
             return False # give up if it's readonly - don't bother!
             
         # construct frames, footers and extensions
-        framesstring = ''.join(map(lambda x: x.output(), self.frames))
+        framestrings = [frame.output() for frame in self.frames]
+        framesstring = ''.join(framestrings)
         footerstring = ''
         extstring = ''
+
+        # frames edited without changing their length are written back
+        # over their own bytes, leaving the rest of the tag alone
+        if not shrink and \
+           not (self.tag.has_key("ext") and self.tag["ext"]) and \
+           not (self.tag.has_key("footer") and self.tag["footer"]):
+            patches = self._frame_patches(framestrings)
+            if patches is not None:
+                if not pretend:
+                    for offset, output in patches:
+                        self.f.seek(offset)
+                        self.f.write(output)
+                    self.f.flush()
+                    self.reader.clear()
+                    warn("Patched Frames: %d" % len(patches))
+                    self._update_layout(self._rawheader, '', framestrings)
+                return
         
         if self.tag.has_key("ext") and self.tag["ext"]:
             extstring = self.construct_ext_header()
         if self.tag.has_key("footer") and self.tag["footer"]:
             footerstring = self.construct_footer()
 
-        
 
         # make sure there is enough space from start of file to
-        # end of tag, otherwise realign tag
+        # end of tag, otherwise move the mp3 data along to make room
         tag_content_size = len(extstring) + len(framesstring)
-                
-        if self.tag["size"] < tag_content_size:
-            headerstring = self.construct_header(tag_content_size + \
-                                                  ID3V2_FILE_DEFAULT_PADDING)
-            
-            # backup existing mp3 data 
-            self.f.seek(self.mp3_data_offset())
-            t = tempfile.TemporaryFile()
-            buf = self.f.read(1024)
-            while buf:
-                t.write(buf)
-                buf = self.f.read(1024)
-                
-            # write to a new file
-            if not pretend:
-                self.f.close()
-                self.f = open(self.filename, 'wb+')
-                self.f.write(headerstring)
-                self.f.write(extstring)
-                self.f.write(framesstring)
-                self.f.write('\x00' * ID3V2_FILE_DEFAULT_PADDING)
-                self.f.write(footerstring)
-                
-                # write mp3 data to new file
-                t.seek(0)
-                buf = t.read(1024)
-                while buf:
-                    self.f.write(buf)
-                    buf = t.read(1024)
-                t.close()
-                self.f.close()
-                
-                self.f = open(self.filename, 'rb+')
-                self.tag["size"] = len(headerstring) + len(extstring) + \
-                                   ID3V2_FILE_DEFAULT_PADDING
-            
-        else:
-            headerstring = self.construct_header(self.tag["size"])
-            if not pretend:
-                self.f.seek(0)
-                self.f.write(headerstring)
-                self.f.write(extstring)
-                self.f.write(framesstring)
-                written = len(extstring) + len(framesstring)
-                warn("Written Bytes: %d" % written)
-                # add padding
-                self.f.write('\x00' * (self.tag["size"] - written))
-                # add footerstring
-                self.f.write(footerstring)
-                self.f.flush()
-
-    
+        size = self.new_size(tag_content_size)
+        if shrink:
+            size = min(size, tag_content_size + ID3V2_FILE_DEFAULT_PADDING)
+        if pretend:
+            return
+        if size != self.tag["size"] or not self.tag_exists():
+            self.make_room(size)
+
+        headerstring = self.construct_header(self.tag["size"])
+        self.f.seek(0)
+        self.f.write(headerstring)
+        self.f.write(extstring)
+        self.f.write(framesstring)
+        written = len(extstring) + len(framesstring)
+        warn("Written Bytes: %d" % written)
+        # add padding
+        self.f.write('\x00' * (self.tag["size"] - written))
+        # add footerstring
+        self.f.write(footerstring)
+        self.f.flush()
+        self.reader.clear()
+        self.tag["padding"] = self.tag["size"] - written
+        self._update_layout(headerstring, extstring, framestrings)
+
+# ---------------------------------------------------------
+_frame_flags = struct.Struct("!H").unpack
+
+# frame flags (as iter_frames() gives them) of payloads that are not
+# stored as they are: compressed, encrypted, unsynchronised or with a
+# data length, and grouped frames, whose payload starts with a group byte
+ID3V2_ENCODED_FRAME_FLAGS = {'2.2': 0, '2.3': 0x00e0, '2.4': 0x004f}
+
+def iter_frames(source, offset=0):
+    """
+    Walk the frame headers of an ID3v2 tag, yielding
+    (fid, payload offset, payload size, flags) for each frame.
+
+    Only the tag header, the extended header size and the frame headers
+    are looked at; no frame objects are made and no payloads are read.
+    Offsets are absolute in source. flags are the two flag bytes of a
+    2.3/2.4 frame header as an int, 0 for 2.2.
+
+    for fid, offset, size, flags in iter_frames(open('some.mp3', 'rb')):
+        print fid, offset, size
+
+    @param source: the file or its start as a string, buffer or mmap, \
+                   or an open file, which is mmapped if possible
+    @type source: string, mmap or file
+    @param offset: where the tag starts in source
+    @type offset: int
+    @raise ID3HeaderInvalidException: if the version is not supported
+    """
+    mapped = None
+    data = source # sliced directly, unless it is a file
+    if hasattr(source, 'read') and not isinstance(source, mmap.mmap):
+        fd = fileno(source)
+        if fd is not None:
+            try:
+                mapped = data = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                pass # empty file or not mappable
+        if mapped is None:
+            data = None
+
+    def read_at(pos, length):
+        if data is not None:
+            return data[pos:pos + length]
+        source.seek(pos)
+        return source.read(length)
+
+    try:
+        header = read_at(offset, ID3V2_FILE_HEADER_LENGTH)
+        if len(header) != ID3V2_FILE_HEADER_LENGTH or header[:3] != 'ID3':
+            return
+        ver, flags, rawsize = struct.unpack("!3xHB4s", header)
+        version = '2.%d' % (ver >> 8)
+        if version not in ID3V2_HEADER_LEN:
+            raise ID3HeaderInvalidException("version %s not supported" %
+                                            version)
+        pos = offset + ID3V2_FILE_HEADER_LENGTH
+        end = pos + unsyncsafe(rawsize)
+
+        if version != '2.2' and flags & 0x40: # extended header
+            extsize = read_at(pos, 4)
+            if len(extsize) != 4:
+                return
+            if version == '2.3':
+                pos += struct.unpack("!I", extsize)[0] + 4
+            else:
+                pos += unsyncsafe(extsize)
+
+        hdrlen = ID3V2_HEADER_LEN[version]
+        fidlen = ID3V2_FID_LEN[version]
+        get_size = ID3V2_DATA_LEN[version]
+        has_flags = hdrlen == ID3V2_3_FRAME_HEADER_LENGTH
+        while pos + hdrlen <= end:
+            if data is not None:
+                hdr = data[pos:pos + hdrlen]
+            else:
+                hdr = read_at(pos, hdrlen)
+            if len(hdr) != hdrlen or hdr[0] == '\x00':
+                break # padding
+            size = get_size(hdr)
+            start = pos + hdrlen
+            if start + size > end:
+                break # truncated frame
+            if has_flags:
+                yield hdr[:fidlen], start, size, _frame_flags(hdr[8:])[0]
+            else:
+                yield hdr[:fidlen], start, size, 0
+            pos = start + size
+    finally:
+        if mapped is not None:
+            mapped.close()
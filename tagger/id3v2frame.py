@@ -35,6 +35,8 @@ class ID3v2BaseFrame:
     
     @ivar fid: frame id code
     @ivar rawdata: rawdata of the rest of the frame minus the header
+    @ivar rawheader: raw frame header bytes the frame was parsed from
+    @ivar offset: file offset of the frame header, if parsed from a file
     @ivar length: length of the frame in bytes
     @ivar flags: dictionary of flags for this frame
 
@@ -52,7 +54,10 @@ class ID3v2BaseFrame:
     @ivar desc: for geob and URL
     @ivar url: for URL
     
-    @ivar counter: for playcount (PCNT)
+    @ivar counter: for playcount (PCNT) and popularimeter (POPM)
+    @ivar email: for popularimeter (POPM)
+    @ivar rating: for popularimeter (POPM)
+    @ivar counterlength: bytes used by the POPM counter, 0 if omitted
     """
     supported = {}
     header_length = 0
@@ -61,6 +66,8 @@ class ID3v2BaseFrame:
     
     fid = None
     rawdata = None
+    rawheader = None
+    offset = None
     length = 0
     flags = 0
     encoding = ''
@@ -73,6 +80,10 @@ class ID3v2BaseFrame:
     obj = None
     desc = ''
     url = ''
+    counter = 0
+    email = ''
+    rating = 0
+    counterlength = 0
 
     def __init__(self, frame=None, fid=None):
         """
@@ -218,11 +229,14 @@ class ID3v2BaseFrame:
             text = rawtext
             self.strings = text.split('\x00')
         else:
+            # once decoded, every encoding ends strings with one null
             text = rawtext.decode(self.encoding)
-            if is_double_byte(self.encoding):
-                self.strings = text.split('\x00\x00')               
-            else:
-                self.strings = text.split('\x00')
+            self.strings = text.split(u'\x00')
+
+        # drop the empty string left behind by the null terminator so
+        # that parsing and outputting a frame gives back the same bytes
+        if len(self.strings) > 1 and not self.strings[-1]:
+            self.strings.pop()
                 
         try:
             dummy = text.encode('utf_8')
@@ -277,14 +291,8 @@ class ID3v2BaseFrame:
         
 
     def o_pcnt(self):
-        counter = ''
-        if self.length == 4:
-            counter = struct.pack('!I', self.counter)
-        else:
-            for i in range(0, self.length):
-                x = (self.counter >> (i*8) ) & 0xff
-                counter = counter + struct.pack('!B',x)
-        return counter
+        # counter is at least 32 bits, widened when it no longer fits
+        return pack_counter(self.counter, max(self.length, 4))
      
     def x_pcnt(self):
         """
@@ -298,12 +306,40 @@ class ID3v2BaseFrame:
         if bytes == 4:
             counter = struct.unpack('!I',data)[0]
         else:
-            for i in range(0,bytes):
-                counter += struct.unpack('B',data[i]) * pow(256,i)
+            counter = unpack_counter(data)
                 
         debug('Read Field: %s Len: %d Count: %d' % (self.fid, bytes, counter))
         self.counter = counter
 
+    def o_popm(self):
+        output = self.email + '\x00' + chr(self.rating & 0xff)
+        if self.counter is not None:
+            output += pack_counter(self.counter, max(self.counterlength, 4))
+        return output
+
+    def x_popm(self):
+        """
+        Extract Popularimeter
+
+        sets: email, rating, counter, counterlength
+        """
+        data = self.rawdata
+        end = data.find('\x00')
+        if end < 0 or end + 1 >= len(data):
+            raise ID3FrameException("POPM extraction failed. Missing rating")
+
+        self.email = data[:end]
+        self.rating = ord(data[end + 1])
+        self.counterlength = len(data) - end - 2
+        if self.counterlength:
+            self.counter = unpack_counter(data[end + 2:])
+        else:
+            self.counter = None # counter is optional
+
+        debug('Read Field: %s Len: %d Email: %s Rating: %d Count: %s' %
+              (self.fid, self.length, self.email, self.rating,
+               str(self.counter)))
+
     def o_bin(self):
         return self.rawdata
 
@@ -376,12 +412,12 @@ class ID3v2BaseFrame:
         if not self.mimetype:
             raise ID3FrameException("APIC extraction failed. Missing mimetype")
 
-        picttype = ord(data[len(self.mimetype) + 2])
+        self.picttype = ord(data[len(self.mimetype) + 2])
 
         # get picture description
-        for i in range(len(self.mimetype) + 2, len(data)-1):
+        for i in range(len(self.mimetype) + 3, len(data)-1):
             if data[i] == '\x00':
-                self.desc = data[len(self.mimetype)+2:i]
+                self.desc = data[len(self.mimetype)+3:i]
                 if data[i+1] == '\x00':
                     self.pict = data[i+2:]
                 else:
@@ -477,6 +513,7 @@ class ID3v2_2_Frame(ID3v2BaseFrame):
         header = frame[:self.header_length]
 
         self.fid = header[0:3]
+        self.rawheader = header
         self.rawdata = frame[self.header_length:]
         self.length = struct.unpack('!I', '\x00' + header[3:6])[0]
 
@@ -539,11 +576,10 @@ class ID3v2_2_Frame(ID3v2BaseFrame):
         else:
             self.mimetype = ID3V2_2_FRAME_IMAGE_FORMAT_TO_MIME_TYPE[imgtype]
 
-        picttype = ord(data[len(imgtype) + 1])
+        self.picttype = ord(data[len(imgtype) + 1])
 
         # get picture description
         for i in range(len(imgtype) + 2, len(data) - 1):
-            print [data[i:i+3]]
             if data[i] == '\x00':
                 self.desc = data[len(imgtype)+2:i]
                 if data[i+1] == '\x00':
@@ -572,6 +608,7 @@ class ID3v2_3_Frame(ID3v2BaseFrame):
         (fid, rawsize, status, format) = struct.unpack("!4sIBB", frame_header)
 
         self.fid = fid
+        self.rawheader = frame_header
         self.rawdata = frame[self.header_length:]
         self.length = rawsize
         self.flags = {}
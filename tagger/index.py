@@ -0,0 +1,362 @@
+""" Full Text Tag Index """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.encoding import *
+from tagger.fileio import *
+from tagger.cache import read_snapshot, register_cache
+from tagger.metacache import METACACHE_RACY_SECONDS
+from tagger.walk import walk_files, WALK_PATTERN
+from tagger.debug import *
+
+import os, sys, re, time
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# searchable fields and the frames they are filled from, in every version
+INDEX_FIELDS = (('artist', ('TPE1', 'TPE2', 'TP1', 'TP2')),
+                ('album', ('TALB', 'TAL')),
+                ('title', ('TIT2', 'TT2')),
+                ('composer', ('TCOM', 'TCM')),
+                ('comment', ('COMM', 'COM')))
+
+# files indexed per transaction
+INDEX_BATCH_SIZE = 1000
+
+# bump when the tables or the tokenizing change
+INDEX_SCHEMA_VERSION = 1
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    dev INTEGER, ino INTEGER, mtime_ns INTEGER, size INTEGER
+)
+"""
+
+_POSTINGS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT, field INTEGER, file INTEGER
+);
+CREATE INDEX IF NOT EXISTS postings_term ON postings (term, field);
+CREATE INDEX IF NOT EXISTS postings_file ON postings (file);
+"""
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    """ Lower case words of a unicode string """
+    return _word.findall(text.lower())
+
+def _to_unicode(value, encoding='latin_1'):
+    if isinstance(value, str):
+        return value.decode(encoding, 'replace')
+    return value
+
+def _path(filename):
+    """ Absolute path of a file as unicode, as it is kept in the index """
+    return _to_unicode(os.path.abspath(filename),
+                       sys.getfilesystemencoding() or 'latin_1')
+
+def tag_text(snapshot):
+    """
+    Text of the searchable fields of a TagSnapshot, as a dictionary of
+    field name to unicode string. Text frames are decoded by x_text and
+    comments by x_comm. ID3v1 fields are added to the ones they match.
+    """
+    field_of = {}
+    for field, fids in INDEX_FIELDS:
+        for fid in fids:
+            field_of[fid] = field
+    found = dict([(field, []) for field, fids in INDEX_FIELDS])
+
+    if snapshot.version:
+        for frame in snapshot.id3v2().frames:
+            field = field_of.get(frame.fid)
+            if not field:
+                continue
+            if frame.fid in ('COMM', 'COM'):
+                for comment in (frame.shortcomment, frame.longcomment):
+                    found[field].append(_to_unicode(comment, frame.encoding))
+            else:
+                found[field].extend([_to_unicode(s) for s in frame.strings])
+
+    if snapshot.id3v1_data:
+        id3v1 = snapshot.id3v1()
+        for field, value in (('artist', id3v1.artist),
+                             ('album', id3v1.album),
+                             ('title', id3v1.songname),
+                             ('comment', id3v1.comment)):
+            found[field].append(_to_unicode(value))
+
+    return dict([(field, u' '.join([s.strip(u'\x00') for s in strings]))
+                 for field, strings in found.items()])
+
+class TagIndex:
+    """
+    Inverted index of the artist, album, title, composer and comment
+    frames of a library, kept in an SQLite database.
+
+    The index uses an FTS4 table where SQLite has one, and a table of
+    (term, field, file) postings otherwise. Each file is stored with its
+    stat identity, so update() only reads files that changed since they
+    were indexed. Tags can be read through a MetadataCache or TagCache,
+    and commits made through this package mark the file for reindexing.
+
+    index = TagIndex('index.db', cache=MetadataCache('tags.db'))
+    index.update_tree(['/music'])
+    print index.search('artist:beatles abbey')
+    index.close()
+
+    @ivar fts: whether the index is an FTS table
+    @ivar updated: files read since the index was opened
+    """
+
+    def __init__(self, database, cache=None, fts=None,
+                 batch_size=INDEX_BATCH_SIZE):
+        """
+        @param database: filename of the SQLite database, created if
+                         missing. ':memory:' keeps it in memory.
+        @type database: string
+        @param cache: read tags through cache.get(filename) rather than
+                      from the file, such as a MetadataCache
+        @param fts: False to use the posting table even when FTS is
+                    available, None to pick what the database supports
+        @type fts: boolean
+        @param batch_size: files to index before committing
+        @type batch_size: int
+        """
+        if sqlite3 is None:
+            raise ID3NotImplementedException("sqlite3 module not available")
+        self.cache = cache
+        self.batch_size = batch_size
+        self.updated = 0
+        self._pending = 0
+        self._changed = set()
+        self.db = sqlite3.connect(database)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_SCHEMA_VERSION:
+            for table in ('files', 'postings', 'text'):
+                self.db.execute("DROP TABLE IF EXISTS %s" % table)
+            self.db.execute("PRAGMA user_version = %d" % INDEX_SCHEMA_VERSION)
+        self.db.execute(_INDEX_SCHEMA)
+        self.fts = self._create_text(fts)
+        self.db.commit()
+        register_cache(self)
+
+    def _create_text(self, fts):
+        existing = [name for (name,) in self.db.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('text', 'postings')")]
+        if existing:
+            return 'text' in existing
+        if fts is not False:
+            columns = ', '.join([field for field, fids in INDEX_FIELDS])
+            for tokenizer in ('unicode61', 'simple'):
+                try:
+                    self.db.execute("CREATE VIRTUAL TABLE text USING "
+                                    "fts4(%s, tokenize=%s)" %
+                                    (columns, tokenizer))
+                    return True
+                except sqlite3.OperationalError:
+                    pass
+        self.db.executescript(_POSTINGS_SCHEMA)
+        return False
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """ Commit pending changes and close the database """
+        if getattr(self, 'db', None):
+            self.db.commit()
+            self.db.close()
+        self.db = None
+
+    def flush(self):
+        """ Commit the files indexed so far """
+        self.db.commit()
+        self._pending = 0
+
+    def invalidate(self, filename):
+        """ Index the file again on the next update, even if unchanged """
+        self._changed.add(_path(filename))
+
+    def update(self, filename):
+        """
+        Index a file if it is new or changed since it was indexed. Frames
+        too corrupt to parse are left out, and files whose tags can not
+        be read at all are indexed with no text.
+
+        @param filename: mp3 file
+        @type filename: string
+        @return: whether the file was read
+        @raise OSError: if the file does not exist
+        """
+        path = _path(filename)
+        key = stat_key(os.stat(filename))
+        row = self.db.execute("SELECT id, dev, ino, mtime_ns, size FROM files "
+                              "WHERE path = ?", (path,)).fetchone()
+        if row and tuple(row[1:]) == key and path not in self._changed:
+            return False
+        self._changed.discard(path)
+
+        try:
+            if self.cache:
+                snapshot = self.cache.get(filename)
+            else:
+                snapshot = read_snapshot(filename)
+            text = tag_text(snapshot)
+        except (ID3Exception, EnvironmentError, UnicodeError):
+            text = {}
+
+        if time.time() - key[2] / 1000000000.0 < METACACHE_RACY_SECONDS:
+            # could change again without its stat changing, check next time
+            key = key[:2] + (0,) + key[3:]
+        if row:
+            file_id = row[0]
+            self._remove_text(file_id)
+            self.db.execute("UPDATE files SET dev = ?, ino = ?, mtime_ns = ?, "
+                            "size = ? WHERE id = ?", key + (file_id,))
+        else:
+            file_id = self.db.execute("INSERT INTO files (path, dev, ino, "
+                                      "mtime_ns, size) VALUES (?, ?, ?, ?, ?)",
+                                      (path,) + key).lastrowid
+        self._add_text(file_id, text)
+
+        self.updated += 1
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+        return True
+
+    def _add_text(self, file_id, text):
+        if self.fts:
+            self.db.execute("INSERT INTO text (docid, %s) VALUES (?, %s)" %
+                            (', '.join([f for f, fids in INDEX_FIELDS]),
+                             ', '.join(['?'] * len(INDEX_FIELDS))),
+                            [file_id] + [text.get(f, u'')
+                                         for f, fids in INDEX_FIELDS])
+            return
+        postings = set()
+        for number, (field, fids) in enumerate(INDEX_FIELDS):
+            for term in tokenize(text.get(field, u'')):
+                postings.add((term, number, file_id))
+        self.db.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+
+    def _remove_text(self, file_id):
+        if self.fts:
+            self.db.execute("DELETE FROM text WHERE docid = ?", (file_id,))
+        else:
+            self.db.execute("DELETE FROM postings WHERE file = ?", (file_id,))
+
+    def remove(self, filename):
+        """ Drop a file from the index """
+        path = _path(filename)
+        row = self.db.execute("SELECT id FROM files WHERE path = ?",
+                              (path,)).fetchone()
+        if row:
+            self._remove_text(row[0])
+            self.db.execute("DELETE FROM files WHERE id = ?", row)
+
+    def update_tree(self, paths, pattern=WALK_PATTERN, sort_inodes=False,
+                    prune=False):
+        """
+        Update the index for every file below the given files and
+        directories.
+
+        @param prune: also drop every indexed file that was not found
+        @type prune: boolean
+        @return: number of files read
+        """
+        before = self.updated
+        seen = set()
+        for filename in walk_files(paths, pattern, sort_inodes):
+            try:
+                self.update(filename)
+            except OSError:
+                continue
+            if prune:
+                seen.add(_path(filename))
+        if prune:
+            gone = [path for (path,) in self.db.execute("SELECT path FROM files")
+                    if path not in seen]
+            for path in gone:
+                self.remove(path)
+        self.flush()
+        return self.updated - before
+
+    def search(self, query, limit=None):
+        """
+        Paths of the files matching every word of a query, sorted.
+
+        A word matches any field, or only one with field:word, such as
+        artist:beatles. A word ending in * matches words starting with it.
+
+        @param query: words to look for
+        @type query: string or unicode
+        @param limit: most paths to return
+        @type limit: int
+        @rtype: list of unicode strings
+        """
+        terms = []
+        fields = [f for f, fids in INDEX_FIELDS]
+        for word in _to_unicode(query, 'utf_8').split():
+            field = None
+            if ':' in word:
+                field, word = word.split(':', 1)
+                if field not in fields:
+                    raise ID3ParameterException("unknown field: %s" % field)
+            prefix = word.endswith('*')
+            for term in tokenize(word):
+                terms.append((field, term, False))
+            if terms and prefix:
+                terms[-1] = terms[-1][:2] + (True,)
+        if not terms:
+            return []
+
+        if self.fts:
+            # terms are lower case words, no quoting needed
+            match = u' '.join([u'%s%s%s' % (field and field + u':' or u'',
+                                             term, prefix and u'*' or u'')
+                               for field, term, prefix in terms])
+            sql = "SELECT path FROM files JOIN text ON files.id = text.docid " \
+                  "WHERE text MATCH ? ORDER BY path"
+            args = [match]
+        else:
+            selects = []
+            args = []
+            for field, term, prefix in terms:
+                if prefix:
+                    where = "term >= ? AND term < ?"
+                    args.extend([term, term + u'\uffff'])
+                else:
+                    where = "term = ?"
+                    args.append(term)
+                if field:
+                    where += " AND field = ?"
+                    args.append(fields.index(field))
+                selects.append("SELECT file FROM postings WHERE " + where)
+            sql = "SELECT path FROM files WHERE id IN (%s) ORDER BY path" % \
+                  " INTERSECT ".join(selects)
+        if limit:
+            sql += " LIMIT %d" % limit
+        return [path for (path,) in self.db.execute(sql, args)]
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
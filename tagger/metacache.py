@@ -0,0 +1,194 @@
+""" Persistent Tag Metadata Cache """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.fileio import *
+from tagger.cache import TagSnapshot, read_snapshot, register_cache
+from tagger.debug import *
+
+import os, time, marshal
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# rows written per transaction
+METACACHE_BATCH_SIZE = 1000
+
+# files modified this recently are not stored, a change made within the
+# timestamp granularity of the filesystem could leave mtime and size alone
+METACACHE_RACY_SECONDS = 2
+
+# bump when the table layout or the serialisation changes
+METACACHE_SCHEMA_VERSION = 1
+
+_METACACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dev INTEGER, ino INTEGER, mtime_ns INTEGER, size INTEGER,
+    version TEXT,
+    frames BLOB,
+    id3v2 BLOB,
+    id3v1 BLOB,
+    error TEXT
+)
+"""
+
+class MetadataCache:
+    """
+    Tag snapshots kept in an SQLite database between runs.
+
+    Each file is stored under its path together with its device, inode,
+    mtime and size. A file whose stat still matches is answered from the
+    database, anything else is parsed and written back, in batches of
+    batch_size rows per transaction. Files that fail to parse are
+    remembered as well, and raise the same ID3Exception until they change.
+    Files modified in the last METACACHE_RACY_SECONDS are parsed every
+    time, as their stat could stay the same through another change.
+
+    cache = MetadataCache('tags.db')
+    for filename in filenames:
+        print cache.get(filename).get('TIT2')
+    cache.close()
+
+    @ivar hits: files answered from the database
+    @ivar misses: files that had to be parsed
+    """
+
+    def __init__(self, database, batch_size=METACACHE_BATCH_SIZE):
+        """
+        @param database: filename of the SQLite database, created if
+                         missing. ':memory:' keeps it in memory.
+        @type database: string
+        @param batch_size: rows to collect before writing them out
+        @type batch_size: int
+        """
+        if sqlite3 is None:
+            raise ID3NotImplementedException("sqlite3 module not available")
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._pending = {} # path -> row waiting to be written
+        self._changed = set() # paths written to since they were stored
+        self.db = sqlite3.connect(database)
+        self.db.text_factory = str
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != METACACHE_SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("PRAGMA user_version = %d" %
+                            METACACHE_SCHEMA_VERSION)
+        self.db.execute(_METACACHE_SCHEMA)
+        self.db.commit()
+        register_cache(self)
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """ Write out pending rows and close the database """
+        if getattr(self, 'db', None):
+            self.flush()
+            self.db.close()
+        self.db = None
+
+    def get(self, filename):
+        """
+        Snapshot of the tags of a file, parsing it only if it changed
+        since it was stored.
+
+        @param filename: mp3 file
+        @type filename: string
+        @rtype: TagSnapshot
+        @raise ID3Exception: if the file could not be parsed
+        """
+        path = os.path.abspath(filename)
+        key = stat_key(os.stat(path))
+
+        row = None
+        if path in self._changed:
+            self._changed.discard(path)
+        elif path in self._pending:
+            row = self._pending[path]
+        else:
+            row = self.db.execute("SELECT * FROM files WHERE path = ?",
+                                  (path,)).fetchone()
+        if row and tuple(row[1:5]) == key:
+            self.hits += 1
+            return self._snapshot(row)
+
+        self.misses += 1
+        try:
+            snapshot = read_snapshot(path)
+        except ID3Exception, e:
+            self._store((path,) + key + (None, None, None, None, str(e)))
+            raise
+        self._store((path,) + snapshot.key + (
+            snapshot.version,
+            sqlite3.Binary(marshal.dumps((snapshot.fids, snapshot.text))),
+            sqlite3.Binary(snapshot.id3v2_data),
+            sqlite3.Binary(snapshot.id3v1_data),
+            None))
+        return snapshot
+
+    def _snapshot(self, row):
+        path, dev, ino, mtime_ns, size, version, frames, id3v2, id3v1, \
+              error = row
+        if error:
+            raise ID3Exception(error)
+        fids, text = marshal.loads(str(frames))
+        return TagSnapshot(path, (dev, ino, mtime_ns, size), version,
+                           fids, text, str(id3v2), str(id3v1))
+
+    def _store(self, row):
+        mtime_ns = row[3]
+        if time.time() - mtime_ns / 1000000000.0 < METACACHE_RACY_SECONDS:
+            self._pending.pop(row[0], None)
+            return
+        self._pending[row[0]] = row
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Write the pending rows in one transaction """
+        if not self._pending:
+            return
+        self.db.executemany("INSERT OR REPLACE INTO files VALUES "
+                            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            self._pending.values())
+        self.db.commit()
+        self._pending = {}
+
+    def invalidate(self, filename):
+        """ Parse the file again next time, even if its stat matches """
+        self._changed.add(os.path.abspath(filename))
+
+    def prune(self, filenames):
+        """
+        Drop the rows of every file not in filenames, such as files
+        deleted since the last scan.
+
+        @param filenames: files to keep
+        @type filenames: iterable of strings
+        @return: number of rows dropped
+        """
+        self.flush()
+        keep = set([os.path.abspath(f) for f in filenames])
+        gone = [(path,) for (path,) in self.db.execute("SELECT path FROM files")
+                if path not in keep]
+        self.db.executemany("DELETE FROM files WHERE path = ?", gone)
+        self.db.commit()
+        return len(gone)
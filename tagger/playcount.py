@@ -0,0 +1,165 @@
+""" Play Counter Updates """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.utility import *
+from tagger.fileio import *
+from tagger.id3v2 import ID3v2
+from tagger.debug import *
+
+import os, struct
+
+# (play counter, popularimeter) frame ids for each version
+ID3V2_PLAYCOUNT_FIDS = {'2.2': ('CNT', 'POP'),
+                        '2.3': ('PCNT', 'POPM'),
+                        '2.4': ('PCNT', 'POPM')}
+
+def find_counters(fd):
+    """
+    Walk the frame headers of an ID3v2 tag looking for play counters.
+
+    Only the tag header, the frame headers and the payloads of counter
+    frames are read, the walk never goes past the end of the tag.
+
+    @param fd: file descriptor of the mp3 file
+    @type fd: int
+    @return: list of (fid, offset, payload) for every PCNT and POPM frame,
+             where offset is the file offset of the payload. None if the
+             tag is missing or cannot be patched without a full parse
+             (unsynchronised, compressed or with an extension header).
+    """
+    header = pread(fd, ID3V2_FILE_HEADER_LENGTH, 0)
+    if len(header) != ID3V2_FILE_HEADER_LENGTH or header[:3] != 'ID3':
+        return None
+
+    id3, ver, flags, rawsize = struct.unpack("!3sHB4s", header)
+    version = '2.%d' % (ver >> 8)
+    if version not in ID3v2.supported:
+        return None
+    if flags & 0xc0: # unsync, ext header (2.3+) or compression (2.2)
+        return None
+
+    fids = ID3V2_PLAYCOUNT_FIDS[version]
+    hdrlen = ID3V2_HEADER_LEN[version]
+    end = ID3V2_FILE_HEADER_LENGTH + unsyncsafe(rawsize)
+    pos = ID3V2_FILE_HEADER_LENGTH
+    counters = []
+
+    while pos + hdrlen <= end:
+        hdr = pread(fd, hdrlen, pos)
+        if len(hdr) != hdrlen or hdr[0] == '\x00':
+            break # padding
+        fid = hdr[:len(fids[0])]
+        size = ID3V2_DATA_LEN[version](hdr)
+        if pos + hdrlen + size > end:
+            break # truncated frame
+        if fid in fids:
+            if hdrlen == ID3V2_3_FRAME_HEADER_LENGTH and ord(hdr[-1]):
+                return None # compressed or encrypted counter
+            counters.append((fid, pos + hdrlen,
+                             pread(fd, size, pos + hdrlen)))
+        pos += hdrlen + size
+
+    return counters
+
+def _counter_patches(counters, n):
+    """
+    Work out the new counter bytes for the counters found.
+
+    @return: (count, patches) where count is the new play count and
+             patches a list of (offset, bytestring). None if there is no
+             play counter or a counter needs more bytes.
+    """
+    count = None
+    patches = []
+    for fid, offset, payload in counters:
+        if fid in ('PCNT', 'CNT'):
+            value = unpack_counter(payload) + n
+            if count is None:
+                count = value
+        else:
+            end = payload.find('\x00')
+            if end < 0 or len(payload) <= end + 2:
+                continue # no counter in this popularimeter
+            offset += end + 2
+            payload = payload[end + 2:]
+            value = unpack_counter(payload) + n
+
+        data = pack_counter(value, len(payload))
+        if len(data) != len(payload):
+            return None
+        patches.append((offset, data))
+
+    if count is None:
+        return None
+    return count, patches
+
+def _commit_play_count(filename, n):
+    """
+    Increment play counters by parsing and committing the whole tag,
+    adding a play counter frame if there isn't one.
+    """
+    id3 = ID3v2(filename)
+    pcnt, popm = ID3V2_PLAYCOUNT_FIDS[id3.version]
+    count = None
+    for frame in id3.frames:
+        if frame.fid == pcnt:
+            frame.counter += n
+            if count is None:
+                count = frame.counter
+        elif frame.fid == popm and frame.counter is not None:
+            frame.counter += n
+
+    if count is None:
+        frame = id3.new_frame(fid=pcnt)
+        frame.counter = n
+        id3.frames.append(frame)
+        count = n
+
+    id3.commit()
+    return count
+
+def increment_play_count(filename, n=1):
+    """
+    Increment the play counter (PCNT) and any popularimeter (POPM)
+    counters of an mp3 file.
+
+    The counters are located with a walk over the frame headers and their
+    bytes are overwritten in place while holding an advisory lock on the
+    file. Only when there is no play counter yet, or a counter has to be
+    widened, is the whole tag parsed and committed.
+
+    @param filename: mp3 file to update
+    @type filename: string
+    @param n: amount to add to the counters
+    @type n: int
+    @return: the new play count
+    @rtype: int
+    """
+    fd = os.open(filename, os.O_RDWR)
+    try:
+        lock_file(fd)
+        try:
+            counters = find_counters(fd)
+            result = None
+            if counters:
+                result = _counter_patches(counters, n)
+            if result is None:
+                debug("increment_play_count: full commit for %s" % filename)
+                return _commit_play_count(filename, n)
+
+            count, patches = result
+            for offset, data in patches:
+                pwrite(fd, data, offset)
+            file_changed(filename)
+            return count
+        finally:
+            unlock_file(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,141 @@
+""" Parallel Library Scanner """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.id3v2 import ID3v2
+from tagger.id3v1 import ID3v1
+from tagger.walk import walk_files, WALK_PATTERN
+from tagger.debug import *
+
+import os
+from collections import namedtuple
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# files handed to a worker at a time
+SCAN_CHUNK_SIZE = 64
+
+class ScanRecord(namedtuple('ScanRecord', 'path size version tag_size '
+                                          'fids text id3v1 error')):
+    """
+    Outcome of scanning one file, small enough to send between processes.
+
+    @ivar path: the file
+    @ivar size: file size in bytes
+    @ivar version: ID3v2 version, None if there is no ID3v2 tag
+    @ivar tag_size: size of the ID3v2 tag including its header, 0 if none
+    @ivar fids: frame id of every ID3v2 frame, in tag order
+    @ivar text: (fid, strings) for every ID3v2 text frame
+    @ivar id3v1: (songname, artist, album, year, comment, genre, track) of
+                 the ID3v1 tag, None if there is none
+    @ivar error: why the file could not be read, None if it could
+    """
+    __slots__ = ()
+
+def scan_file(filename):
+    """
+    Read the tags of one file into a ScanRecord. Errors reading the file
+    end up in the record instead of being raised.
+
+    @rtype: ScanRecord
+    """
+    version = None
+    tag_size = 0
+    fids = ()
+    text = []
+    id3v1 = None
+    try:
+        f = open(filename, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            id3 = ID3v2(f)
+            if id3.tag_exists():
+                version = id3.version
+                tag_size = id3.mp3_data_offset()
+                fids = tuple([frame.fid for frame in id3.frames])
+                for frame in id3.frames:
+                    if frame.fid[0] == 'T' and frame.strings:
+                        text.append((frame.fid, tuple(frame.strings)))
+            id3.close()
+            tag = ID3v1(f)
+            if tag.tag_exists():
+                id3v1 = (tag.songname, tag.artist, tag.album, tag.year,
+                         tag.comment, tag.genre, tag.track)
+            tag.close()
+        finally:
+            f.close()
+    except (ID3Exception, IOError, OSError), e:
+        return ScanRecord(filename, 0, None, 0, (), (), None, str(e))
+    return ScanRecord(filename, size, version, tag_size, fids, tuple(text),
+                      id3v1, None)
+
+def _scan_chunk(filenames):
+    """ Worker side of scan(): one list of records per chunk """
+    return [scan_file(filename) for filename in filenames]
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def scan(paths, jobs=None, chunksize=SCAN_CHUNK_SIZE, pattern=WALK_PATTERN,
+         sort_inodes=False, sampler=None):
+    """
+    Scan files and directory trees in a pool of worker processes,
+    yielding a ScanRecord for each file as soon as its chunk is done.
+
+    The tree is walked in this process while the workers parse, files are
+    handed out chunksize at a time. Records come back in the order the
+    chunks finish, not the order of the files.
+
+    for record in scan(['/music'], jobs=8):
+        print record.path, record.version
+
+    @param paths: files and directories to scan
+    @type paths: list of strings
+    @param jobs: worker processes, one per cpu if None. With 1 the files
+                 are parsed in this process.
+    @type jobs: int
+    @param chunksize: files per chunk
+    @type chunksize: int
+    @param pattern: shell pattern of file names to scan in directories
+    @type pattern: string
+    @param sort_inodes: hand out the files in inode order, see walk_files()
+    @type sort_inodes: boolean
+    @param sampler: only scan the files this Sampler picks
+    @type sampler: Sampler
+    """
+    filenames = walk_files(paths, pattern, sort_inodes)
+    if sampler:
+        filenames = sampler.sample(filenames)
+    if jobs is None and multiprocessing:
+        jobs = multiprocessing.cpu_count()
+    if not jobs or jobs <= 1 or not multiprocessing:
+        for filename in filenames:
+            yield scan_file(filename)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for records in pool.imap_unordered(_scan_chunk,
+                                           _chunks(filenames, chunksize)):
+            for record in records:
+                yield record
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
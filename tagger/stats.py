@@ -0,0 +1,456 @@
+""" Streaming Tag Statistics """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.utility import *
+from tagger.encoding import *
+from tagger.id3v2 import iter_frames
+from tagger.walk import walk_files, WALK_PATTERN
+from tagger.scanner import _chunks
+from tagger.debug import *
+
+import os, struct, mmap, math
+
+try:
+    import json
+except ImportError:
+    json = None
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# files handed to a worker at a time
+STATS_CHUNK_SIZE = 256
+
+# error messages kept as examples, the rest are only counted
+STATS_MAX_ERRORS = 100
+
+# standard normal quantile of the confidence intervals, 1.96 for 95%
+STATS_Z = 1.96
+
+def size_bucket(size):
+    """
+    Histogram bucket of a size: 0 for 0 bytes, otherwise n for sizes
+    from 2**(n-1) to 2**n - 1.
+    """
+    bucket = 0
+    while size:
+        size >>= 1
+        bucket += 1
+    return bucket
+
+def bucket_label(bucket):
+    if bucket == 0:
+        return "0"
+    return "%d-%d" % (1 << (bucket - 1), (1 << bucket) - 1)
+
+def proportion_interval(count, n, z=STATS_Z, fpc=1.0):
+    """
+    Share of a sample with some property, as (estimate, low, high) from
+    the Wilson score interval, None for an empty sample.
+
+    @param count: files in the sample with the property
+    @param n: files in the sample
+    @param z: standard normal quantile of the confidence level
+    @param fpc: finite population correction, sqrt(1 - n / population)
+    """
+    if not n:
+        return None
+    p = float(count) / n
+    z = z * fpc
+    centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / \
+             (1 + z * z / n)
+    return p, max(centre - spread, 0.0), min(centre + spread, 1.0)
+
+def mean_interval(n, total, total_sq, z=STATS_Z, fpc=1.0):
+    """
+    Mean of a sample as (estimate, low, high), from the sum and the sum of
+    squares of its values. None for an empty sample.
+    """
+    if not n:
+        return None
+    mean = float(total) / n
+    variance = max(total_sq - mean * total, 0.0) / max(n - 1, 1)
+    spread = z * fpc * math.sqrt(variance / n)
+    return mean, mean - spread, mean + spread
+
+def ratio_interval(n, sx, sy, sxx, syy, sxy, z=STATS_Z, fpc=1.0):
+    """
+    Ratio sum(y) / sum(x) of a sample as (estimate, low, high), with the
+    interval of the ratio estimator. None if the x values add up to 0.
+
+    @param sx, sy: sums of the x and y values
+    @param sxx, syy, sxy: sums of x*x, y*y and x*y
+    """
+    if not n or not sx:
+        return None
+    ratio = float(sy) / sx
+    residual = syy - 2 * ratio * sxy + ratio * ratio * sxx
+    variance = max(residual, 0.0) / max(n - 1, 1)
+    spread = z * fpc * math.sqrt(variance / n) / (float(sx) / n)
+    return ratio, ratio - spread, ratio + spread
+
+def confidence_label(z=STATS_Z):
+    """ Confidence level of a standard normal quantile, as '95%' """
+    return "%.0f%%" % (100 * math.erf(z / math.sqrt(2)))
+
+class TagStats:
+    """
+    Counters and histograms over the tags of many files.
+
+    Memory use depends on the number of distinct frame ids, encodings and
+    size buckets seen, not on the number of files. Stats collected in
+    separate processes are combined with merge(), and travel between them
+    as the plain dictionaries of as_dict().
+
+    stats = TagStats()
+    for filename in filenames:
+        stats.add_file(filename)
+    print stats.format_text()
+
+    When the files are a random sample, estimates() and format_estimates()
+    give the version mix, mean tag size and share of tag bytes in APIC
+    frames of the whole library, with confidence intervals.
+
+    @ivar files: files counted
+    @ivar id3v1: files with an ID3v1 tag
+    @ivar versions: files per ID3v2 version, None for no ID3v2 tag
+    @ivar tag_sizes: histogram of ID3v2 tag sizes by size_bucket()
+    @ivar padding: histogram of ID3v2 padding by size_bucket()
+    @ivar frame_sizes: histogram of frame payload sizes by size_bucket()
+    @ivar encodings: text frames per encoding name
+    @ivar frame_counts: frames per frame id
+    @ivar frame_bytes: payload bytes per frame id
+    @ivar errors: files that could not be read
+    @ivar error_examples: (path, message) of the first STATS_MAX_ERRORS
+    @ivar tag_bytes: sum of the ID3v2 tag sizes, 0 for files without one
+    @ivar tag_bytes_sq: sum of the squared tag sizes
+    @ivar apic_bytes: sum of the APIC payload bytes per file
+    @ivar apic_bytes_sq: sum of the squared APIC bytes per file
+    @ivar apic_tag_bytes: sum of APIC bytes times tag size per file
+    """
+
+    _counters = ('versions', 'tag_sizes', 'padding', 'frame_sizes',
+                 'encodings', 'frame_counts', 'frame_bytes')
+    _sums = ('tag_bytes', 'tag_bytes_sq', 'apic_bytes', 'apic_bytes_sq',
+             'apic_tag_bytes')
+
+    def __init__(self):
+        self.files = 0
+        self.id3v1 = 0
+        self.errors = 0
+        self.error_examples = []
+        for name in self._counters:
+            setattr(self, name, {})
+        for name in self._sums:
+            setattr(self, name, 0)
+
+    def _count(self, counter, key, amount=1):
+        counter[key] = counter.get(key, 0) + amount
+
+    def add(self, data, id3v1=False, filename=None):
+        """
+        Count one file from its ID3v2 tag.
+
+        @param data: the start of the file, at least the tag header and \
+                     frames. Padding may be left out, its size is worked \
+                     out from the tag header. An mmap of the file only \
+                     has the pages holding frame headers read in.
+        @type data: string or mmap
+        @param id3v1: the file has an ID3v1 tag
+        @type id3v1: boolean
+        @param filename: name of the file, for error messages
+        @type filename: string
+        """
+        version = None
+        if data[:3] == 'ID3' and len(data) >= ID3V2_FILE_HEADER_LENGTH:
+            header = data[:ID3V2_FILE_HEADER_LENGTH]
+            ver, rawsize = struct.unpack("!3xHx4s", header)
+            version = '2.%d' % (ver >> 8)
+            if version not in ID3V2_HEADER_LEN:
+                self.add_error(filename, "version %s not supported" % version)
+                return
+
+        self.files += 1
+        if id3v1:
+            self.id3v1 += 1
+        self._count(self.versions, version)
+        if not version:
+            self._add_sizes(0, 0)
+            return
+
+        tag_size = ID3V2_FILE_HEADER_LENGTH + unsyncsafe(rawsize)
+        self._count(self.tag_sizes, size_bucket(tag_size))
+        end = ID3V2_FILE_HEADER_LENGTH
+        apic = 0
+        for fid, start, length, flags in iter_frames(data):
+            end = start + length
+            self._count(self.frame_counts, fid)
+            self._count(self.frame_bytes, fid, length)
+            self._count(self.frame_sizes, size_bucket(length))
+            if fid[0] == 'T' and length:
+                encoding = encodings.get(ord(data[start]), 'unknown')
+                self._count(self.encodings, encoding)
+            elif fid in ('APIC', 'PIC'):
+                apic += length
+        self._count(self.padding, size_bucket(tag_size - end))
+        self._add_sizes(tag_size, apic)
+
+    def _add_sizes(self, tag_size, apic):
+        self.tag_bytes += tag_size
+        self.tag_bytes_sq += tag_size * tag_size
+        self.apic_bytes += apic
+        self.apic_bytes_sq += apic * apic
+        self.apic_tag_bytes += apic * tag_size
+
+    def add_error(self, filename, message):
+        """ Count a file that could not be read """
+        self.files += 1
+        self.errors += 1
+        if len(self.error_examples) < STATS_MAX_ERRORS:
+            self.error_examples.append((filename, message))
+
+    def add_file(self, filename):
+        """
+        Read the tags of a file and count them. The file is mapped rather
+        than read, so only the tag header, the frame headers and the
+        first byte of text frames are read from disk, not the payload of
+        large frames such as pictures.
+        """
+        try:
+            f = open(filename, 'rb')
+            try:
+                size = os.fstat(f.fileno()).st_size
+                if not size:
+                    self.add('', False, filename)
+                    return
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    id3v1 = size >= ID3V1_TAG_LENGTH and \
+                            data[size - ID3V1_TAG_LENGTH:
+                                 size - ID3V1_TAG_LENGTH + 3] == 'TAG'
+                    self.add(data, id3v1, filename)
+                finally:
+                    data.close()
+            finally:
+                f.close()
+        except (EnvironmentError, mmap.error), e:
+            self.add_error(filename, str(e))
+
+    def merge(self, other):
+        """ Add the counts of another TagStats to these """
+        self.files += other.files
+        self.id3v1 += other.id3v1
+        self.errors += other.errors
+        room = STATS_MAX_ERRORS - len(self.error_examples)
+        self.error_examples.extend(other.error_examples[:max(room, 0)])
+        for name in self._counters:
+            mine = getattr(self, name)
+            for key, value in getattr(other, name).items():
+                mine[key] = mine.get(key, 0) + value
+        for name in self._sums:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self):
+        """ The counts as a dictionary of plain values """
+        result = {'files': self.files, 'id3v1': self.id3v1,
+                  'errors': self.errors,
+                  'error_examples': [list(e) for e in self.error_examples]}
+        for name in self._counters:
+            result[name] = getattr(self, name).copy()
+        for name in self._sums:
+            result[name] = getattr(self, name)
+        return result
+
+    def from_dict(cls, values):
+        """ TagStats from the output of as_dict() """
+        stats = cls()
+        stats.files = values['files']
+        stats.id3v1 = values['id3v1']
+        stats.errors = values['errors']
+        stats.error_examples = [tuple(e) for e in values['error_examples']]
+        for name in cls._counters:
+            setattr(stats, name, dict(values[name]))
+        for name in cls._sums:
+            setattr(stats, name, values[name])
+        return stats
+    from_dict = classmethod(from_dict)
+
+    def estimates(self, population=None, z=STATS_Z):
+        """
+        Estimates for the library these files were sampled from. Each
+        estimate is (value, low, high) at the confidence level of z, or
+        None when the sample is too small to tell.
+
+        @param population: number of files sampled from. Narrows the
+                           intervals when the sample is a large share of
+                           it, and adds the estimated total of tag bytes.
+        @type population: int
+        @param z: standard normal quantile of the confidence level
+        @type z: float
+        @return: dictionary with the sample size, the share of files per
+                 version, with an ID3v1 tag and unreadable, the mean tag
+                 size and the share of tag bytes in APIC frames
+        """
+        n = self.files - self.errors
+        fpc = 1.0
+        if population:
+            fpc = math.sqrt(max(1.0 - float(self.files) / population, 0.0))
+        result = {'sampled': self.files, 'population': population,
+                  'confidence': confidence_label(z)}
+        result['versions'] = dict([
+            (version, proportion_interval(count, n, z, fpc))
+            for version, count in self.versions.items()])
+        result['id3v1'] = proportion_interval(self.id3v1, n, z, fpc)
+        result['errors'] = proportion_interval(self.errors, self.files,
+                                               z, fpc)
+        mean = mean_interval(n, self.tag_bytes, self.tag_bytes_sq, z, fpc)
+        result['mean_tag_size'] = mean
+        result['apic_share'] = ratio_interval(
+            n, self.tag_bytes, self.apic_bytes, self.tag_bytes_sq,
+            self.apic_bytes_sq, self.apic_tag_bytes, z, fpc)
+        if population and mean:
+            # unreadable files are taken to have no tag
+            readable = population * float(n) / self.files
+            result['total_tag_bytes'] = tuple([value * readable
+                                               for value in mean])
+        return result
+
+    def format_json(self, population=None):
+        """
+        The counts as JSON, with histograms keyed by bucket range.
+
+        @param population: files the counted ones were sampled from, adds
+                           the estimates() for it
+        @type population: int
+        """
+        if json is None:
+            raise ID3NotImplementedException("json module not available")
+        values = self.as_dict()
+        if population:
+            values['estimates'] = self.estimates(population)
+            values['estimates']['versions'] = dict([
+                (k or 'none', v) for k, v in
+                values['estimates']['versions'].items()])
+        values['versions'] = dict([(k or 'none', v) for k, v in
+                                   self.versions.items()])
+        for name in ('tag_sizes', 'padding', 'frame_sizes'):
+            values[name] = dict([(bucket_label(k), v) for k, v in
+                                 getattr(self, name).items()])
+        return json.dumps(values, indent=1, sort_keys=True)
+
+    def format_text(self):
+        """ The counts as a readable report """
+        lines = ["Files: %d (ID3v1: %d, errors: %d)" %
+                 (self.files, self.id3v1, self.errors)]
+        lines.append("Version Distributions:")
+        for version, count in sorted(self.versions.items()):
+            lines.append("  %s %d" % (version or 'none', count))
+        for title, name in (("Tag Sizes:", 'tag_sizes'),
+                            ("Padding:", 'padding'),
+                            ("Frame Sizes:", 'frame_sizes')):
+            lines.append(title)
+            for bucket, count in sorted(getattr(self, name).items()):
+                lines.append("  %s %d" % (bucket_label(bucket), count))
+        lines.append("Text Encodings:")
+        for encoding, count in sorted(self.encodings.items()):
+            lines.append("  %s %d" % (encoding, count))
+        lines.append("Frames Used:")
+        for fid, count in sorted(self.frame_counts.items()):
+            lines.append("  %s %d (%d bytes)" %
+                         (fid, count, self.frame_bytes[fid]))
+        lines.append("Errors:")
+        for filename, message in self.error_examples:
+            lines.append("  %s : %s" % (filename, message))
+        return '\n'.join(lines)
+
+    def format_estimates(self, population=None, z=STATS_Z):
+        """ The estimates() as a readable report """
+        values = self.estimates(population, z)
+        percent = lambda e: "%.1f%% (%.1f%% - %.1f%%)" % \
+                  tuple([100 * v for v in e])
+        size = lambda e: "%.0f bytes (%.0f - %.0f)" % e
+        unknown = lambda show, e: e and show(e) or "unknown"
+
+        if population:
+            lines = ["Sampled Files: %d of %d (%.2f%%)" %
+                     (self.files, population,
+                      100.0 * self.files / population)]
+        else:
+            lines = ["Sampled Files: %d" % self.files]
+        lines.append("Estimates at %s Confidence:" % values['confidence'])
+        lines.append("Version Distributions:")
+        for version, estimate in sorted(values['versions'].items()):
+            lines.append("  %s %s" % (version or 'none',
+                                      unknown(percent, estimate)))
+        lines.append("ID3v1: %s" % unknown(percent, values['id3v1']))
+        lines.append("Errors: %s" % unknown(percent, values['errors']))
+        lines.append("Mean Tag Size: %s" %
+                     unknown(size, values['mean_tag_size']))
+        lines.append("APIC Share of Tag Bytes: %s" %
+                     unknown(percent, values['apic_share']))
+        if 'total_tag_bytes' in values:
+            lines.append("Total Tag Bytes: %s" %
+                         size(values['total_tag_bytes']))
+        return '\n'.join(lines)
+
+def _stats_chunk(filenames):
+    """ Worker side of collect_stats() """
+    stats = TagStats()
+    for filename in filenames:
+        stats.add_file(filename)
+    return stats.as_dict()
+
+def collect_stats(paths, jobs=1, pattern=WALK_PATTERN, sort_inodes=False,
+                  chunksize=STATS_CHUNK_SIZE, sampler=None):
+    """
+    TagStats over every file below the given files and directories, or
+    over a random sample of them.
+
+    sampler = Sampler(rate=0.01)
+    stats = collect_stats(['/music'], sampler=sampler)
+    print stats.format_estimates(sampler.seen)
+
+    @param paths: files and directories to read
+    @type paths: list of strings
+    @param jobs: worker processes, one per cpu if None
+    @type jobs: int
+    @param pattern: shell pattern of file names to read in directories
+    @type pattern: string
+    @param sort_inodes: read the files in inode order, see walk_files()
+    @type sort_inodes: boolean
+    @param sampler: only read the files this Sampler picks. Its seen
+                    count is the population to pass to estimates().
+    @type sampler: Sampler
+    @rtype: TagStats
+    """
+    stats = TagStats()
+    filenames = walk_files(paths, pattern, sort_inodes)
+    if sampler:
+        filenames = sampler.sample(filenames)
+    if jobs is None and multiprocessing:
+        jobs = multiprocessing.cpu_count()
+    if not jobs or jobs <= 1 or not multiprocessing:
+        for filename in filenames:
+            stats.add_file(filename)
+        return stats
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for values in pool.imap_unordered(_stats_chunk,
+                                          _chunks(filenames, chunksize)):
+            stats.merge(TagStats.from_dict(values))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return stats
@@ -0,0 +1,123 @@
+""" Streaming Tag Records """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.utility import *
+from tagger.encoding import *
+from tagger.id3v2 import iter_frames
+from tagger.walk import walk_files, WALK_PATTERN
+from tagger.debug import *
+
+import os, struct
+from collections import namedtuple
+
+class TagRecord(namedtuple('TagRecord', 'path version fields file_size '
+                                        'tag_size padding error')):
+    """
+    Summary of the ID3v2 tag of one file, see iter_tags().
+
+    @ivar path: the file
+    @ivar version: ID3v2 version, None if there is no ID3v2 tag
+    @ivar fields: (fid, value) for each requested frame found, in the
+                  order they were asked for. The value of a text frame
+                  is its first string, of any other frame its raw bytes.
+    @type fields: tuple
+    @ivar file_size: file size in bytes
+    @ivar tag_size: size of the ID3v2 tag including its header, 0 if none
+    @ivar padding: bytes of padding in the tag
+    @ivar error: why the file could not be read, None if it could
+    """
+    __slots__ = ()
+
+    def get(self, fid, default=None):
+        """ Value of a requested frame """
+        for name, value in self.fields:
+            if name == fid:
+                return value
+        return default
+
+def decode_text(payload):
+    """
+    First string of a text frame payload, decoded the way x_text does:
+    latin_1 is left as a byte string, other encodings give unicode.
+    """
+    if not payload:
+        return ''
+    encoding = encodings.get(ord(payload[0]), 'latin_1')
+    if encoding == 'latin_1':
+        return payload[1:].split('\x00')[0]
+    text = payload[1:].decode(encoding, 'replace')
+    return text.split(u'\x00')[0]
+
+def read_record(filename, fields=()):
+    """
+    TagRecord for one file, reading the tag header and frame area but
+    creating no frame objects. Errors end up in the record.
+
+    @param fields: frame ids to fetch the values of
+    @type fields: sequence of strings
+    @rtype: TagRecord
+    """
+    try:
+        f = open(filename, 'rb')
+        try:
+            file_size = os.fstat(f.fileno()).st_size
+            header = f.read(ID3V2_FILE_HEADER_LENGTH)
+            if len(header) < ID3V2_FILE_HEADER_LENGTH or header[:3] != 'ID3':
+                return TagRecord(filename, None, (), file_size, 0, 0, None)
+            ver, rawsize = struct.unpack("!3xHx4s", header)
+            version = '2.%d' % (ver >> 8)
+            size = unsyncsafe(rawsize)
+            data = header + f.read(size)
+        finally:
+            f.close()
+
+        found = {}
+        end = ID3V2_FILE_HEADER_LENGTH
+        for fid, start, length, flags in iter_frames(data):
+            end = start + length
+            if fid in fields and fid not in found:
+                payload = data[start:end]
+                if fid[0] == 'T' and fid not in ('TXXX', 'TXX'):
+                    found[fid] = decode_text(payload)
+                else:
+                    found[fid] = payload
+    except (ID3Exception, IOError, OSError), e:
+        return TagRecord(filename, None, (), 0, 0, 0, str(e))
+
+    values = tuple([(fid, found[fid]) for fid in fields if fid in found])
+    tag_size = ID3V2_FILE_HEADER_LENGTH + size
+    return TagRecord(filename, version, values, file_size,
+                     tag_size, tag_size - end, None)
+
+def iter_tags(paths, fields=(), pattern=WALK_PATTERN, sort_inodes=False):
+    """
+    Yield a TagRecord for every file below the given files and
+    directories, one file at a time.
+
+    Only the tag is read and only the requested frames are decoded, no
+    ID3v2 or frame objects are made, and nothing is kept once a record
+    has been yielded, so memory use does not grow with the library.
+
+    for record in iter_tags(['/music'], fields=('TIT2', 'TPE1')):
+        print record.path, record.get('TIT2')
+
+    @param paths: files and directories to read
+    @type paths: list of strings
+    @param fields: frame ids to fetch the values of, as they appear in
+                   the tag ('TT2' rather than 'TIT2' for version 2.2)
+    @type fields: sequence of strings
+    @param pattern: shell pattern of file names to read in directories
+    @type pattern: string
+    @param sort_inodes: read the files in inode order, see walk_files()
+    @type sort_inodes: boolean
+    """
+    fields = tuple(fields)
+    for filename in walk_files(paths, pattern, sort_inodes):
+        yield read_record(filename, fields)
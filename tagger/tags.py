@@ -0,0 +1,124 @@
+""" Combined ID3v1/ID3v2 Tag Writer """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+from tagger.exceptions import *
+from tagger.constants import *
+from tagger.fileio import *
+from tagger.id3v2 import ID3v2
+from tagger.id3v1 import ID3v1
+from tagger.debug import *
+
+import os
+
+class Tags:
+    """
+    ID3v2 and ID3v1 tags of an MP3 file, sharing a single file handle.
+
+    Edit the tags through the id3v2 and id3v1 attributes and write both
+    with a single commit(). When the ID3v2 tag has to grow, the mp3 data
+    is moved once to make room and the ID3v1 tag is written behind it,
+    instead of each tag rewriting the file on its own.
+
+    with Tags('some.mp3') as tags:
+        tags.id3v1.songname = 'Title'
+        tags.id3v2.frames.append(frame)
+        tags.commit()
+
+    @ivar id3v2: the ID3v2 tag
+    @type id3v2: ID3v2
+    @ivar id3v1: the ID3v1 tag
+    @type id3v1: ID3v1
+    @ivar read_only: file is read only
+    """
+
+    f = None
+    id3v2 = None
+    id3v1 = None
+
+    def __init__(self, filename, version=ID3V2_DEFAULT_VERSION):
+        """
+        @param filename: the file to open or write to.
+        @type filename: string
+        @param version: ID3v2 version to use if the file has no ID3v2 tag
+        @type version: string
+        """
+        if not os.path.exists(filename):
+            raise ID3ParameterException("filename %s not valid" % filename)
+
+        self.f, self.read_only = open_file(filename)
+        self.filename = filename
+        self.id3v2 = ID3v2(filename, version, fileobj=self.f)
+        self.id3v1 = ID3v1(filename, fileobj=self.f)
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """ Close the file shared by both tags """
+        if self.id3v2:
+            self.id3v2.close()
+        if self.id3v1:
+            self.id3v1.close()
+        if self.f:
+            self.f.close()
+        self.f = None
+
+    def id3v1_changed(self):
+        """ Does the ID3v1 tag hold anything worth writing? """
+        defaults = self.id3v1.default_tags()
+        for name in defaults.keys():
+            if getattr(self.id3v1, name) != defaults[name]:
+                return True
+        return False
+
+    def commit(self, pretend=False):
+        """
+        Write both tags to the file. The ID3v1 tag is only written if it
+        was already there or has been filled in.
+
+        @param pretend: Do not actually write to file, but pretend to.
+        @type pretend: boolean
+        """
+        if self.read_only:
+            return False
+
+        self.f.seek(0, 2)
+        end = self.f.tell()
+        has_id3v1 = self.id3v1.tag_exists()
+        if has_id3v1:
+            end -= ID3V1_TAG_LENGTH
+        write_id3v1 = has_id3v1 or self.id3v1_changed()
+
+        size = self.id3v2.new_size()
+        if pretend:
+            return
+
+        # grow the ID3v2 tag by moving the mp3 data (but not the old
+        # ID3v1 tag) once, before anything else is written
+        if size != self.id3v2.tag["size"] or not self.id3v2.tag_exists():
+            offset = self.id3v2.mp3_data_offset()
+            self.id3v2.make_room(size, end)
+            end += self.id3v2.mp3_data_offset() - offset
+
+        if write_id3v1:
+            self.f.seek(end)
+            self.f.write(self.id3v1.output())
+            self.f.truncate()
+            self.f.flush() # the readers use pread, not this buffer
+
+        # the ID3v2 tag now fits in place
+        self.id3v2.commit()
+        self.f.flush()
+        self.id3v1.reader.clear()
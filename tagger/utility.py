@@ -17,6 +17,8 @@ def id3v2_3_get_size(header):
 ID3V2_DATA_LEN = {'2.2': id3v2_2_get_size,
 				  '2.3': id3v2_3_get_size,
 				  '2.4': id3v2_3_get_size}
+
+ID3V2_FID_LEN = {'2.2': 3, '2.3': 4, '2.4': 4}
 	
 def syncsafe(num, size):
 	"""	Given a number, sync safe it """
@@ -41,6 +43,25 @@ def unsyncsafe(data):
 		total += bs[bytes-1-i] * pow(128,i)
 	return total
 
+def pack_counter(num, size):
+	"""
+	Encode a counter as a big-endian byte string of at least size bytes,
+	widening it if the number does not fit (as used by PCNT and POPM)
+	"""
+	while num >> (size * 8):
+		size += 1
+	result = ''
+	for i in range(0, size):
+		result = chr((num >> (i*8)) & 0xff) + result
+	return result
+
+def unpack_counter(data):
+	""" Decode a big-endian counter of any length """
+	total = 0
+	for c in data:
+		total = (total << 8) | ord(c)
+	return total
+
 def null_terminate(enc, s):
 	"""
 	checks if a string is null terminated already, if it is, then ignore
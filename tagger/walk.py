@@ -0,0 +1,198 @@
+""" Directory Walking """
+
+__author__ = "Alastair Tse <alastair@tse.id.au>"
+__license__ = "BSD"
+__copyright__ = "Copyright (c) 2004, Alastair Tse"
+
+__revision__ = "$Id: $"
+
+import os, stat, fnmatch, random
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # backport for python 2
+    except ImportError:
+        scandir = None
+
+WALK_PATTERN = '*.mp3'
+
+def _entries(directory, dev):
+    """
+    (name, path, is_dir, key) for every entry of a directory, where key
+    is the (device, inode) the entry leads to, following symlinks.
+
+    With scandir the type and inode come from the directory listing
+    itself, only directories and symlinks need a stat call to find the
+    device they are on. Entries that vanish or dangle are left out.
+
+    @param dev: device of the directory
+    """
+    if scandir:
+        for entry in scandir(directory):
+            try:
+                is_dir = entry.is_dir()
+                if is_dir or entry.is_symlink():
+                    st = entry.stat()
+                    key = (st.st_dev, st.st_ino)
+                else:
+                    key = (dev, entry.inode())
+            except OSError:
+                continue
+            yield entry.name, entry.path, is_dir, key
+    else:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield name, path, stat.S_ISDIR(st.st_mode), (st.st_dev, st.st_ino)
+
+def _walk(paths, pattern, unique_files, onerror):
+    """ (path, key) of every file walk_files() yields, in walk order """
+    # (device, inode) of every directory walked, and of the files given
+    # or found when they are to be yielded once only
+    dirs = set()
+    files = set()
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError, e:
+            if onerror:
+                onerror(e)
+            continue
+        key = (st.st_dev, st.st_ino)
+        if not stat.S_ISDIR(st.st_mode):
+            if key not in files:
+                files.add(key)
+                yield path, key
+            continue
+        if key in dirs:
+            continue
+        dirs.add(key)
+
+        pending = [(path, st.st_dev)]
+        while pending:
+            directory, dev = pending.pop()
+            subdirs = []
+            try:
+                entries = list(_entries(directory, dev))
+            except OSError, e:
+                if onerror:
+                    onerror(e)
+                continue # unreadable or removed while walking
+            for name, entry, is_dir, key in entries:
+                if is_dir:
+                    if key not in dirs: # bind mount or symlink loop
+                        dirs.add(key)
+                        subdirs.append((entry, key[0]))
+                elif fnmatch.fnmatch(name, pattern) and key not in files:
+                    if unique_files:
+                        files.add(key)
+                    yield entry, key
+            subdirs.sort(reverse=True)
+            pending.extend(subdirs)
+
+def walk_files(paths, pattern=WALK_PATTERN, sort_inodes=False,
+               unique_files=False, onerror=None):
+    """
+    Yield every file matching pattern below the given files and
+    directories. Files given directly are yielded whatever their name.
+
+    Directories are listed once each with scandir where available, which
+    knows the type and inode of an entry without a stat call. A directory
+    reached more than once, through bind mounts or symlinks, is only
+    walked the first time, which also keeps symlink loops from being
+    followed forever. Only directories are remembered, so a walk takes
+    the same memory however many files it finds.
+
+    @param paths: files and directories to walk
+    @type paths: list of strings
+    @param pattern: shell pattern the names of files have to match
+    @type pattern: string
+    @param sort_inodes: yield the files ordered by device and inode, which
+                        on most filesystems is close to their order on
+                        disk and cuts seeking on spinning disks. The whole
+                        tree is walked before the first file is yielded.
+    @type sort_inodes: boolean
+    @param unique_files: yield a file reached more than once, through hard
+                         links or symlinks, only the first time. This
+                         remembers every file found.
+    @type unique_files: boolean
+    @param onerror: called with the OSError of each path that can not be
+                    read, which is then left out of the walk, as with
+                    os.walk()
+    @type onerror: function
+    """
+    if not sort_inodes:
+        for path, key in _walk(paths, pattern, unique_files, onerror):
+            yield path
+        return
+
+    found = [(key, path)
+             for path, key in _walk(paths, pattern, unique_files, onerror)]
+    found.sort()
+    for key, path in found:
+        yield path
+
+class Sampler:
+    """
+    Pick a uniform random sample of the files coming out of a walk.
+
+    With a rate every file is kept with that probability as it goes by,
+    so sampled files are handed on while the walk carries on. With a size
+    a reservoir of that many files is kept and handed on once the walk is
+    done, each file having the same chance to be in it.
+
+    sampler = Sampler(rate=0.01)
+    for filename in sampler.sample(walk_files(['/music'])):
+        ...
+    print sampler.seen, 'files walked'
+
+    @ivar seen: files that went through the sampler
+    @ivar taken: files handed on
+    """
+
+    def __init__(self, rate=None, size=None, seed=None):
+        """
+        @param rate: fraction of files to keep, between 0 and 1
+        @type rate: float
+        @param size: number of files to keep, instead of a rate
+        @type size: int
+        @param seed: seed for the random choices, to repeat a sample
+        """
+        if (rate is None) == (size is None):
+            raise ValueError("give either a sampling rate or a size")
+        if rate is not None and not 0 < rate <= 1:
+            raise ValueError("sampling rate must be between 0 and 1")
+        if size is not None and size < 1:
+            raise ValueError("sample size must be at least 1")
+        self.rate = rate
+        self.size = size
+        self.random = random.Random(seed)
+        self.seen = 0
+        self.taken = 0
+
+    def sample(self, iterable):
+        if self.rate is not None:
+            for item in iterable:
+                self.seen += 1
+                if self.random.random() < self.rate:
+                    self.taken += 1
+                    yield item
+            return
+
+        reservoir = []
+        for item in iterable:
+            self.seen += 1
+            if len(reservoir) < self.size:
+                reservoir.append(item)
+            else:
+                n = self.random.randint(0, self.seen - 1)
+                if n < self.size:
+                    reservoir[n] = item
+        for item in reservoir:
+            self.taken += 1
+            yield item
@@ -0,0 +1,81 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.artstore import *
+from tagger.id3v2 import *
+
+class ArtStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.store = os.path.join(self.dir, 'store')
+		self.cover = '\x89PNG' + ''.join([chr(i % 256) for i in range(30000)])
+		self.back = '\xff\xd8' + 'back' * 1000
+		self.files = []
+		for i, (version, encoding) in enumerate((('2.3', 'latin_1'),
+												 ('2.4', 'utf_16'),
+												 ('2.2', 'latin_1'))):
+			filename = os.path.join(self.dir, '%d.mp3' % i)
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			id3 = ID3v2(filename, version=version)
+			pictures = [('image/png', 3, u'cover', self.cover)]
+			if i == 1:
+				pictures.append(('image/jpeg', 4, u'back', self.back))
+			for mimetype, picttype, desc, data in pictures:
+				frame = id3.new_frame(fid=(version == '2.2' and 'PIC' or 'APIC'))
+				frame.encoding = encoding
+				frame.mimetype = mimetype
+				frame.picttype = picttype
+				frame.desc = desc
+				frame.pict = data
+				id3.frames.append(frame)
+			id3.commit()
+			id3.close()
+			os.utime(filename, (1000000000, 1000000000))
+			self.files.append(filename)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def testPictures(self):
+		f = open(self.files[1], 'rb')
+		pictures = list(iter_pictures(f))
+		self.assertEqual([(p.mimetype, p.picttype, p.desc) for p in pictures],
+						 [('image/png', 3, u'cover'), ('image/jpeg', 4, u'back')])
+		f.seek(pictures[0].offset)
+		self.assertEqual(f.read(pictures[0].size), self.cover)
+		f.close()
+
+	def testGrouped(self):
+		# a grouped frame has a group byte in front of its payload
+		f = open(self.files[0], 'r+b')
+		f.seek(19)
+		f.write('\x20')
+		f.seek(0)
+		self.assertEqual(list(iter_pictures(f)), [])
+		f.close()
+
+	def testStore(self):
+		store = ArtStore(self.store)
+		self.assertEqual(store.add_tree([self.dir]), [])
+		self.assertEqual((store.found, store.written), (4, 2))
+		self.assertEqual(store.bytes_written, len(self.cover) + len(self.back))
+		pictures = store.pictures(self.files[1])
+		self.assertEqual([p[2] for p in pictures], [3, 4])
+		self.assertEqual(open(pictures[0][4], 'rb').read(), self.cover)
+		self.assertEqual(open(pictures[1][4], 'rb').read(), self.back)
+		self.assert_(pictures[1][4].endswith('.jpg'))
+		self.assertEqual(store.pictures(self.files[2])[0][0], pictures[0][0])
+		store.close()
+
+		store = ArtStore(self.store)
+		self.assertEqual(store.add_file(self.files[0]), [pictures[0][0]])
+		self.assertEqual((store.found, store.written), (0, 0))
+		store.close()
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(ArtStoreTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,196 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.batch import *
+from tagger.id3v2 import *
+from tagger.id3v1 import *
+
+class BatchTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.files = []
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def makeFile(self, version=None, frames=(), id3v1=None):
+		filename = os.path.join(self.dir, '%d.mp3' % len(self.files))
+		open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+		if version:
+			id3 = ID3v2(filename, version=version)
+			for fid, text, encoding in frames:
+				frame = id3.new_frame(fid=fid)
+				frame.set_text(text, encoding)
+				id3.frames.append(frame)
+			id3.commit()
+			id3.close()
+		if id3v1:
+			tag = ID3v1(filename)
+			for name, value in id3v1.items():
+				setattr(tag, name, value)
+			tag.commit()
+			tag.close()
+		self.files.append(filename)
+		return filename
+
+	def corrupt(self, filename, fid):
+		""" Give a frame an encoding byte no version knows about """
+		data = open(filename, 'rb').read()
+		offset = data.index(fid) + 10
+		open(filename, 'wb').write(data[:offset] + '\x1e' + data[offset + 1:])
+
+	def frames(self, filename):
+		id3 = ID3v2(filename)
+		id3.close()
+		return id3.version, dict([(f.fid, f) for f in id3.frames])
+
+	def testSetDelete(self):
+		tagged = self.makeFile('2.3', [('TIT2', 'old', 'latin_1'),
+									   ('TPE1', 'artist', 'latin_1')])
+		old = self.makeFile('2.2', [('TT2', 'old', 'latin_1')])
+		bare = self.makeFile()
+		plan = EditPlan([('set', 'TIT2', u'new \u4e00'), ('delete', 'TPE1')])
+
+		results = list(run_edits(self.files, plan, pretend=True))
+		self.assertEqual([r.action for r in results],
+						 [BATCH_IN_PLACE, BATCH_IN_PLACE, BATCH_REWRITE])
+		self.assertEqual(self.frames(tagged)[1]['TIT2'].strings, ['old'])
+
+		results = list(run_edits(self.files, plan))
+		self.assertEqual([r.error for r in results], [None] * 3)
+		version, frames = self.frames(tagged)
+		self.assertEqual(frames['TIT2'].strings, [u'new \u4e00'])
+		self.assert_('TPE1' not in frames)
+		self.assertEqual(self.frames(old)[1]['TT2'].strings, [u'new \u4e00'])
+		self.assertEqual(self.frames(bare)[1]['TIT2'].strings, [u'new \u4e00'])
+
+		# nothing left to do
+		self.assertEqual([r.action for r in run_edits(self.files, plan)],
+						 [BATCH_UNCHANGED] * 3)
+		for filename in self.files:
+			self.assertEqual(plan.wanted(filename, []), False)
+		self.assertEqual(EditPlan([('delete', 'TT2')]).wanted(old, []), True)
+
+		# version 2.2 names work in every version
+		plan = EditPlan([parse_edit(u'set:TT2=hello')])
+		self.assertEqual(plan.edit(old), (BATCH_IN_PLACE, []))
+		self.assertEqual(plan.edit(tagged), (BATCH_IN_PLACE, []))
+		self.assertEqual(self.frames(old)[1]['TT2'].strings, ['hello'])
+		self.assertEqual(self.frames(tagged)[1]['TIT2'].strings, ['hello'])
+
+	def testID3v1(self):
+		gbk = u'\u4e2d\u6587'.encode('gbk')
+		filename = self.makeFile('2.3', [('TIT2', '', 'latin_1'),
+										 ('TPE1', 'artist', 'latin_1')],
+								 {'songname': gbk, 'artist': 'other',
+								  'album': 'album', 'track': 3})
+		plan = EditPlan([('copy-id3v1', 'gbk')])
+		action, warnings = plan.edit(filename)
+		self.assertEqual(warnings, [])
+		version, frames = self.frames(filename)
+		self.assertEqual(frames['TIT2'].strings, [u'\u4e2d\u6587'])
+		self.assertEqual(frames['TIT2'].encoding, 'utf_16')
+		self.assertEqual(frames['TPE1'].strings, ['artist'])
+		self.assertEqual(frames['TALB'].strings, ['album'])
+		self.assertEqual(frames['TRCK'].strings, ['3'])
+		self.assert_('TYER' not in frames)
+		self.assertEqual(ID3v1(filename).songname, gbk)
+
+		plan = EditPlan([('copy-id3v1', 'ascii')])
+		self.assertEqual(plan.edit(self.makeFile(id3v1={'songname': gbk})),
+						 (BATCH_UNCHANGED, ['ID3v1 songname is not ascii']))
+
+	def testTranscode(self):
+		big5 = u'\u4e2d\u6587'.encode('big5')
+		filename = self.makeFile('2.4', [('TIT2', big5, 'latin_1'),
+										 ('TPE1', 'ascii', 'latin_1'),
+										 ('TALB', '\xff\xff', 'latin_1')])
+		plan = EditPlan([('transcode', 'big5', 'utf_8')])
+		action, warnings = plan.edit(filename)
+		self.assertEqual(action, BATCH_IN_PLACE)
+		self.assertEqual(warnings, ['TALB is not big5'])
+		version, frames = self.frames(filename)
+		self.assertEqual(frames['TIT2'].strings, [u'\u4e2d\u6587'])
+		self.assertEqual(frames['TIT2'].encoding, 'utf_8')
+		self.assertEqual(frames['TPE1'].encoding, 'latin_1')
+		self.assertEqual(frames['TALB'].strings, ['\xff\xff'])
+
+		# converted files are passed over after reading the text frames
+		warnings = []
+		self.assertEqual(plan.wanted(filename, warnings), False)
+		self.assertEqual(warnings, ['TALB is not big5'])
+		plan = EditPlan([('transcode', 'big5', 'utf_8', ['TPE1', 'TT2'])])
+		self.assertEqual(plan.edit(filename), (BATCH_UNCHANGED, []))
+
+	def testUpgrade(self):
+		filename = self.makeFile('2.2', [('TT2', 'title', 'latin_1'),
+										 ('TYE', '2001', 'latin_1')])
+		id3 = ID3v2(filename)
+		frame = id3.new_frame(fid='PIC')
+		frame.encoding = 'latin_1'
+		frame.mimetype = 'image/png'
+		frame.picttype = 3
+		frame.desc = 'cover'
+		frame.pict = '\x89PNG' + 'x' * 100
+		id3.frames.append(frame)
+		id3.commit()
+		id3.close()
+
+		plan = EditPlan([('upgrade', '2.4'), ('set', 'TYER', u'2002')])
+		self.assertEqual(plan.edit(filename), (BATCH_IN_PLACE, []))
+		version, frames = self.frames(filename)
+		self.assertEqual(version, '2.4')
+		self.assertEqual(sorted(frames.keys()), ['APIC', 'TDRC', 'TIT2'])
+		self.assertEqual(frames['TIT2'].strings, ['title'])
+		self.assertEqual(frames['TDRC'].strings, ['2002'])
+		self.assertEqual(frames['APIC'].pict, '\x89PNG' + 'x' * 100)
+		self.assertEqual(frames['APIC'].mimetype, 'image/png')
+		self.assertEqual(frames['APIC'].desc, 'cover')
+		self.assertEqual(plan.edit(filename), (BATCH_UNCHANGED, []))
+
+	def testCorruptFrame(self):
+		filename = self.makeFile('2.3', [('TIT2', 'old', 'latin_1'),
+										 ('TPE1', 'artist', 'latin_1')])
+		self.corrupt(filename, 'TPE1')
+		data = open(filename, 'rb').read()
+		plan = EditPlan([('set', 'TIT2', u'new')])
+		for jobs in (1, 2):
+			results = list(run_edits(self.files, plan, jobs=jobs))
+			self.assertEqual([r.action for r in results], [None])
+			self.assert_(results[0].error.startswith('corrupt TPE1 frame'))
+		self.assertEqual(open(filename, 'rb').read(), data)
+		self.assertEqual(EditPlan([('delete', 'TALB')]).edit(filename),
+						 (BATCH_UNCHANGED, []))
+
+	def testParallel(self):
+		for i in range(6):
+			self.makeFile('2.3', [('TIT2', 'title %d' % i, 'latin_1')])
+		plan = EditPlan([('set', 'TALB', u'album')])
+		results = list(run_edits(self.files, plan, jobs=2, chunksize=2))
+		self.assertEqual(sorted([r.path for r in results]), self.files)
+		for filename in self.files:
+			self.assertEqual(self.frames(filename)[1]['TALB'].strings,
+							 ['album'])
+
+	def testSpec(self):
+		self.assertEqual(parse_edit(u'set:TIT2=a=b'), ('set', 'TIT2', u'a=b'))
+		self.assertEqual(parse_edit(u'transcode:gbk'), ('transcode', 'gbk'))
+		self.assertEqual(parse_edit(u'copy-id3v1'), ('copy-id3v1',))
+		self.assertRaises(ID3ParameterException, parse_edit, u'rename:x')
+		for spec in ([('set', 'XXXX', u'x')], [('set', 'APIC', u'x')],
+					 [('set', 'PIC', u'x')], [('set', 'XXX', u'x')],
+					 [('transcode', 'no-such-codec')], [('upgrade', '3.0')],
+					 [('delete',)], [('frobnicate',)]):
+			self.assertRaises(ID3ParameterException, EditPlan, spec)
+		result = EditPlan([('delete', 'TIT2')]).result(
+			os.path.join(self.dir, 'missing.mp3'))
+		self.assertEqual(result.action, None)
+		self.assert_(result.error)
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(BatchTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.cache import *
+
+class TagCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.files = []
+		for i in range(3):
+			filename = os.path.join(self.dir, '%d.mp3' % i)
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			id3 = ID3v2(filename, version='2.3')
+			frame = id3.new_frame(fid='TIT2')
+			frame.set_text('title %d' % i, 'latin_1')
+			id3.frames.append(frame)
+			id3.commit()
+			id3.close()
+			self.files.append(filename)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def testHit(self):
+		cache = TagCache()
+		first = cache.get(self.files[0])
+		self.assertEqual(first.get('TIT2'), 'title 0')
+		self.assertEqual(first.version, '2.3')
+		self.assert_(cache.get(self.files[0]) is first)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+		self.assertEqual(first.id3v2().frames[0].strings[0], 'title 0')
+		self.assertRaises(AttributeError, setattr, first, 'version', '2.4')
+
+	def testInvalidateOnCommit(self):
+		cache = TagCache()
+		cache.get(self.files[0])
+		id3 = ID3v2(self.files[0])
+		id3.frames[0].set_text('title X', 'latin_1')
+		id3.commit()
+		id3.close()
+		self.assertEqual(cache.get(self.files[0]).get('TIT2'), 'title X')
+		self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+	def testEviction(self):
+		cache = TagCache(max_entries=2)
+		for filename in self.files:
+			cache.get(filename)
+		self.assertEqual((len(cache), cache.evictions), (2, 1))
+		cache.get(self.files[2])
+		cache.get(self.files[0])
+		self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+		snapshot = cache.get(self.files[1])
+		cache = TagCache(max_bytes=snapshot.nbytes * 2)
+		for filename in self.files:
+			cache.get(filename)
+		self.assertEqual(len(cache), 2)
+		self.assert_(cache.nbytes <= cache.max_bytes)
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(TagCacheTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,79 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.dupes import *
+from tagger.id3v2 import *
+from tagger.id3v1 import *
+
+class DupeFinderTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.database = os.path.join(self.dir, 'dupes.db')
+		audio = ''.join([chr(i % 251) for i in range(20000)])
+		other = 'x' + audio[1:]
+		self.files = []
+		for i, (data, version) in enumerate(((audio, '2.3'), (audio, '2.4'),
+											 (audio, None), (other, '2.3'),
+											 (audio[:-1], None))):
+			filename = os.path.join(self.dir, '%d.mp3' % i)
+			open(filename, 'wb').write(data)
+			if version:
+				id3 = ID3v2(filename, version=version)
+				frame = id3.new_frame(fid='TIT2')
+				frame.set_text('title %d' % i)
+				id3.frames.append(frame)
+				id3.commit()
+				id3.close()
+			self.files.append(filename)
+		id3 = ID3v1(self.files[2])
+		id3.songname = 'song'
+		id3.commit()
+		id3.close()
+		for filename in self.files:
+			os.utime(filename, (1000000000, 1000000000))
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def testDigest(self):
+		digests = map(audio_digest, self.files)
+		self.assertEqual(digests[0], digests[1])
+		self.assertEqual(digests[0], digests[2])
+		self.assertNotEqual(digests[0], digests[3])
+
+	def testFind(self):
+		finder = DupeFinder(self.database, sample_size=1024)
+		self.assertEqual(finder.find([self.dir]), [self.files[:3]])
+		# the file differing at the start is sampled but not hashed
+		self.assertEqual((finder.files, finder.sampled, finder.hashed),
+						 (5, 4, 3))
+		finder.close()
+
+		finder = DupeFinder(self.database, sample_size=1024)
+		self.assertEqual(finder.find([self.dir]), [self.files[:3]])
+		self.assertEqual((finder.sampled, finder.hashed, finder.bytes_read),
+						 (0, 0, 0))
+		os.remove(self.files[1])
+		self.assertEqual(finder.find([self.dir]), [[self.files[0],
+												   self.files[2]]])
+		self.assertEqual(finder.prune(), 1)
+		finder.close()
+
+	def testSmallFiles(self):
+		finder = DupeFinder(sample_size=100000)
+		self.assertEqual(finder.find([self.dir]), [self.files[:3]])
+		self.assertEqual(finder.hashed, 0)
+
+	def testHardLink(self):
+		os.link(self.files[3], os.path.join(self.dir, 'linked.mp3'))
+		finder = DupeFinder(sample_size=1024)
+		self.assertEqual(finder.find([self.dir]), [self.files[:3]])
+		self.assertEqual(finder.files, 5)
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(DupeFinderTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,91 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.embed import *
+from tagger.id3v2 import *
+
+class EmbedTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.image = '\xff\xd8' + 'cover' * 2000
+		self.files = []
+		for i, version in enumerate(('2.3', '2.4', '2.2', None)):
+			filename = os.path.join(self.dir, '%d.mp3' % i)
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			if version:
+				id3 = ID3v2(filename, version=version)
+				frame = id3.new_frame(fid=(version == '2.2' and 'TT2' or 'TIT2'))
+				frame.set_text('title %d' % i)
+				id3.frames.append(frame)
+				id3.commit()
+				id3.close()
+			self.files.append(filename)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def checkPictures(self, filename, count=1):
+		id3 = ID3v2(filename)
+		pictures = [f for f in id3.frames if f.fid in ('APIC', 'PIC')]
+		self.assertEqual(len(pictures), count)
+		self.assertEqual(pictures[-1].pict, self.image)
+		self.assertEqual(pictures[-1].mimetype, 'image/jpeg')
+		self.assertEqual(pictures[-1].picttype, 3)
+		self.assertEqual(len(id3.frames), count + (filename != self.files[3]))
+		id3.close()
+
+	def testEmbed(self):
+		embedder = PictureEmbedder(self.image)
+		results = list(embed_picture(self.files, embedder, pretend=True))
+		self.assertEqual([r.plan for r in results], [EMBED_REWRITE] * 4)
+		self.assertEqual(open(self.files[0], 'rb').read(3), 'ID3')
+
+		results = list(embed_picture(self.files, embedder))
+		self.assertEqual([r.error for r in results], [None] * 4)
+		for filename in self.files:
+			self.checkPictures(filename)
+
+		# the same picture again replaces the old one in place
+		for filename in self.files:
+			self.assertEqual(embedder.embed(filename), EMBED_IN_PLACE)
+			self.checkPictures(filename)
+		self.assertEqual(sorted(embedder._frames.keys()), ['2.2', '2.3', '2.4'])
+
+	def testParallel(self):
+		embedder = PictureEmbedder(self.image)
+		results = list(embed_picture(self.files, embedder, jobs=2,
+									 chunksize=1))
+		self.assertEqual(sorted([r.path for r in results]), self.files)
+		for filename in self.files:
+			self.checkPictures(filename)
+		self.assertEqual(embedder._frames, {})
+
+	def testErrors(self):
+		self.assertRaises(ID3ParameterException, PictureEmbedder, 'not an image')
+		embedder = PictureEmbedder('data', mimetype='image/png', picttype=4)
+		result = embedder.result(os.path.join(self.dir, 'missing.mp3'))
+		self.assert_(result.error)
+
+	def testCorruptFrame(self):
+		# an encoding byte no version knows about
+		data = open(self.files[0], 'rb').read()
+		offset = data.index('TIT2') + 10
+		data = data[:offset] + '\x1e' + data[offset + 1:]
+		open(self.files[0], 'wb').write(data)
+		embedder = PictureEmbedder(self.image)
+		for jobs in (1, 2):
+			results = list(embed_picture(self.files[:2], embedder, jobs=jobs))
+			results = dict([(r.path, r) for r in results])
+			self.assertEqual(results[self.files[0]].plan, None)
+			self.assert_(results[self.files[0]].error.startswith(
+				'corrupt TIT2 frame'))
+			self.assertEqual(results[self.files[1]].error, None)
+		self.assertEqual(open(self.files[0], 'rb').read(), data)
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(EmbedTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
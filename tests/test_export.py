@@ -0,0 +1,89 @@
+import unittest
+import os
+import shutil
+import tempfile
+import csv
+import sys
+
+from tagger.export import *
+from tagger.id3v2 import *
+from StringIO import StringIO
+
+class ExportTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		for i, version in enumerate(('2.2', '2.3', '2.4', None)):
+			filename = os.path.join(self.dir, '%d.mp3' % i)
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			if version:
+				id3 = ID3v2(filename, version=version)
+				for fid, text in (('TIT2', u'title %d' % i), ('TPE1', u'\xe9t\xe9')):
+					if version == '2.2':
+						fid = EXPORT_FIELDS_2_2[fid]
+					frame = id3.new_frame(fid=fid)
+					frame.set_text(text, 'utf_16')
+					id3.frames.append(frame)
+				id3.commit()
+				id3.close()
+		open(os.path.join(self.dir, '3.mp3'), 'ab').write('TAG' + ' ' * 125)
+		self.broken = os.path.join(self.dir, 'broken.mp3')
+		open(self.broken, 'wb').write('ID3\x09\x00\x00\x00\x00\x00\x00')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def checkTable(self, table):
+		self.assertEqual(len(table), 5)
+		rows = dict([(os.path.basename(row[0]), row) for row in table.rows()])
+		names = table.names
+		self.assertEqual(rows['0.mp3'][names.index('TIT2')], u'title 0')
+		self.assertEqual(rows['2.mp3'][names.index('TPE1')], u'\xe9t\xe9')
+		self.assertEqual(rows['2.mp3'][names.index('version')], u'2.4')
+		self.assertEqual(rows['3.mp3'][names.index('id3v1')], 1)
+		self.assertEqual(rows['3.mp3'][names.index('tag_size')], 0)
+		self.assert_(rows['broken.mp3'][-1])
+		self.assertEqual(len(table.column('TPE1').values), 1)
+
+	def testExport(self):
+		table = export_tags([self.dir])
+		self.checkTable(table)
+		self.checkTable(export_tags([self.dir], jobs=2, chunksize=2))
+
+		f = StringIO()
+		table.write(f)
+		f.seek(0)
+		loaded = ColumnTable.read(f)
+		self.checkTable(loaded)
+		self.assertEqual(list(loaded.rows()), list(table.rows()))
+		self.assertRaises(ID3Exception, ColumnTable.read,
+						  StringIO(f.getvalue()[:40]))
+
+	def testCSV(self):
+		f = StringIO()
+		export_tags([self.dir]).write_csv(f)
+		rows = list(csv.reader(StringIO(f.getvalue())))
+		self.assertEqual(rows[0][:4], ['path', 'version', 'tag_size', 'padding'])
+		self.assertEqual(len(rows), 6)
+		self.assert_(u'\xe9t\xe9'.encode('utf_8') in f.getvalue())
+
+	def testPathEncoding(self):
+		encoding = sys.getfilesystemencoding() or 'latin_1'
+		try:
+			name = u'Bj\xf6rk.mp3'.encode(encoding)
+		except UnicodeError:
+			name = u'Bj\xf6rk.mp3'.encode('utf_8')
+		filename = os.path.join(self.dir, name)
+		open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+		f = StringIO()
+		export_tags([filename]).write_csv(f)
+		rows = list(csv.reader(StringIO(f.getvalue())))
+		self.assertEqual(rows[1][0],
+						 filename.decode(encoding, 'replace').encode('utf_8'))
+		if encoding.lower().replace('-', '') == 'utf8':
+			self.assertEqual(rows[1][0], filename)
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(ExportTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
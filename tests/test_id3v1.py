@@ -1,5 +1,7 @@
 import unittest
 import types
+import os
+import tempfile
 
 """
 TODO:
@@ -10,6 +12,7 @@ TODO:
 from tagger.id3v1 import *
 from tagger.exceptions import *
 from tagger.constants import *
+from tagger.fileio import *
 
 class ID3v1LoadTest(unittest.TestCase):
 
@@ -70,6 +73,70 @@ class ID3v1TagAccessTest(unittest.TestCase):
 		self.assert_(type(x) == types.IntType)
 		
 
+class ID3v1CommitTest(unittest.TestCase):
+
+	audio = '\xff\xfb' + '\x01' * 4096
+
+	def setUp(self):
+		fd, self.filename = tempfile.mkstemp(suffix='.mp3')
+		os.write(fd, self.audio)
+		os.close(fd)
+		fd, self.copy = tempfile.mkstemp(suffix='.mp3')
+		os.close(fd)
+
+	def tearDown(self):
+		os.unlink(self.filename)
+		os.unlink(self.copy)
+
+	def testCommitToFile(self):
+		for name in ('first', 'second'):
+			id3 = ID3v1(self.filename)
+			id3.songname = name
+			id3.commit_to_file(self.copy)
+			del id3
+			data = open(self.copy, 'rb').read()
+			self.assertEqual(data[:-128], self.audio)
+			self.assertEqual(ID3v1(self.copy).songname, name)
+			os.rename(self.copy, self.filename)
+			open(self.copy, 'wb').close()
+
+	def testDetach(self):
+		with ID3v1(self.filename) as id3:
+			id3.songname = 'title'
+			id3.commit()
+		self.assertEqual(id3.reader, None)
+		id3 = ID3v1(self.filename, detach=True)
+		self.assert_(id3.tag_exists())
+		self.assertEqual(id3.songname, 'title')
+		id3.artist = 'artist'
+		id3.commit()
+		self.assertEqual(id3.reader, None)
+		data = open(self.filename, 'rb').read()
+		self.assertEqual(data[:-128], self.audio)
+		self.assertEqual(ID3v1(self.filename).artist, 'artist')
+
+	def testFileObject(self):
+		id3 = ID3v1.from_bytestring(self.audio)
+		self.assert_(not id3.tag_exists())
+		id3.songname = 'title'
+		id3.commit()
+		data = id3.output()
+		self.assertEqual(len(data), 128)
+		self.assertEqual(ID3v1.from_bytestring(data).songname, 'title')
+
+	def testRangeReader(self):
+		id3 = ID3v1.from_bytestring(self.audio)
+		id3.songname = 'title'
+		id3.commit()
+		data = id3.reader.read_at(0, id3.reader.size())
+		requests = []
+		def read_at(offset, length):
+			requests.append((offset, length))
+			return data[offset:offset + length]
+		id3 = ID3v1(RangeReader(read_at, len(data)))
+		self.assertEqual(id3.songname, 'title')
+		self.assertEqual(len(requests), 1)
+
 class ID3v1OnlyFile1(unittest.TestCase):
 	filename = "data/chinese_id3v1_only.mp3"
 
@@ -97,6 +164,7 @@ if __name__ == "__main__":
 	suite.addTest(unittest.makeSuite(ID3v1LoadTest2))	
 	suite.addTest(unittest.makeSuite(ID3v1TagTest1))
 	suite.addTest(unittest.makeSuite(ID3v1TagTest2))		
+	suite.addTest(unittest.makeSuite(ID3v1CommitTest))
 	unittest.TextTestRunner(verbosity=2).run(suite)
 
 
@@ -1,5 +1,9 @@
 import unittest
 import types
+import os
+import io
+import tempfile
+import threading
 
 """
 TODO:
@@ -11,6 +15,7 @@ from tagger.id3v2frame import *
 from tagger.id3v2 import *
 from tagger.exceptions import *
 from tagger.constants import *
+from tagger.fileio import *
 
 class ID3v2LoadTest(unittest.TestCase):
 
@@ -58,6 +63,281 @@ class ID3v2_2_FrameTest(unittest.TestCase):
 			f = ID3v2_2_Frame(frame=data)
 			self.assert_(f.output() == data)
 
+class ID3v2CommitTest(unittest.TestCase):
+
+	def setUp(self):
+		fd, self.filename = tempfile.mkstemp(suffix='.mp3')
+		os.write(fd, '\xff\xfb' + '\x00' * 4096)
+		os.close(fd)
+		id3 = ID3v2(self.filename, version='2.3')
+		for fid, text in (('TIT2', 'title'), ('TPE1', 'artist')):
+			frame = id3.new_frame(fid=fid)
+			frame.set_text(text, 'latin_1')
+			id3.frames.append(frame)
+		id3.commit()
+		del id3
+
+	def tearDown(self):
+		os.unlink(self.filename)
+
+	def testClose(self):
+		f = open(self.filename, 'rb')
+		with ID3v2(self.filename) as id3:
+			self.assert_(id3.f)
+			with ID3v2(f) as shared:
+				pass
+		self.assertEqual(id3.f, None)
+		self.assert_(id3.tag_exists())
+		self.assert_(not f.closed)
+		f.close()
+
+	def testDetach(self):
+		id3 = ID3v2(self.filename, detach=True)
+		self.assertEqual(id3.f, None)
+		self.assertEqual(id3.frames[0].strings[0], 'title')
+		id3.frames[0].set_text('a longer title ' * 100, 'latin_1')
+		id3.commit()
+		self.assertEqual(id3.f, None)
+		self.assert_(id3.mp3_data_offset() > 1500)
+		self.assertEqual(ID3v2(self.filename).frames[0].strings[0],
+						 'a longer title ' * 100)
+
+	def testFrameOffsets(self):
+		id3 = ID3v2(self.filename)
+		data = open(self.filename, 'rb').read()
+		for frame in id3.frames:
+			self.assertEqual(data[frame.offset:frame.offset + 4], frame.fid)
+
+	def testIterFrames(self):
+		id3 = ID3v2(self.filename)
+		expected = [(frame.fid, frame.offset + 10, frame.length, 0)
+					for frame in id3.frames]
+		data = open(self.filename, 'rb').read()
+		self.assertEqual(list(iter_frames(data)), expected)
+		self.assertEqual(list(iter_frames(io.BytesIO(data))), expected)
+		self.assertEqual(list(iter_frames('xyz' + data, 3)),
+						 [(fid, offset + 3, size, flags)
+						  for fid, offset, size, flags in expected])
+		f = open(self.filename, 'rb')
+		self.assertEqual(list(iter_frames(f)), expected)
+		f.close()
+		self.assertEqual(list(iter_frames('\xff\xfb')), [])
+
+	def testSameSizePatch(self):
+		id3 = ID3v2(self.filename)
+		id3.frames[1].set_text('ARTIST', 'latin_1')
+		before = open(self.filename, 'rb').read()
+		id3.commit()
+		after = open(self.filename, 'rb').read()
+		self.assertEqual(len(before), len(after))
+		changed = [i for i in range(len(before)) if before[i] != after[i]]
+		start = id3.frames[1].offset
+		end = start + len(id3.frames[1].output())
+		self.assert_(changed)
+		self.assert_(min(changed) >= start and max(changed) < end)
+		del id3
+		self.assertEqual(ID3v2(self.filename).frames[1].strings[0], 'ARTIST')
+
+	def testResizedFrameRewrite(self):
+		id3 = ID3v2(self.filename)
+		id3.frames[0].set_text('a much longer title', 'latin_1')
+		id3.commit()
+		del id3
+		id3 = ID3v2(self.filename)
+		self.assertEqual(id3.frames[0].strings[0], 'a much longer title')
+		self.assertEqual(id3.frames[1].strings[0], 'artist')
+
+	def testGrowAndShrink(self):
+		audio = open(self.filename, 'rb').read()[ID3v2(self.filename).mp3_data_offset():]
+		id3 = ID3v2(self.filename)
+		id3.frames[0].set_text('x' * 10000, 'latin_1')
+		id3.commit()
+		self.assert_(id3.tag["size"] >= 10000)
+		id3.frames[0].set_text('title', 'latin_1')
+		id3.commit(shrink=True)
+		self.assert_(id3.tag["size"] < 10000)
+		del id3
+		id3 = ID3v2(self.filename)
+		self.assertEqual(id3.frames[0].strings[0], 'title')
+		data = open(self.filename, 'rb').read()
+		self.assertEqual(data[id3.mp3_data_offset():], audio)
+
+	def blockResize(self, blocksize, calls):
+		""" resize_range() done by copying, as fallocate would do it """
+		def resize_range(f, offset, delta):
+			self.assertEqual((offset % blocksize, delta % blocksize), (0, 0))
+			calls.append(delta)
+			f.flush()
+			f.seek(0)
+			data = f.read()
+			if delta > 0:
+				data = data[:offset] + '\x00' * delta + data[offset:]
+			else:
+				data = data[:offset] + data[offset - delta:]
+			f.seek(0)
+			f.write(data)
+			f.truncate(len(data))
+			f.seek(offset)
+			return True
+		return resize_range
+
+	def testBlockResize(self):
+		import tagger.id3v2
+		calls = []
+		saved = tagger.id3v2.block_size, tagger.id3v2.resize_range
+		tagger.id3v2.block_size = lambda f: 4096
+		tagger.id3v2.resize_range = self.blockResize(4096, calls)
+		try:
+			audio = ''.join([chr(i % 251) for i in range(20000)])
+			open(self.filename, 'wb').write(audio)
+
+			def check(title):
+				id3 = ID3v2(self.filename)
+				self.assertEqual(id3.frames[0].strings[0], title)
+				data = open(self.filename, 'rb').read()
+				self.assertEqual(data[id3.mp3_data_offset():], audio)
+				self.assertEqual(len(data), id3.mp3_data_offset() + len(audio))
+				id3.close()
+
+			for title, shrink, expected in (('title', False, [4096]),
+											('x' * 10000, False, [8192]),
+											('title', True, [-8192]),
+											('t', True, [])):
+				id3 = ID3v2(self.filename, version='2.3')
+				if not id3.frames:
+					id3.frames.append(id3.new_frame(fid='TIT2'))
+				size = id3.tag["size"]
+				id3.frames[0].set_text(title, 'latin_1')
+				id3.commit(shrink=shrink)
+				self.assertEqual(calls, expected)
+				if not expected:
+					# less than a block to give back is kept as padding
+					self.assertEqual(id3.tag["size"], size)
+				id3.close()
+				check(title)
+				del calls[:]
+		finally:
+			tagger.id3v2.block_size, tagger.id3v2.resize_range = saved
+
+	def testCommitToFile(self):
+		fd, copy = tempfile.mkstemp(suffix='.mp3')
+		os.close(fd)
+		try:
+			for title in ('short', 'a title too long for the padding' * 20):
+				id3 = ID3v2(self.filename)
+				id3.frames[0].set_text(title, 'latin_1')
+				id3.commit_to_file(copy)
+				new = ID3v2(copy)
+				self.assertEqual(new.frames[0].strings[0], title)
+				self.assertEqual(new.frames[1].strings[0], 'artist')
+				old = open(self.filename, 'rb').read()
+				data = open(copy, 'rb').read()
+				self.assertEqual(data[new.mp3_data_offset():],
+								 old[id3.mp3_data_offset():])
+		finally:
+			os.unlink(copy)
+
+class ID3v2FileObjectTest(unittest.TestCase):
+
+	audio = '\xff\xfb' + '\x02' * 4096
+
+	def newTag(self):
+		id3 = ID3v2.from_bytestring(self.audio, version='2.3')
+		frame = id3.new_frame(fid='TIT2')
+		frame.set_text('title', 'latin_1')
+		id3.frames.append(frame)
+		return id3
+
+	def testOutput(self):
+		id3 = self.newTag()
+		data = id3.output()
+		self.assertEqual(data[:3], 'ID3')
+		self.assertEqual(id3.f.getvalue(), self.audio)
+		self.assertEqual(ID3v2.from_bytestring(data).frames[0].strings[0],
+						 'title')
+
+	def testCommitInMemory(self):
+		id3 = self.newTag()
+		id3.commit()
+		data = id3.f.getvalue()
+		self.assertEqual(data[:3], 'ID3')
+		self.assertEqual(data[id3.mp3_data_offset():], self.audio)
+
+	def testCommitToStream(self):
+		out = io.BytesIO()
+		self.newTag().commit_to_file(out)
+		id3 = ID3v2(out)
+		self.assertEqual(id3.frames[0].strings[0], 'title')
+		self.assertEqual(out.getvalue()[id3.mp3_data_offset():], self.audio)
+
+class ID3v2RangeReaderTest(unittest.TestCase):
+
+	def makeData(self, title):
+		id3 = ID3v2.from_bytestring('\xff\xfb' + '\x03' * 20000, version='2.3')
+		frame = id3.new_frame(fid='TIT2')
+		frame.set_text(title, 'latin_1')
+		id3.frames.append(frame)
+		id3.commit()
+		return id3.f.getvalue()
+
+	def countingReader(self, data):
+		self.requests = []
+		def read_at(offset, length):
+			self.requests.append((offset, length))
+			return data[offset:offset + length]
+		return RangeReader(read_at, len(data))
+
+	def testSmallTag(self):
+		reader = self.countingReader(self.makeData('title'))
+		id3 = ID3v2(reader)
+		self.assertEqual(id3.frames[0].strings[0], 'title')
+		self.assertEqual(len(self.requests), 1)
+		self.assert_(id3.read_only)
+
+	def testLargeTag(self):
+		data = self.makeData('x' * 10000)
+		reader = self.countingReader(data)
+		id3 = ID3v2(reader)
+		self.assertEqual(id3.frames[0].strings[0], 'x' * 10000)
+		self.assertEqual(len(self.requests), 2)
+		self.assert_(reader.bytes_read < id3.mp3_data_offset() + 4096)
+
+	def testCommitToFile(self):
+		data = self.makeData('title')
+		id3 = ID3v2(self.countingReader(data))
+		id3.frames[0].set_text('other', 'latin_1')
+		out = io.BytesIO()
+		id3.commit_to_file(out)
+		new = ID3v2(out)
+		self.assertEqual(new.frames[0].strings[0], 'other')
+		self.assertEqual(out.getvalue()[new.mp3_data_offset():],
+						 data[id3.mp3_data_offset():])
+
+	def testSharedHandle(self):
+		fd, path = tempfile.mkstemp(suffix='.mp3')
+		os.write(fd, self.makeData('title'))
+		os.close(fd)
+		f = open(path, 'rb')
+		try:
+			f.seek(7)
+			reader = file_reader(f)
+			results = []
+			def parse():
+				for i in range(20):
+					reader.clear()
+					id3 = ID3v2(reader)
+					results.append(id3.frames[0].strings[0])
+			threads = [threading.Thread(target=parse) for i in range(4)]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+			self.assertEqual(results, ['title'] * 80)
+			self.assertEqual(f.tell(), 7)
+		finally:
+			f.close()
+			os.unlink(path)
+
 class ID3v2_2Crash(unittest.TestCase):
     filename = "data/pytagger-crash.mp3"
 
@@ -85,6 +365,9 @@ if __name__ == "__main__":
 	suite.addTest(unittest.makeSuite(ID3v2LoadTest2))	
 	suite.addTest(unittest.makeSuite(ID3v2LoadTest3))		
 	suite.addTest(unittest.makeSuite(ID3v2_2_FrameTest))
+	suite.addTest(unittest.makeSuite(ID3v2CommitTest))
+	suite.addTest(unittest.makeSuite(ID3v2FileObjectTest))
+	suite.addTest(unittest.makeSuite(ID3v2RangeReaderTest))
 	unittest.TextTestRunner(verbosity=2).run(suite)
 
 
@@ -0,0 +1,99 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.index import *
+from tagger.metacache import MetadataCache
+from tagger.id3v2 import *
+
+class TagIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.database = os.path.join(self.dir, 'index.db')
+		self.files = []
+		for i, (artist, title) in enumerate(((u'The Beatles', u'Abbey Road'),
+											 (u'Bj\xf6rk', u'Army of Me'),
+											 (u'Beat Happening', u'Indian Summer'))):
+			filename = os.path.join(self.dir, '%d.mp3' % i)
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			self.setTags(filename, artist, title)
+			self.files.append(filename)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def setTags(self, filename, artist, title):
+		id3 = ID3v2(filename, version='2.4')
+		id3.frames = []
+		for fid, text in (('TPE1', artist), ('TIT2', title)):
+			frame = id3.new_frame(fid=fid)
+			frame.set_text(text, 'utf_8')
+			id3.frames.append(frame)
+		frame = id3.new_frame(fid='COMM')
+		frame.encoding = 'latin_1'
+		frame.language = 'eng'
+		frame.shortcomment = ''
+		frame.longcomment = 'ripped from vinyl'
+		id3.frames.append(frame)
+		id3.commit()
+		id3.close()
+		# pretend the file was written a while ago
+		self.mtime = getattr(self, 'mtime', 1000000000) + 10
+		os.utime(filename, (self.mtime, self.mtime))
+
+	def checkSearch(self, fts):
+		index = TagIndex(self.database, fts=fts)
+		self.assertEqual(index.update_tree([self.dir]), 3)
+		name = lambda paths: [os.path.basename(p) for p in paths]
+		self.assertEqual(name(index.search('beatles')), ['0.mp3'])
+		self.assertEqual(name(index.search('beat*')), ['0.mp3', '2.mp3'])
+		self.assertEqual(name(index.search(u'artist:bj\xf6rk')), ['1.mp3'])
+		self.assertEqual(name(index.search('title:beatles')), [])
+		self.assertEqual(name(index.search('vinyl road')), ['0.mp3'])
+		self.assertRaises(ID3ParameterException, index.search, 'year:1969')
+		index.close()
+
+		self.setTags(self.files[2], u'Someone Else', u'Indian Summer')
+		os.remove(self.files[1])
+		index = TagIndex(self.database)
+		self.assertEqual(index.fts, fts is not False and index.fts)
+		self.assertEqual(index.update_tree([self.dir], prune=True), 1)
+		self.assertEqual(name(index.search('beat*')), ['0.mp3'])
+		self.assertEqual(len(index), 2)
+		index.close()
+
+	def testFTS(self):
+		self.checkSearch(None)
+
+	def testPostings(self):
+		self.checkSearch(False)
+
+	def testCache(self):
+		cache = MetadataCache(':memory:')
+		index = TagIndex(':memory:', cache=cache)
+		index.update_tree([self.dir])
+		self.assertEqual(cache.misses, 3)
+		self.assertEqual(len(index.search('summer')), 1)
+
+		self.setTags(self.files[0], u'The Beatles', u'Let It Be')
+		self.assertEqual(index.update_tree([self.dir]), 1)
+		self.assertEqual(index.search('abbey'), [])
+
+	def testCorruptFrame(self):
+		# an encoding byte no version knows about
+		data = open(self.files[1], 'rb').read()
+		offset = data.index('TPE1') + 10
+		open(self.files[1], 'wb').write(data[:offset] + '\x1e' +
+										 data[offset + 1:])
+		index = TagIndex(':memory:')
+		self.assertEqual(index.update_tree([self.dir]), 3)
+		self.assertEqual(index.search(u'bj\xf6rk'), [])
+		self.assertEqual(index.search('army'), [self.files[1]])
+		index.close()
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(TagIndexTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,82 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.metacache import *
+from tagger.id3v2 import *
+
+class MetadataCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.database = os.path.join(self.dir, 'tags.db')
+		self.files = []
+		for i in range(3):
+			filename = os.path.join(self.dir, '%d.mp3' % i)
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			self.setTitle(filename, 'title %d' % i)
+			self.files.append(filename)
+		self.broken = os.path.join(self.dir, 'broken.mp3')
+		open(self.broken, 'wb').write('ID3\x09\x00\x00\x00\x00\x00\x00')
+		os.utime(self.broken, (1000000000, 1000000000))
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def setTitle(self, filename, title):
+		id3 = ID3v2(filename, version='2.3')
+		frames = [f for f in id3.frames if f.fid == 'TIT2']
+		if frames:
+			frame = frames[0]
+		else:
+			frame = id3.new_frame(fid='TIT2')
+			id3.frames.append(frame)
+		frame.set_text(title, 'latin_1')
+		id3.commit()
+		id3.close()
+		# pretend the file was written a while ago
+		self.mtime = getattr(self, 'mtime', 1000000000) + 10
+		os.utime(filename, (self.mtime, self.mtime))
+
+	def scan(self, cache):
+		titles = []
+		for filename in self.files:
+			titles.append(cache.get(filename).get('TIT2'))
+		self.assertRaises(ID3Exception, cache.get, self.broken)
+		return titles
+
+	def testRescan(self):
+		cache = MetadataCache(self.database, batch_size=2)
+		self.assertEqual(self.scan(cache), ['title 0', 'title 1', 'title 2'])
+		self.assertEqual((cache.hits, cache.misses), (0, 4))
+		cache.close()
+
+		self.setTitle(self.files[1], 'changed')
+		cache = MetadataCache(self.database)
+		self.assertEqual(self.scan(cache), ['title 0', 'changed', 'title 2'])
+		self.assertEqual((cache.hits, cache.misses), (3, 1))
+		snapshot = cache.get(self.files[0])
+		self.assertEqual(snapshot.fids, ('TIT2',))
+		self.assertEqual(snapshot.id3v2().frames[0].strings[0], 'title 0')
+		cache.close()
+
+	def testRecentlyModified(self):
+		os.utime(self.files[0], None)
+		cache = MetadataCache(self.database)
+		self.scan(cache)
+		self.scan(cache)
+		self.assertEqual((cache.hits, cache.misses), (3, 5))
+
+	def testPrune(self):
+		cache = MetadataCache(self.database)
+		self.scan(cache)
+		self.assertEqual(cache.prune(self.files[1:]), 2)
+		cache.get(self.files[0])
+		self.assertEqual(cache.misses, 5)
+		cache.close()
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(MetadataCacheTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
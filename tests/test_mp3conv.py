@@ -0,0 +1,42 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import mp3conv
+from tagger.batch import *
+from tagger.id3v2 import *
+
+class StripIntegerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def testStrip(self):
+		filename = os.path.join(self.dir, 'strip.mp3')
+		open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+		id3 = ID3v2(filename, version='2.3')
+		for fid, text in (('TIT2', 'XXXXtitle'), ('TYER', 'XXXX2004'),
+						  ('TRCK', '5')):
+			frame = id3.new_frame(fid=fid)
+			frame.set_text(text, 'latin_1')
+			id3.frames.append(frame)
+		id3.commit()
+		id3.close()
+
+		# every text frame is stripped, not only the converted ones
+		plan = EditPlan([mp3conv.StripInteger()])
+		self.assertEqual(plan.edit(filename), (BATCH_IN_PLACE, []))
+		id3 = ID3v2(filename)
+		id3.close()
+		frames = dict([(frame.fid, frame.strings) for frame in id3.frames])
+		self.assertEqual(frames, {'TIT2': ['title'], 'TYER': ['2004'],
+								  'TRCK': ['5']})
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(StripIntegerTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,54 @@
+import unittest
+import os
+import tempfile
+
+from tagger.id3v2 import *
+from tagger.playcount import *
+
+class PlayCountTest(unittest.TestCase):
+
+	def setUp(self):
+		fd, self.filename = tempfile.mkstemp(suffix='.mp3')
+		os.write(fd, '\xff\xfb' + '\x00' * 4096)
+		os.close(fd)
+
+	def tearDown(self):
+		os.unlink(self.filename)
+
+	def addCounter(self, count):
+		id3 = ID3v2(self.filename, version='2.3')
+		frame = id3.new_frame(fid='PCNT')
+		frame.counter = count
+		id3.frames.append(frame)
+		frame = id3.new_frame(fid='POPM')
+		frame.email = 'user@example.com'
+		frame.rating = 128
+		frame.counter = count
+		id3.frames.append(frame)
+		id3.commit()
+
+	def counters(self):
+		id3 = ID3v2(self.filename)
+		return [frame.counter for frame in id3.frames]
+
+	def testNoTag(self):
+		self.assertEqual(increment_play_count(self.filename), 1)
+		self.assertEqual(self.counters(), [1])
+
+	def testInPlace(self):
+		self.addCounter(41)
+		size = os.path.getsize(self.filename)
+		self.assertEqual(increment_play_count(self.filename), 42)
+		self.assertEqual(increment_play_count(self.filename, 8), 50)
+		self.assertEqual(os.path.getsize(self.filename), size)
+		self.assertEqual(self.counters(), [50, 50])
+
+	def testWiden(self):
+		self.addCounter(0xffffffff)
+		self.assertEqual(increment_play_count(self.filename), 0x100000000)
+		self.assertEqual(self.counters(), [0x100000000, 0x100000000])
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(PlayCountTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
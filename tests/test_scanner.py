@@ -0,0 +1,83 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.scanner import *
+
+class ScannerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.files = []
+		for i in range(10):
+			subdir = os.path.join(self.dir, 'album%d' % (i % 3))
+			if not os.path.isdir(subdir):
+				os.mkdir(subdir)
+			filename = os.path.join(subdir, '%d.mp3' % i)
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			id3 = ID3v2(filename, version='2.4')
+			frame = id3.new_frame(fid='TIT2')
+			frame.set_text('title %d' % i, 'latin_1')
+			id3.frames.append(frame)
+			id3.commit()
+			id3.close()
+			self.files.append(filename)
+		open(os.path.join(self.dir, 'notes.txt'), 'wb').write('not an mp3')
+		self.broken = os.path.join(self.dir, 'broken.mp3')
+		open(self.broken, 'wb').write('ID3\x09\x00\x00\x00\x00\x00\x00')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def checkRecords(self, records):
+		records = dict([(record.path, record) for record in records])
+		self.assertEqual(sorted(records.keys()),
+						 sorted(self.files + [self.broken]))
+		self.assert_(records[self.broken].error)
+		for i, filename in enumerate(self.files):
+			record = records[filename]
+			self.assertEqual(record.error, None)
+			self.assertEqual(record.version, '2.4')
+			self.assertEqual(record.fids, ('TIT2',))
+			self.assertEqual(record.text, (('TIT2', ('title %d' % i,)),))
+			self.assertEqual(record.size, os.path.getsize(filename))
+
+	def testSerial(self):
+		self.checkRecords(scan([self.dir], jobs=1))
+
+	def testParallel(self):
+		self.checkRecords(scan([self.dir], jobs=2, chunksize=3))
+
+	def testCorruptFrame(self):
+		shutil.rmtree(self.dir)
+		os.mkdir(self.dir)
+		filename = os.path.join(self.dir, 'corrupt.mp3')
+		open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+		id3 = ID3v2(filename, version='2.4')
+		for fid in ('TIT2', 'TPE1'):
+			frame = id3.new_frame(fid=fid)
+			frame.set_text('text', 'latin_1')
+			id3.frames.append(frame)
+		id3.commit()
+		id3.close()
+		# an encoding byte no version knows about
+		data = open(filename, 'rb').read()
+		offset = data.index('TPE1') + 10
+		open(filename, 'wb').write(data[:offset] + '\x1e' + data[offset + 1:])
+
+		id3 = ID3v2(filename)
+		id3.close()
+		self.assertEqual([frame.fid for frame in id3.frames], ['TIT2'])
+		self.assertEqual(len(id3.corrupt_frames), 1)
+		self.assert_(id3.corrupt_frames[0].startswith('corrupt TPE1 frame'))
+		for jobs in (1, 2):
+			records = list(scan([self.dir], jobs=jobs))
+			self.assertEqual(len(records), 1)
+			self.assertEqual(records[0].error, None)
+			self.assertEqual(records[0].text, (('TIT2', ('text',)),))
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(ScannerTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,92 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.stats import *
+from tagger.id3v2 import *
+from tagger.walk import Sampler
+
+class TagStatsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		for i, version in enumerate(('2.3', '2.3', '2.4', None)):
+			filename = os.path.join(self.dir, '%d.mp3' % i)
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			if version:
+				id3 = ID3v2(filename, version=version)
+				frame = id3.new_frame(fid='TIT2')
+				frame.set_text('title', 'latin_1')
+				id3.frames.append(frame)
+				id3.commit()
+				id3.close()
+		self.broken = os.path.join(self.dir, 'broken.mp3')
+		open(self.broken, 'wb').write('ID3\x09\x00\x00\x00\x00\x00\x00')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def checkStats(self, stats):
+		self.assertEqual((stats.files, stats.errors), (5, 1))
+		self.assertEqual(stats.versions, {'2.3': 2, '2.4': 1, None: 1})
+		self.assertEqual(stats.frame_counts, {'TIT2': 3})
+		self.assertEqual(stats.frame_bytes, {'TIT2': 3 * 7})
+		self.assertEqual(stats.encodings, {'latin_1': 3})
+		self.assertEqual(stats.frame_sizes, {size_bucket(7): 3})
+		self.assertEqual(sum(stats.padding.values()), 3)
+		self.assertEqual(stats.error_examples[0][0], self.broken)
+
+	def testSerial(self):
+		self.checkStats(collect_stats([self.dir], jobs=1))
+
+	def testParallel(self):
+		self.checkStats(collect_stats([self.dir], jobs=2, chunksize=2))
+
+	def testMerge(self):
+		stats = TagStats()
+		for filename in sorted(os.listdir(self.dir)):
+			other = TagStats()
+			other.add_file(os.path.join(self.dir, filename))
+			stats.merge(TagStats.from_dict(other.as_dict()))
+		self.checkStats(stats)
+		self.assert_(stats.format_json())
+		self.assert_('TIT2 3 (21 bytes)' in stats.format_text())
+
+	def testEstimates(self):
+		stats = collect_stats([self.dir])
+		values = stats.estimates(population=5)
+		self.assertEqual(values['versions']['2.3'][0], 0.5)
+		mean = values['mean_tag_size']
+		self.assertEqual(mean[0], stats.tag_bytes / 4.0)
+		self.assert_(mean[1] <= mean[0] <= mean[2])
+		self.assertEqual(values['apic_share'][0], 0.0)
+		self.assert_('Mean Tag Size' in stats.format_estimates(5))
+		self.assert_('estimates' in stats.format_json(5))
+
+		sampler = Sampler(size=2, seed=1)
+		stats = collect_stats([self.dir], sampler=sampler)
+		self.assertEqual((stats.files, sampler.seen), (2, 5))
+
+	def testIntervals(self):
+		p, low, high = proportion_interval(50, 100)
+		self.assertEqual(p, 0.5)
+		self.assertAlmostEqual(low, 0.404, 3)
+		self.assertAlmostEqual(high, 0.596, 3)
+		self.assertEqual(proportion_interval(0, 0), None)
+		self.assertEqual(mean_interval(3, 6, 14), (2.0, 2.0 - 1.96 / 3 ** 0.5,
+												   2.0 + 1.96 / 3 ** 0.5))
+		# y = x / 2 exactly, so the ratio is known without error
+		self.assertEqual(ratio_interval(2, 10, 5, 68, 17, 34),
+						 (0.5, 0.5, 0.5))
+		self.assertEqual(confidence_label(), '95%')
+
+	def testBuckets(self):
+		self.assertEqual(map(size_bucket, (0, 1, 2, 3, 4, 1023, 1024)),
+						 [0, 1, 2, 2, 3, 10, 11])
+		self.assertEqual(bucket_label(11), '1024-2047')
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(TagStatsTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,68 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.stream import *
+from tagger.id3v2 import *
+
+class IterTagsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.files = {}
+		for version, title in (('2.2', 'two'), ('2.3', 'three'),
+							   ('2.4', u'f\xf6ur')):
+			filename = os.path.join(self.dir, version + '.mp3')
+			open(filename, 'wb').write('\xff\xfb' + '\x00' * 1024)
+			id3 = ID3v2(filename, version=version)
+			for fid, text in (('TIT2', title), ('TPE1', 'artist')):
+				if version == '2.2':
+					fid = {'TIT2': 'TT2', 'TPE1': 'TP1'}[fid]
+				frame = id3.new_frame(fid=fid)
+				if isinstance(text, unicode):
+					frame.set_text(text, 'utf_16')
+				else:
+					frame.set_text(text, 'latin_1')
+				id3.frames.append(frame)
+			id3.commit()
+			id3.close()
+			self.files[version] = filename
+		self.plain = os.path.join(self.dir, 'plain.mp3')
+		open(self.plain, 'wb').write('\xff\xfb' + '\x00' * 100)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def testRecords(self):
+		records = dict([(r.path, r) for r in
+						iter_tags([self.dir], fields=('TIT2', 'TT2', 'TPE1'))])
+		self.assertEqual(len(records), 4)
+
+		record = records[self.files['2.2']]
+		self.assertEqual(record.version, '2.2')
+		self.assertEqual(record.fields, (('TT2', 'two'),))
+		self.assertEqual(records[self.files['2.3']].fields,
+						 (('TIT2', 'three'), ('TPE1', 'artist')))
+		self.assertEqual(records[self.files['2.4']].get('TIT2'), u'f\xf6ur')
+
+		for version, filename in self.files.items():
+			id3 = ID3v2(filename)
+			record = records[filename]
+			self.assertEqual(record.tag_size, id3.mp3_data_offset())
+			self.assertEqual(record.padding, id3.tag["padding"])
+			self.assertEqual(record.file_size, os.path.getsize(filename))
+			id3.close()
+
+		record = records[self.plain]
+		self.assertEqual((record.version, record.tag_size, record.error),
+						 (None, 0, None))
+
+	def testError(self):
+		record = read_record(os.path.join(self.dir, 'missing.mp3'))
+		self.assert_(record.error)
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(IterTagsTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,67 @@
+import unittest
+import os
+import tempfile
+
+from tagger.tags import *
+
+class TagsCommitTest(unittest.TestCase):
+
+	audio = '\xff\xfb' + ''.join([chr(i % 251) for i in range(20000)])
+
+	def setUp(self):
+		fd, self.filename = tempfile.mkstemp(suffix='.mp3')
+		os.write(fd, self.audio)
+		os.close(fd)
+
+	def tearDown(self):
+		os.unlink(self.filename)
+
+	def setTitle(self, tags, title):
+		tags.id3v1.songname = title
+		frames = [f for f in tags.id3v2.frames if f.fid == 'TIT2']
+		if frames:
+			frame = frames[0]
+		else:
+			frame = tags.id3v2.new_frame(fid='TIT2')
+			tags.id3v2.frames.append(frame)
+		frame.set_text(title, 'latin_1')
+
+	def checkFile(self, title):
+		tags = Tags(self.filename)
+		self.assert_(tags.id3v2.tag_exists())
+		self.assert_(tags.id3v1.tag_exists())
+		self.assertEqual(tags.id3v1.songname, title[:30])
+		self.assertEqual(tags.id3v2.frames[0].strings[0], title)
+		data = open(self.filename, 'rb').read()
+		start = tags.id3v2.mp3_data_offset()
+		self.assertEqual(data[start:-ID3V1_TAG_LENGTH], self.audio)
+
+	def testCreate(self):
+		tags = Tags(self.filename, version='2.3')
+		self.setTitle(tags, 'first')
+		tags.commit()
+		del tags
+		self.checkFile('first')
+
+	def testGrow(self):
+		tags = Tags(self.filename, version='2.3')
+		self.setTitle(tags, 'first')
+		tags.commit()
+		del tags
+		tags = Tags(self.filename)
+		self.setTitle(tags, 'x' * 1000)
+		tags.commit()
+		del tags
+		self.checkFile('x' * 1000)
+
+	def testPretend(self):
+		tags = Tags(self.filename)
+		self.setTitle(tags, 'first')
+		tags.commit(pretend=True)
+		del tags
+		self.assertEqual(open(self.filename, 'rb').read(), self.audio)
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(TagsCommitTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)
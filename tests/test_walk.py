@@ -0,0 +1,73 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from tagger.walk import *
+
+class WalkTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		for name in ('a', 'a/b', 'c'):
+			os.mkdir(os.path.join(self.dir, name))
+		self.files = []
+		for name in ('1.mp3', 'a/2.mp3', 'a/b/3.mp3', 'c/4.mp3'):
+			filename = os.path.join(self.dir, name)
+			open(filename, 'wb').write(name)
+			self.files.append(filename)
+		open(os.path.join(self.dir, 'a/notes.txt'), 'wb').write('text')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def testWalk(self):
+		self.assertEqual(sorted(walk_files([self.dir])), sorted(self.files))
+		self.assertEqual(list(walk_files([self.files[0]])), [self.files[0]])
+
+	def testDuplicates(self):
+		os.link(self.files[1], os.path.join(self.dir, 'c/linked.mp3'))
+		os.symlink(self.dir, os.path.join(self.dir, 'a/b/loop'))
+		os.symlink(os.path.join(self.dir, 'a'), os.path.join(self.dir, 'c/a'))
+		os.symlink('missing.mp3', os.path.join(self.dir, 'c/dangling.mp3'))
+		found = list(walk_files([self.dir, self.dir]))
+		self.assertEqual(len(found), len(self.files) + 1)
+		self.assertEqual(len(set(map(os.path.basename, found))), 5)
+		found = list(walk_files([self.dir, self.files[0]], unique_files=True))
+		self.assertEqual(len(found), len(self.files))
+		self.assertEqual(len(set(map(os.path.basename, found))), 4)
+
+	def testErrors(self):
+		missing = os.path.join(self.dir, 'missing')
+		self.assertEqual(list(walk_files([missing, self.files[0]])),
+						 [self.files[0]])
+		errors = []
+		found = list(walk_files([missing, self.dir], onerror=errors.append))
+		self.assertEqual(sorted(found), sorted(self.files))
+		self.assertEqual([e.filename for e in errors], [missing])
+
+	def testInodeOrder(self):
+		found = list(walk_files([self.dir], sort_inodes=True))
+		inodes = [os.stat(filename).st_ino for filename in found]
+		self.assertEqual(inodes, sorted(inodes))
+		self.assertEqual(sorted(found), sorted(self.files))
+
+	def testSampler(self):
+		sampler = Sampler(rate=1.0)
+		self.assertEqual(sorted(sampler.sample(walk_files([self.dir]))),
+						 sorted(self.files))
+		picks = [list(Sampler(size=2, seed=1).sample(self.files))
+				 for i in range(2)]
+		self.assertEqual(picks[0], picks[1])
+		self.assertEqual(len(picks[0]), 2)
+		sampler = Sampler(rate=0.5, seed=1)
+		found = list(sampler.sample(range(1000)))
+		self.assertEqual((sampler.seen, sampler.taken), (1000, len(found)))
+		self.assert_(400 < len(found) < 600)
+		self.assertRaises(ValueError, Sampler)
+		self.assertRaises(ValueError, Sampler, rate=2)
+
+if __name__ == "__main__":
+	suite = unittest.TestSuite()
+	suite.addTest(unittest.makeSuite(WalkTest))
+	unittest.TextTestRunner(verbosity=2).run(suite)